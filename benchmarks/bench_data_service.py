@@ -0,0 +1,224 @@
+"""
+benchmark suite of the data_service functions and the models, over synthetic api
+responses of realistic and extreme sizes. reports the time and the memory
+allocated (peak, traced by tracemalloc) per call, and compares them with saved
+baselines: a case slower or allocating more than `threshold` over its baseline
+fails the run (exit status 1). baselines depend on the machine and python
+version, save them where the suite is checked
+
+usage: python -m benchmarks.bench_data_service [--save] [--threshold 0.25] [--only name]
+"""
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from timeit import Timer
+from types import SimpleNamespace
+
+from benchmarks.bench_models import make_departures, make_journeys
+from flask_server.services.data_service import (
+    UTC_FORMAT, date_parser, departure_info_generator, departures_by_location,
+    get_stop_info, parse_utc_timestamp, status_info_generator,
+    stop_information_generator, trip_journeys_generator
+)
+
+BASELINES = Path(__file__).with_name('baselines.json')
+CONCESSIONS = ('ADULT', 'CHILD', 'SENIOR', 'STUDENT')
+
+
+def with_fares(journeys: list) -> list:
+    """
+    journeys with a ticket of each concession type per leg, like trip responses
+    """
+    for journey in journeys:
+        journey.fare = SimpleNamespace(tickets=[
+            SimpleNamespace(
+                person=person, properties=SimpleNamespace(price_total_fare=f'{2.5 + leg:.2f}')
+            ) for leg in range(len(journey.legs)) for person in CONCESSIONS
+        ])
+    return journeys
+
+
+def make_locations(count: int) -> list:
+    """
+    stop finder locations over a few suburbs and modes
+    """
+    return [
+        SimpleNamespace(
+            id=str(200000 + number), name=f'Stop {number}, Suburb{number % 20}',
+            coord=[-33.8 - number * 0.001, 151.2], modes=[1, 5] if number % 3 else [5]
+        ) for number in range(count)
+    ]
+
+
+def make_statuses(count: int) -> list:
+    """
+    additional info messages valid for a week
+    """
+    start = datetime(2019, 10, 1, 8, 0, tzinfo=timezone.utc)
+    return [
+        SimpleNamespace(
+            subtitle=f'Trackwork {number}', content='<p>' + 'Buses replace trains. ' * 20 + '</p>',
+            priority='normal', timestamps=SimpleNamespace(
+                creation=(start + timedelta(hours=number)).strftime(UTC_FORMAT),
+                validity=[SimpleNamespace(to=(start + timedelta(days=7)).strftime(UTC_FORMAT))]
+            )
+        ) for number in range(count)
+    ]
+
+
+def make_timestamps(count: int) -> list:
+    """
+    distinct api timestamps a minute apart
+    """
+    start = datetime(2019, 10, 1, 8, 0, tzinfo=timezone.utc)
+    return [(start + timedelta(minutes=minute)).strftime(UTC_FORMAT) for minute in range(count)]
+
+
+def _cold_dates(timestamps):
+    parse_utc_timestamp.cache_clear()
+    return [date_parser(timestamp) for timestamp in timestamps]
+
+
+def _grouped(response):
+    return [(location, list(departures)) for location, departures in departures_by_location(response)]
+
+
+def cases() -> dict:
+    """
+    name: (function, argument) of every case, the argument is built once
+    """
+    journeys = with_fares(make_journeys(5, 4, 30))
+    long_journeys = with_fares(make_journeys(10, 12, 80))
+    return {
+        'date_parser.cold.500': (_cold_dates, make_timestamps(500)),
+        'date_parser.warm.500': (
+            lambda timestamps: [date_parser(timestamp) for timestamp in timestamps],
+            make_timestamps(500)
+        ),
+        'get_stop_info.4x30': (
+            lambda journey: get_stop_info(journey.legs, {}), journeys[0]
+        ),
+        'get_stop_info.12x80': (
+            lambda journey: get_stop_info(journey.legs, {}), long_journeys[0]
+        ),
+        'trip_journeys_generator.5x4x30': (
+            lambda response: list(trip_journeys_generator(response, 'ADULT')), journeys
+        ),
+        'trip_journeys_generator.10x12x80': (
+            lambda response: list(trip_journeys_generator(response, 'ADULT')), long_journeys
+        ),
+        'departure_info_generator.40': (
+            lambda response: list(departure_info_generator(response)), make_departures(40)
+        ),
+        'departure_info_generator.800': (
+            lambda response: list(departure_info_generator(response)), make_departures(800)
+        ),
+        'departures_by_location.800': (_grouped, make_departures(800)),
+        'stop_information_generator.50': (
+            lambda locations: list(stop_information_generator(locations, [1], 'suburb3', True)),
+            make_locations(50)
+        ),
+        'stop_information_generator.2000': (
+            lambda locations: list(stop_information_generator(locations, [1], 'suburb3', True)),
+            make_locations(2000)
+        ),
+        'status_info_generator.10': (
+            lambda messages: list(status_info_generator(messages)), make_statuses(10)
+        ),
+        'status_info_generator.200': (
+            lambda messages: list(status_info_generator(messages)), make_statuses(200)
+        ),
+        'to_dict.journeys.10x12x80': (
+            lambda models: [model.to_dict() for model in models],
+            list(trip_journeys_generator(long_journeys, 'ADULT'))
+        ),
+        'to_dict.departures.800': (
+            lambda models: [model.to_dict() for model in models],
+            list(departure_info_generator(make_departures(800)))
+        ),
+    }
+
+
+def measure(function, argument, repeat=5) -> dict:
+    """
+    best time per call in microseconds (over `repeat` runs of at least 0.2 seconds)
+    and the peak bytes allocated by a call
+    """
+    function(argument)  # warm up the caches later calls find warm too
+    timer = Timer(lambda: function(argument))
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat, number)) / number
+    gc.collect()
+    tracemalloc.start()
+    result = function(argument)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {'time_us': round(best * 1e6, 2), 'peak_bytes': peak}
+
+
+def compare(results: dict, baselines: dict, threshold: float) -> list:
+    """
+    descriptions, starting with the case name, of the cases slower or allocating more than `threshold` over their baseline
+    """
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+        for metric in ('time_us', 'peak_bytes'):
+            if result[metric] > baseline[metric] * (1 + threshold):
+                regressions.append(
+                    f'{name} {metric} {result[metric]} > {baseline[metric]} (+{threshold:.0%})'
+                )
+    return regressions
+
+
+def main(argv=None) -> int:
+    """
+    run the suite, print each case against its baseline, returns the exit status
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--save', action='store_true', help='save the results as baselines')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='regression allowed over a baseline, as a share (default 0.25)')
+    parser.add_argument('--only', default='', help='only run cases whose name contains this')
+    parser.add_argument('--baselines', type=Path, default=BASELINES, help='baselines file')
+    args = parser.parse_args(argv)
+
+    baselines = json.loads(args.baselines.read_text()) if args.baselines.is_file() else {}
+    results = {}
+    for name, (function, argument) in cases().items():
+        if args.only not in name:
+            continue
+        results[name] = result = measure(function, argument)
+        baseline = baselines.get(name)
+        change = (
+            f'  x{result["time_us"] / baseline["time_us"]:5.2f} time'
+            f'  x{result["peak_bytes"] / max(baseline["peak_bytes"], 1):5.2f} memory'
+        ) if baseline else ''
+        print(f'{name:<36} {result["time_us"]:11.2f} us {result["peak_bytes"] / 1024:9.1f} KiB{change}')
+
+    if args.save:
+        args.baselines.write_text(json.dumps(dict(baselines, **results), indent=2, sort_keys=True))
+        print(f'saved baselines to {args.baselines}')
+        return 0
+    regressions = compare(results, baselines, args.threshold)
+    if regressions:
+        # measure the regressed cases again, so a noisy run alone does not fail
+        suite = cases()
+        for name in {regression.split(' ', 1)[0] for regression in regressions}:
+            again = measure(*suite[name])
+            results[name] = {metric: min(results[name][metric], again[metric]) for metric in again}
+        regressions = compare(results, baselines, args.threshold)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+micro-benchmark for `data_service.date_parser`,
+compares the previous strptime / `tz.gettz` per call parser with the
+cached fast path and the batch api
+
+usage: python -m benchmarks.bench_date_parser [number of timestamps]
+"""
+import sys
+from datetime import datetime, timedelta, timezone
+from timeit import timeit
+
+from dateutil import tz
+
+from flask_server.services.data_service import (
+    date_parser, date_parser_batch, parse_utc_timestamp
+)
+
+
+def legacy_date_parser(departure_time, time_format="%Y-%m-%dT%H:%M:%SZ"):
+    """
+    date_parser as it was before the fast path, for comparison
+    """
+    from_zone = tz.gettz('UTC')
+    to_zone = tz.gettz('Australia/Sydney')
+    return datetime.strptime(
+        departure_time, time_format
+    ).replace(tzinfo=from_zone).astimezone(to_zone)
+
+
+def make_timestamps(count: int) -> list:
+    """
+    api style timestamps one minute apart, each repeated like the stops
+    shared between the journeys of a trip request
+    """
+    start = datetime(2019, 10, 1, 8, 0, tzinfo=timezone.utc)
+    unique = [
+        (start + timedelta(minutes=minute)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        for minute in range(count // 5 or 1)
+    ]
+    return (unique * 5)[:count]
+
+
+def main(count=500, repeat=20):
+    """
+    print time per call of each parser over `count` timestamps
+    """
+    timestamps = make_timestamps(count)
+    assert [legacy_date_parser(ts) for ts in timestamps] == date_parser_batch(timestamps)
+
+    def cold():
+        parse_utc_timestamp.cache_clear()
+        date_parser_batch(timestamps)
+
+    results = {
+        'legacy strptime + gettz': timeit(
+            lambda: [legacy_date_parser(ts) for ts in timestamps], number=repeat
+        ),
+        'date_parser (memoised)': timeit(
+            lambda: [date_parser(ts) for ts in timestamps], number=repeat
+        ),
+        'date_parser_batch (cold cache)': timeit(cold, number=repeat),
+        'date_parser_batch (memoised)': timeit(
+            lambda: date_parser_batch(timestamps), number=repeat
+        ),
+    }
+    legacy = results['legacy strptime + gettz']
+    for name, elapsed in results.items():
+        per_call = elapsed / (repeat * count) * 1e6
+        print(f'{name:<32} {per_call:8.2f} us/timestamp  x{legacy / elapsed:6.1f}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:2]))
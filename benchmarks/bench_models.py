@@ -0,0 +1,191 @@
+"""
+memory benchmark of the TripJourney / DepartureInfo models, measures the bytes
+each parsed journey keeps alive once the api response is released, for the
+previous dict backed models (no sharing) and the slotted, interned ones
+
+usage: python -m benchmarks.bench_models [journeys] [legs] [stops per leg]
+"""
+import gc
+import sys
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from flask_server.services.data_service import (
+    UTC_FORMAT, build_trip_journey, create_date_and_time, date_parser,
+    departure_info_generator, get_stop_info
+)
+
+
+class LegacyTripJourney:
+    """
+    TripJourney as it was before __slots__, for comparison
+    """
+    def __init__(self, *args):
+        (
+            total_fare, total_duration,
+            depart_day, depart_time,
+            arrive_day, arrive_time, stops, coords,
+            origin, destination
+        ) = args
+        self.total_fare = total_fare
+        self.total_duration = total_duration
+        self.departure = depart_day, depart_time
+        self.arrival = arrive_day, arrive_time
+        self.stops = stops
+        self.coords = coords
+        self.origin = origin
+        self.destination = destination
+
+
+class LegacyDepartureInfo:
+    """
+    DepartureInfo as it was before __slots__, for comparison
+    """
+    def __init__(self, *props):
+        hours, minutes, seconds, route, dest, location, _id = props
+        self.time_to_arrive = hours, minutes, seconds
+        self.route = route
+        self.dest = dest
+        self.stop_id = _id
+        self.location = location
+
+
+def legacy_build_trip_journey(journey, total_fare):
+    """
+    build_trip_journey as it was before sharing names and coordinates
+    """
+    total_duration = round(sum(leg.duration for leg in journey.legs) / 60, 2)
+    depart = date_parser(journey.legs[0].origin.departure_time_estimated)
+    arrive = date_parser(journey.legs[-1].destination.arrival_time_estimated)
+    stops, coords = {}, []
+    for leg in journey.legs:
+        type_ = leg.transportation.name or 'Walking'
+        stops[type_] = []
+        for sequence in leg.stop_sequence:
+            time = date_parser(sequence.departure_time_planned).strftime('%H:%M')
+            coords.append(list(sequence.coord))
+            stops[type_].append((sequence.name, time))
+    return LegacyTripJourney(
+        total_fare, total_duration,
+        *create_date_and_time(depart, '%A,  %d-%m-%Y', '%H:%M%Z'),
+        *create_date_and_time(arrive, '%A,  %d-%m-%Y', '%H:%M%Z'),
+        stops, coords, journey.legs[0].origin.name, journey.legs[-1].destination.name
+    )
+
+
+def _text(text: str) -> str:
+    """
+    a new string object, like every string decoded from a json response
+    """
+    return ''.join(list(text))
+
+
+def make_journeys(count: int, legs: int, stops: int) -> list:
+    """
+    api style journeys travelling the same line of stops a few minutes apart,
+    each with its own copies of the names and coordinates like a parsed response
+    """
+    start = datetime(2019, 10, 1, 8, 0, tzinfo=timezone.utc)
+    journeys = []
+    for number in range(count):
+        departs = start + timedelta(minutes=5 * number)
+        journey_legs = []
+        for leg in range(legs):
+            sequence = []
+            for stop in range(stops):
+                time = (departs + timedelta(minutes=2 * (leg * stops + stop))).strftime(UTC_FORMAT)
+                sequence.append(SimpleNamespace(
+                    name=_text(f'Stop {leg}-{stop}, Some Long Suburb Name'),
+                    coord=[-33.8 - leg * 0.01 - stop * 0.001, 151.2 + stop * 0.001],
+                    departure_time_planned=time, departure_time_estimated=None,
+                    arrival_time_planned=time, arrival_time_estimated=None
+                ))
+            journey_legs.append(SimpleNamespace(
+                duration=2 * 60 * stops,
+                transportation=SimpleNamespace(name=_text(f'Sydney Trains Network T{leg}')),
+                origin=SimpleNamespace(
+                    name=sequence[0].name, departure_time_estimated=sequence[0].departure_time_planned
+                ),
+                destination=SimpleNamespace(
+                    name=sequence[-1].name, arrival_time_estimated=sequence[-1].arrival_time_planned
+                ),
+                stop_sequence=sequence
+            ))
+        journeys.append(SimpleNamespace(legs=journey_legs))
+    return journeys
+
+
+def make_departures(count: int) -> SimpleNamespace:
+    """
+    departure monitor response of `count` events over a few platforms and routes
+    """
+    start = datetime(2019, 10, 1, 8, 0, tzinfo=timezone.utc)
+    return SimpleNamespace(stop_events=[
+        SimpleNamespace(
+            departure_time_planned=(start + timedelta(minutes=event)).strftime(UTC_FORMAT),
+            transportation=SimpleNamespace(
+                number=_text(f'T{event % 8}'),
+                destination=SimpleNamespace(name=_text(f'Destination {event % 8}'))
+            ),
+            location=SimpleNamespace(
+                name=_text(f'Central Station, Platform {event % 4}'), id=_text(f'20000{event % 4}')
+            )
+        ) for event in range(count)
+    ])
+
+
+def retained_bytes(make_response, build) -> int:
+    """
+    bytes still allocated by the models built from a response, once the response is released
+    """
+    gc.collect()
+    tracemalloc.start()
+    response = make_response()
+    models = build(response)
+    del response
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del models
+    return retained
+
+
+def main(journeys=5, legs=4, stops=30, departures=400):
+    """
+    print bytes per journey / departure for the legacy and current models
+    """
+    # warm the parser and interning caches so they are not counted
+    date_parser(make_journeys(1, 1, 1)[0].legs[0].origin.departure_time_estimated)
+    get_stop_info(make_journeys(1, 1, 1)[0].legs)
+
+    def current_journeys(response):
+        interned = {}
+        return [build_trip_journey(journey, 0.0, interned) for journey in response]
+
+    def legacy_departures(response):
+        # the legacy generator kept each event's own copy of the names
+        return [
+            LegacyDepartureInfo(
+                *departure.time_to_arrive, _text(departure.route), _text(departure.dest),
+                _text(departure.location), _text(departure.stop_id)
+            ) for departure in departure_info_generator(response)
+        ]
+
+    results = (
+        ('journey', journeys, lambda: make_journeys(journeys, legs, stops),
+         lambda response: [legacy_build_trip_journey(journey, 0.0) for journey in response],
+         current_journeys),
+        ('departure', departures, lambda: make_departures(departures),
+         legacy_departures, lambda response: list(departure_info_generator(response))),
+    )
+    print(f'{journeys} journeys of {legs} legs x {stops} stops, {departures} departures')
+    for name, count, make_response, legacy, current in results:
+        before = retained_bytes(make_response, legacy) / count
+        after = retained_bytes(make_response, current) / count
+        print(f'{name:<10} legacy {before:9.0f} B  slotted + interned {after:9.0f} B'
+              f'  x{before / after:5.2f}')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:4]))
@@ -0,0 +1,79 @@
+"""
+benchmark of journey planning over an imported timetable, routes random
+station pairs of a synthetic grid network (see `synthetic_gtfs`), and checks
+that arrive-by plans end with the latest departure arriving by the deadline
+(exit status 1 otherwise)
+
+usage: python -m benchmarks.bench_raptor [grid size] [queries]
+"""
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic_gtfs import station_id, write_feed
+from flask_server.timetable.gtfs_import import import_feed
+from flask_server.timetable.raptor import Raptor
+from flask_server.timetable.store import Timetable
+
+DATE = 20191001
+
+
+def main(size=30, queries=200, seed=1):
+    """
+    print import time, queries per second of single routes and of 5 journey plans
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        feed, out = Path(directory) / 'feed.zip', Path(directory) / 'timetable'
+        write_feed(feed, size=size, trips=60)
+        started = time.perf_counter()
+        counts = import_feed(feed, out)['counts']
+        print(f'imported {counts["stops"]} stops, {counts["stop_times"]} stop times'
+              f' in {time.perf_counter() - started:.1f}s')
+        timetable = Timetable(out)
+        planner = Raptor(timetable)
+        generator = random.Random(seed)
+        pairs = []
+        for _ in range(queries):
+            origin, destination = (
+                timetable.stop_index(station_id(generator.randrange(size), generator.randrange(size)))
+                for _ in range(2)
+            )
+            pairs.append((
+                [origin] + timetable.children(origin),
+                [destination] + timetable.children(destination),
+                generator.randrange(6 * 3600, 18 * 3600)
+            ))
+        for name, plan in (
+                ('route', lambda pair: planner.route(*pair, DATE)),
+                ('plan (5 journeys)', lambda pair: planner.plan(*pair, DATE, count=5)),
+        ):
+            started = time.perf_counter()
+            found = sum(bool(plan(pair)) for pair in pairs)
+            elapsed = time.perf_counter() - started
+            print(f'{name:<20} {queries / elapsed:8.1f} queries/s'
+                  f' {elapsed / queries * 1e3:8.2f} ms/query  {found}/{queries} found')
+        wrong = [pair for pair in pairs if not arrives_latest(planner, *pair)]
+        print(f'arrive-by plans leaving latest: {queries - len(wrong)}/{queries}')
+        timetable.close()
+    if wrong:
+        sys.exit(1)
+
+
+def arrives_latest(planner: Raptor, sources: list, targets: list, deadline: int) -> bool:
+    """
+    whether the arrive-by plan arrives by `deadline` and no journey leaving after
+    its last one does
+    """
+    journeys = planner.plan(sources, targets, deadline, DATE, count=5, arrive_by=True)
+    if not journeys:
+        return True
+    if any(journey[-1].arrives > deadline for journey in journeys):
+        return False
+    later = planner.route(sources, targets, journeys[-1][0].departs + 1, DATE)
+    return all(journey[-1].arrives > deadline for journey in later)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,95 @@
+"""
+startup benchmark of the app: each run starts a fresh interpreter and times
+importing `flask_server`, `create_app()`, the first request of the home page
+(templates compiled) and a second one, and building the first swagger instance
+(the swagger client is imported on first use), and counts the swagger_client
+modules loaded once the app is created. the slowest imports of
+a run are listed from `python -X importtime`
+
+usage: python -m benchmarks.bench_startup [runs]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from statistics import median
+
+RUN = '''
+import json, sys, time
+started = time.perf_counter()
+from flask_server import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+swagger_modules = sum(name.startswith('swagger_client') for name in sys.modules)
+modules = len(sys.modules)
+client = app.test_client()
+client.get('/')
+first = time.perf_counter()
+client.get('/')
+second = time.perf_counter()
+app.extensions['swagger_pool'].acquire()
+swagger = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (first - created) * 1000, 'second_request_ms': (second - first) * 1000,
+    'first_swagger_instance_ms': (swagger - second) * 1000,
+    'swagger_modules_at_boot': swagger_modules, 'modules_at_boot': modules,
+}))
+'''
+
+
+def _environment(directory: str) -> dict:
+    environment = dict(os.environ, TRIP_PLANNER_API_KEY=os.environ.get('TRIP_PLANNER_API_KEY', 'benchmark'))
+    # the project root first, keeping any other entries (eg. a swagger_client checkout)
+    environment['PYTHONPATH'] = os.pathsep.join(
+        [os.getcwd()] + [path for path in [os.environ.get('PYTHONPATH')] if path]
+    )
+    environment.setdefault('TEMPLATE_CACHE_DIR', os.path.join(directory, 'templates'))
+    return environment
+
+
+def run_once(directory: str, *options) -> str:
+    """
+    output of the startup script in a fresh interpreter, within `directory`
+    """
+    return subprocess.run(
+        [sys.executable, *options, '-c', RUN], cwd=directory, env=_environment(directory),
+        check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+    )
+
+
+def slowest_imports(stderr: str, count=10) -> list:
+    """
+    (cumulative microseconds, module) of the slowest imports in `-X importtime` output
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, module = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                imports.append((int(cumulative), module.rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main():
+    """
+    run the benchmark
+    """
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(runs):
+            results.append(json.loads(run_once(directory).stdout.splitlines()[-1]))
+        profile = run_once(directory, '-X', 'importtime')
+    print(f'median of {runs} fresh processes (templates bytecode cached after the first)')
+    for name in results[0]:
+        print(f'  {name:<26}{median(result[name] for result in results):10.1f}')
+    print('slowest imports (cumulative ms)')
+    for cumulative, module in slowest_imports(profile.stderr):
+        print(f'  {cumulative / 1000:8.1f}  {module}')
+
+
+if __name__ == '__main__':
+    main()
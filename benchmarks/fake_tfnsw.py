@@ -0,0 +1,270 @@
+"""
+local stand-in for the TfNSW trip planner api, for load tests: answers the
+stop_finder, departure_mon, trip and add_info endpoints with synthetic responses
+(or responses recorded into `<endpoint>.json` files of a directory, a json list
+being replayed in turn) after a latency drawn from a distribution, failing a
+share of the calls with a 503.
+
+point the app at it with `TRIP_PLANNER_HOST=http://127.0.0.1:8765/v1/tp`
+
+latencies are `fixed:seconds`, `uniform:low,high`, `lognormal:median,sigma` or
+`pareto:minimum,alpha`, for every endpoint or one of them eg. `trip=lognormal:0.4,0.6`
+
+usage: python -m benchmarks.fake_tfnsw [--port 8765] [--latency lognormal:0.15,0.5]
+    [--latency trip=lognormal:0.4,0.6] [--error-rate 0.01] [--recorded directory]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from urllib.parse import parse_qs, urlsplit
+
+ENDPOINTS = ('stop_finder', 'departure_mon', 'trip', 'add_info')
+BASE_PATH = '/v1/tp/'
+UTC_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def parse_latency(spec: str):
+    """
+    function drawing a latency in seconds from a `kind:arguments` spec
+    """
+    kind, _, arguments = spec.partition(':')
+    values = [float(value) for value in arguments.split(',') if value]
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    if kind == 'pareto':
+        return lambda: values[0] * random.paretovariate(values[1])
+    raise ValueError(f'unknown latency distribution {spec}')
+
+
+def _time(minutes: float) -> str:
+    return (datetime.now(timezone.utc) + timedelta(minutes=minutes)).strftime(UTC_FORMAT)
+
+
+def stop_finder(params: dict) -> dict:
+    """
+    stops matching `name_sf`, a few platforms of a few stations
+    """
+    name = params.get('name_sf', 'Central').title()
+    seed = sum(map(ord, name)) % 1000
+    return {'version': 'fake', 'locations': [
+        {
+            'id': f'2{seed:03d}{station}{platform}', 'name': f'{name} {station}, Platform {platform}',
+            'disassembledName': f'Platform {platform}', 'type': 'stop',
+            'coord': [-33.88 - station / 100, 151.2 + platform / 1000],
+            'parent': {'id': f'2{seed:03d}{station}', 'name': f'{name} {station}', 'type': 'locality'},
+            'modes': [1, 5] if platform % 2 else [5], 'matchQuality': 1000 - station, 'isBest': not station,
+        } for station in range(3) for platform in range(1, 5)
+    ]}
+
+
+def departure_mon(params: dict) -> dict:
+    """
+    the next 40 departures of stop `name_dm` over 4 platforms
+    """
+    stop = params.get('name_dm', '200060')
+    return {'version': 'fake', 'locations': [{'id': stop, 'name': f'Stop {stop}', 'type': 'stop'}],
+            'stopEvents': [
+                {
+                    'location': {
+                        'id': f'{stop}{event % 4}', 'name': f'Stop {stop}, Platform {event % 4 + 1}',
+                        'type': 'platform', 'coord': [-33.88, 151.2],
+                    },
+                    'departureTimePlanned': _time(event * 2),
+                    'departureTimeEstimated': _time(event * 2 + event % 3),
+                    'transportation': {
+                        'id': f'route-{event % 6}', 'name': f'Line T{event % 6}', 'number': f'T{event % 6}',
+                        'product': {'class': 1, 'name': 'Sydney Trains Network'},
+                        'destination': {'id': f'21{event % 7}', 'name': f'Destination {event % 7}'},
+                    },
+                } for event in range(40)
+            ]}
+
+
+def trip(params: dict) -> dict:
+    """
+    5 journeys of 3 legs (the middle one walking) of 12 stops each,
+    from `name_origin` to `name_destination`
+    """
+    origin = params.get('name_origin', '200060')
+    destination = params.get('name_destination', '200070')
+    people = ('ADULT', 'CHILD', 'SENIOR', 'SCHOLAR')
+
+    def leg(journey, number):
+        start = journey * 10 + number * 15
+        return {
+            'duration': 900,
+            'origin': {'id': origin, 'name': f'Stop {origin}', 'departureTimePlanned': _time(start),
+                       'departureTimeEstimated': _time(start + 1)},
+            'destination': {'id': destination, 'name': f'Stop {destination}',
+                            'arrivalTimePlanned': _time(start + 15), 'arrivalTimeEstimated': _time(start + 16)},
+            'transportation': {'name': None} if number == 1 else {
+                'id': f'route-{number}', 'name': f'Line T{number}', 'number': f'T{number}'
+            },
+            'stopSequence': [
+                {'id': f'2{number}{stop:04d}', 'name': f'Stop {number}-{stop}',
+                 'coord': [-33.88 + stop / 200, 151.2 + number / 100],
+                 'departureTimePlanned': _time(start + stop)} for stop in range(12)
+            ],
+        }
+    return {'version': 'fake', 'journeys': [
+        {
+            'legs': [leg(journey, number) for number in range(3)],
+            'fare': {'tickets': [
+                {'person': person, 'properties': {'priceTotalFare': f'{2.4 + number:.2f}'}}
+                for number in (0, 2) for person in people
+            ]},
+        } for journey in range(5)
+    ]}
+
+
+def add_info(params: dict) -> dict:
+    """
+    a couple of current trackwork messages
+    """
+    return {'version': 'fake', 'infos': {'current': [
+        {
+            'id': f'info-{number}', 'subtitle': f'Trackwork {number}', 'priority': 'normal',
+            'content': '<p>Buses replace trains between Central and Strathfield.</p>',
+            'timestamps': {
+                'creation': _time(-60 * (number + 1)),
+                'validity': [{'from': _time(-60), 'to': _time(60 * 24)}],
+            },
+        } for number in range(2)
+    ], 'historic': []}}
+
+
+class Recorded:
+    """
+    responses recorded into `<endpoint>.json` files, a list of responses is replayed in turn
+    """
+    def __init__(self, directory: str):
+        self.responses = {}
+        self._turns = {}
+        for endpoint in ENDPOINTS:
+            path = os.path.join(directory, f'{endpoint}.json')
+            if os.path.isfile(path):
+                with open(path) as file:
+                    recorded = json.load(file)
+                self.responses[endpoint] = recorded if isinstance(recorded, list) else [recorded]
+                self._turns[endpoint] = count()
+
+    def get(self, endpoint: str):
+        """
+        the next recorded response of an endpoint, None when none was recorded
+        """
+        responses = self.responses.get(endpoint)
+        if not responses:
+            return None
+        return responses[next(self._turns[endpoint]) % len(responses)]
+
+
+class FakeApi:
+    """
+    responses, latencies and errors of the fake api
+        :var latencies: dict -> endpoint: function drawing a latency in seconds
+        :var error_rate: float -> share of the calls answered with a 503
+        :var calls / errors: int -> calls answered and failed
+    """
+    def __init__(self, latencies: dict, error_rate=0.0, recorded=None):
+        self.latencies = latencies
+        self.error_rate = error_rate
+        self.recorded = recorded
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def answer(self, endpoint: str, params: dict) -> (int, bytes):
+        """
+        status and json body of a call, after its latency
+        """
+        time.sleep(self.latencies[endpoint]())
+        failed = random.random() < self.error_rate
+        with self._lock:
+            self.calls += 1
+            self.errors += failed
+        if failed:
+            return 503, b'{"error": "fake outage"}'
+        body = self.recorded.get(endpoint) if self.recorded is not None else None
+        if body is None:
+            body = globals()[endpoint](params)
+        return 200, json.dumps(body).encode()
+
+
+def make_handler(api: FakeApi):
+    """
+    request handler class answering with `api`
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, as the swagger client expects
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            url = urlsplit(self.path)
+            endpoint = url.path[len(BASE_PATH):] if url.path.startswith(BASE_PATH) else None
+            if endpoint not in ENDPOINTS:
+                status, body = 404, b'{"error": "unknown endpoint"}'
+            else:
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                status, body = api.answer(endpoint, params)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+    return Handler
+
+
+def serve(api: FakeApi, host='127.0.0.1', port=8765) -> ThreadingHTTPServer:
+    """
+    start answering with `api` on a background thread, returns the server (`shutdown()` stops it)
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(api))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-tfnsw', daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    """
+    run the fake api until interrupted
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', action='append', default=[],
+                        help='distribution of every endpoint, or endpoint=distribution')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of calls failing')
+    parser.add_argument('--recorded', help='directory of recorded <endpoint>.json responses')
+    args = parser.parse_args(argv)
+
+    latencies = dict.fromkeys(ENDPOINTS, parse_latency('lognormal:0.15,0.5'))
+    for spec in args.latency:
+        endpoint, _, distribution = spec.rpartition('=')
+        for name in [endpoint] if endpoint else ENDPOINTS:
+            latencies[name] = parse_latency(distribution)
+    api = FakeApi(latencies, args.error_rate, Recorded(args.recorded) if args.recorded else None)
+    server = serve(api, args.host, args.port)
+    print(f'fake api on http://{args.host}:{args.port}{BASE_PATH.rstrip("/")}')
+    try:
+        while True:
+            time.sleep(10)
+            print(f'{api.calls} calls, {api.errors} failed')
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
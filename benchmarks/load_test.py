@@ -0,0 +1,179 @@
+"""
+load driver for a running app: sends a mix of `/`, `/stops`, `/stops/departures/<id>`
+and `/trip/journeys` requests at a target rate (open loop, so a slow app does not
+slow the requests down) and reports the throughput and the p50 / p95 / p99
+latencies of each route. latencies are measured from when a request was due, so
+requests queued behind a saturated app count their wait.
+
+run the app against the fake api (`benchmarks.fake_tfnsw`) rather than the real one, eg.
+    python -m benchmarks.fake_tfnsw --latency lognormal:0.15,0.5 &
+    TRIP_PLANNER_HOST=http://127.0.0.1:8765/v1/tp gunicorn -w 2 flask_server.start:APP &
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --rps 20 --duration 30
+
+usage: python -m benchmarks.load_test [--url http://127.0.0.1:8000] [--rps 20] [--duration 30]
+    [--mix index=1,stops=2,departures=4,journeys=3] [--keys 50] [--json]
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+SUBURBS = (
+    'central', 'town hall', 'parramatta', 'chatswood', 'strathfield', 'bondi junction',
+    'hornsby', 'epping', 'redfern', 'burwood', 'liverpool', 'penrith',
+)
+
+
+def route_paths(keys: int) -> dict:
+    """
+    route: function returning the path of a request, over `keys` distinct stops per route
+    """
+    stops = [str(200000 + 10 * number) for number in range(keys)]
+
+    def journeys():
+        origin, destination = random.sample(stops, 2) if keys > 1 else (stops[0], stops[0])
+        return f'/trip/journeys?origin={origin}&dest={destination}&originType=any&destType=any'
+    return {
+        'index': lambda: '/',
+        'stops': lambda: '/stops?query={}'.format(
+            random.choice(SUBURBS[:keys]).replace(' ', '+')
+        ),
+        'departures': lambda: f'/stops/departures/{random.choice(stops)}',
+        'journeys': journeys,
+    }
+
+
+def parse_mix(spec: str) -> dict:
+    """
+    route: weight from `route=weight,route=weight`
+    """
+    mix = {}
+    for part in spec.split(','):
+        route, _, weight = part.partition('=')
+        mix[route.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(latencies: list, share: float) -> float:
+    """
+    nearest rank percentile of sorted latencies
+    """
+    if not latencies:
+        return float('nan')
+    return latencies[min(int(len(latencies) * share), len(latencies) - 1)]
+
+
+class LoadTest:
+    """
+    sends requests of a route mix at a fixed rate and records their outcome
+        :var results: dict -> route: list of (latency in seconds, status) per request
+        :methods
+            run
+            report
+    """
+    def __init__(self, url: str, paths: dict, mix: dict, timeout=30.0, max_workers=256):
+        unknown = set(mix) - set(paths)
+        if unknown:
+            raise ValueError(f'unknown routes {", ".join(sorted(unknown))}')
+        self.url = url.rstrip('/')
+        self.paths = paths
+        self.routes = list(mix)
+        self.weights = [mix[route] for route in self.routes]
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.results = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _send(self, route: str, due: float):
+        path = self.paths[route]()
+        try:
+            with urlopen(self.url + path, timeout=self.timeout) as response:
+                response.read()  # streamed pages are only done once fully read
+                status = response.status
+        except HTTPError as err:
+            status = err.code
+        except OSError as err:  # refused, reset or timed out
+            status = type(err).__name__
+        latency = time.perf_counter() - due
+        with self._lock:
+            self.results[route].append((latency, status))
+
+    def run(self, rps: float, duration: float) -> float:
+        """
+        send `rps` requests a second for `duration` seconds, returns the seconds
+        taken until every request was answered
+        """
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self.max_workers, thread_name_prefix='load') as executor:
+            for number in range(int(rps * duration)):
+                due = started + number / rps
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                route = random.choices(self.routes, self.weights)[0]
+                executor.submit(self._send, route, due)
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float) -> dict:
+        """
+        requests, throughput, statuses and latency percentiles in milliseconds of each route and overall
+        """
+        rows = {route: self.results[route] for route in self.routes}
+        rows['all'] = [result for route in self.routes for result in self.results[route]]
+        report = {}
+        for route, results in rows.items():
+            latencies = sorted(latency for latency, _ in results)
+            statuses = Counter(str(status) for _, status in results)
+            report[route] = {
+                'requests': len(results),
+                'throughput': round(len(results) / elapsed, 2),
+                'errors': sum(
+                    number for status, number in statuses.items()
+                    if not status.isdigit() or int(status) >= 500
+                ),
+                'statuses': dict(statuses),
+                **{
+                    name: round(percentile(latencies, share) * 1000, 1)
+                    for name, share in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))
+                },
+            }
+        return report
+
+
+def main(argv=None) -> int:
+    """
+    run a load test and print its report, exit status 1 when every request failed
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='app to load')
+    parser.add_argument('--rps', type=float, default=20, help='requests sent a second')
+    parser.add_argument('--duration', type=float, default=30, help='seconds requests are sent for')
+    parser.add_argument('--mix', default='index=1,stops=2,departures=4,journeys=3',
+                        help='weight of each route')
+    parser.add_argument('--keys', type=int, default=50, help='distinct stops requested per route')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds a request may take')
+    parser.add_argument('--json', action='store_true', help='print the report as json')
+    args = parser.parse_args(argv)
+
+    test = LoadTest(args.url, route_paths(args.keys), parse_mix(args.mix), args.timeout)
+    report = test.report(test.run(args.rps, args.duration))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f'{"route":<12}{"requests":>9}{"req/s":>8}{"errors":>7}'
+              f'{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"max ms":>9}  statuses')
+        for route, row in report.items():
+            print(f'{route:<12}{row["requests"]:>9}{row["throughput"]:>8}{row["errors"]:>7}'
+                  f'{row["p50"]:>9}{row["p95"]:>9}{row["p99"]:>9}{row["max"]:>9}  {row["statuses"]}')
+    everything = report['all']
+    return 1 if everything['requests'] and everything['errors'] == everything['requests'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
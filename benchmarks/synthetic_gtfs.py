@@ -0,0 +1,87 @@
+"""
+writes a synthetic GTFS static feed, a grid of stations where every row and
+column of the grid is a bidirectional route, each station having a platform
+per route direction
+
+usage: python -m benchmarks.synthetic_gtfs <feed.zip> [grid size] [trips per direction]
+"""
+import csv
+import io
+import sys
+import zipfile
+
+
+def _csv(rows: list) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerows(rows)
+    return out.getvalue()
+
+
+def _time(seconds: int) -> str:
+    return f'{seconds // 3600:02}:{seconds // 60 % 60:02}:{seconds % 60:02}'
+
+
+def station_id(row: int, col: int) -> str:
+    """
+    stop id of the station at a grid position
+    """
+    return f'S{row}_{col}'
+
+
+def write_feed(path, size=10, trips=40, headway=15 * 60, hop=120, first=5 * 3600):
+    """
+    write the feed zip
+    :param path: zip file to write
+    :param size: stations per side of the grid (size * size stations, 4 * size routes)
+    :param trips: trips per route direction, `headway` seconds apart from `first`
+    :param hop: seconds between neighbouring stations
+    """
+    stops = [['stop_id', 'stop_name', 'stop_lat', 'stop_lon', 'location_type', 'parent_station']]
+    routes = [['route_id', 'route_short_name', 'route_long_name', 'route_type']]
+    trip_rows = [['route_id', 'service_id', 'trip_id', 'trip_headsign']]
+    stop_times = [['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence']]
+    for row in range(size):
+        for col in range(size):
+            lat, lon = -33.7 - row * 0.01, 151.0 + col * 0.01
+            stops.append([station_id(row, col), f'Station {row}-{col}, Suburb {row}',
+                          lat, lon, 1, ''])
+    lines = []
+    for line in range(size):
+        lines.append((f'R{line}', [(line, col) for col in range(size)], 2))
+        lines.append((f'C{line}', [(row, line) for row in range(size)], 3))
+    for route_id, stations, route_type in lines:
+        routes.append([route_id, route_id, f'Line {route_id}', route_type])
+        for direction, path_stations in enumerate((stations, stations[::-1])):
+            platforms = []
+            for row, col in path_stations:
+                platform = f'{station_id(row, col)}_{route_id}{direction}'
+                stops.append([platform, f'Station {row}-{col}, Platform {route_id}{direction}',
+                              -33.7 - row * 0.01, 151.0 + col * 0.01, 0,
+                              station_id(row, col)])
+                platforms.append(platform)
+            last = path_stations[-1]
+            for number in range(trips):
+                trip_id = f'{route_id}_{direction}_{number}'
+                trip_rows.append([route_id, 'WEEK', trip_id, f'Station {last[0]}-{last[1]}'])
+                start = first + number * headway
+                for sequence, platform in enumerate(platforms):
+                    time = _time(start + sequence * hop)
+                    stop_times.append([trip_id, time, time, platform, sequence + 1])
+    calendar = [
+        ['service_id', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday',
+         'sunday', 'start_date', 'end_date'],
+        ['WEEK', 1, 1, 1, 1, 1, 1, 1, 20000101, 20991231],
+    ]
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as feed:
+        feed.writestr('stops.txt', _csv(stops))
+        feed.writestr('routes.txt', _csv(routes))
+        feed.writestr('trips.txt', _csv(trip_rows))
+        feed.writestr('stop_times.txt', _csv(stop_times))
+        feed.writestr('calendar.txt', _csv(calendar))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    write_feed(sys.argv[1], *map(int, sys.argv[2:4]))
@@ -4,18 +4,56 @@ Initialises Flask server with routes to:
     - /trips
     - /departures
     - /trip-planner
+    - /api/v1 (json)
+    - /metrics (prometheus)
+    - /debug/traces (json)
 Also, configures our connection to the API by loading our keys in our environment
-to be loaded during a request contexts
+to be loaded during a request contexts. swagger_client is imported on first use,
+`warm_up` imports it and compiles the templates ahead of the first request
+(eg. in gunicorn's master before forking the workers, see gunicorn.conf.py)
 """
+import os
 
 from flask import Flask
 from dotenv import load_dotenv, find_dotenv
+from jinja2 import FileSystemBytecodeCache
 from flask_server import client as api
 from flask_server.routes.trips import TRIP_BLUEPRINT
 from flask_server.routes.stops import STOP_BLUEPRINT
 from flask_server.routes.index import INDEX_BLUEPRINT
+from flask_server.routes.api import API_BLUEPRINT
+from flask_server.routes.metrics import METRICS_BLUEPRINT
+from flask_server.routes.traces import TRACES_BLUEPRINT
+from flask_server.services import prefetch, profiler, tracing
+from flask_server.services.swagger_instance import api_exception
 
 
+def use_template_cache(app):
+    """
+    keep the compiled templates in `TEMPLATE_CACHE_DIR` (when set), so that a
+    new process loads their bytecode instead of compiling them. jinja's cache key
+    ignores whether templates are compiled for async rendering, so the WSGI and
+    ASGI apps keep theirs apart
+    :param app: Flask or Quart app
+    """
+    directory = app.config.get('TEMPLATE_CACHE_DIR')
+    if directory:
+        directory = os.path.join(directory, 'async' if app.jinja_env.is_async else 'sync')
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def warm_up(app):
+    """
+    import what the first request would (swagger_client and its models) and
+    compile every template, without opening connections or starting threads,
+    so it is safe before forking the workers
+    :param app: Flask or Quart app
+    """
+    api_exception()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
 
 def create_app():
     """
@@ -26,7 +64,6 @@ def create_app():
     app = Flask(__name__)
     load_dotenv(find_dotenv())
     trip_api_key = app.config.get('TRIP_PLANNER_API_KEY', False)
-    print(trip_api_key)
     if not trip_api_key:
         try:
             #app.config.get('CONFIG')
@@ -34,8 +71,16 @@ def create_app():
             app.config.from_pyfile('config/default.py')
         except Exception:
             raise RuntimeError("No API key Configured")
+    use_template_cache(app)
     api.init_app(app)
+    prefetch.init_app(app)
+    profiler.init_app(app)
     app.register_blueprint(STOP_BLUEPRINT)
     app.register_blueprint(TRIP_BLUEPRINT)
     app.register_blueprint(INDEX_BLUEPRINT)
+    app.register_blueprint(API_BLUEPRINT)
+    app.register_blueprint(METRICS_BLUEPRINT)
+    app.register_blueprint(TRACES_BLUEPRINT)
+    # last, so that the other before_request hooks are traced
+    tracing.init_app(app)
     return app
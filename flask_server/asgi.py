@@ -0,0 +1,43 @@
+"""# Quart Factory Method
+Initialises the asyncio serving mode, an ASGI app with the routes to:
+    - /stops
+    - /trip
+    - /
+    - /metrics (prometheus)
+whose views await their api calls, so one worker process keeps many requests
+in flight, and run their blocking io (sqlite, the timetable fallback) in threads.
+run it with an ASGI server eg. `hypercorn flask_server.start_async:APP`
+(requires the `async` extra)
+"""
+from dotenv import load_dotenv, find_dotenv
+from quart import Quart
+
+from flask_server import client as api, use_template_cache
+from flask_server.client import async_client
+from flask_server.routes.async_index import ASYNC_INDEX_BLUEPRINT
+from flask_server.routes.async_metrics import ASYNC_METRICS_BLUEPRINT
+from flask_server.routes.async_stops import ASYNC_STOP_BLUEPRINT
+from flask_server.routes.async_trips import ASYNC_TRIP_BLUEPRINT
+
+
+def create_app():
+    """
+    Factory Method that configures our ASGI server / API connection
+    :return: returns app: Quart
+    """
+    app = Quart(__name__)
+    load_dotenv(find_dotenv())
+    if not app.config.get('TRIP_PLANNER_API_KEY', False):
+        try:
+            app.config.from_pyfile('config/default.py')
+        except Exception:
+            raise RuntimeError("No API key Configured")
+    use_template_cache(app)
+    # the caches, circuit breakers, stop index and timetable are those of the blocking app
+    api.init_app(app)
+    async_client.init_app(app)
+    app.register_blueprint(ASYNC_STOP_BLUEPRINT)
+    app.register_blueprint(ASYNC_TRIP_BLUEPRINT)
+    app.register_blueprint(ASYNC_INDEX_BLUEPRINT)
+    app.register_blueprint(ASYNC_METRICS_BLUEPRINT)
+    return app
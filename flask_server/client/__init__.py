@@ -1,45 +1,156 @@
 """# Client Factory
 creates an API client instance for a flask request
 """
+from typing import Optional
+
 from flask import current_app
 
 from flask_server.client.client_class import Client
-from flask_server.services import swagger_instance
+from flask_server.services import swagger_instance, worker_pool
+from flask_server.services.circuit_breaker import CircuitBreakers
+from flask_server.services.hedging import Hedger
+from flask_server.services.metrics import Metrics
+from flask_server.services.response_cache import ResponseCache
+from flask_server.services.shared_cache import SQLiteCache, TieredCache
+from flask_server.services.single_flight import SingleFlight
+from flask_server.services.tracing import traced
+from flask_server.services.stop_index import StopIndex
+from flask_server.timetable.provider import TimetableClient
+from flask_server.timetable.store import Timetable
+
+
+def response_cache(config):
+    """
+    the api response cache selected by `RESPONSE_CACHE_BACKEND`:
+    'memory' (per process), 'sqlite' (shared by the workers of a host) or
+    'tiered' (per process in front of sqlite), None when caching is disabled
+    """
+    if not config.get('RESPONSE_CACHE_ENABLED', True):
+        return None
+    ttls = config.get('RESPONSE_CACHE_TTLS')
+    stale_for = config.get('RESPONSE_CACHE_STALE_FOR', 0)
+    local = ResponseCache(
+        config.get('RESPONSE_CACHE_MAX_ENTRIES', 1024), ttls, stale_for=stale_for,
+        max_bytes=config.get('RESPONSE_CACHE_MAX_BYTES')
+    )
+    backend = config.get('RESPONSE_CACHE_BACKEND', 'memory')
+    if backend == 'memory':
+        return local
+    shared = SQLiteCache(
+        config.get('RESPONSE_CACHE_PATH', 'responses.db'),
+        config.get('RESPONSE_CACHE_SHARED_MAX_ENTRIES', 10000), ttls, stale_for=stale_for
+    )
+    if backend == 'sqlite':
+        return shared
+    if backend == 'tiered':
+        return TieredCache(local, shared)
+    raise RuntimeError(f'unknown RESPONSE_CACHE_BACKEND {backend}')
 
 
 def init_app(app):
     """
-    Handles the loading and teardowns of our instantiated swagger
-    instance stored inside our current app context
+    Creates the process wide pool of swagger instances, the response cache,
+    the journey cache, the stop index, the registry of api calls in flight,
+    the circuit breakers and hedging of the api operations, the metrics
+    and the offline timetable (when configured) stored inside our app extensions,
+    instances are borrowed by each client call
     """
-    app.before_request(load_client)
-    app.teardown_appcontext(teardown)
+    app.extensions['swagger_pool'] = swagger_instance.SwaggerPool(
+        app.config['TRIP_PLANNER_API_KEY'],
+        size=app.config.get('TRIP_PLANNER_POOL_SIZE', 4),
+        timeout=app.config.get('TRIP_PLANNER_TIMEOUT'),
+        keep_alive=app.config.get('TRIP_PLANNER_KEEP_ALIVE', True),
+        retries=app.config.get('TRIP_PLANNER_RETRIES'),
+        host=app.config.get('TRIP_PLANNER_HOST')
+    )
+    app.extensions['response_cache'] = response_cache(app.config)
+    app.extensions['journey_cache'] = ResponseCache(
+        app.config.get('JOURNEY_CACHE_MAX_ENTRIES', 256),
+        default_ttl=app.config.get('JOURNEY_CACHE_TTL', 60)
+    )
+    app.extensions['single_flight'] = (
+        SingleFlight() if app.config.get('SINGLE_FLIGHT_ENABLED', True) else None
+    )
+    app.extensions['circuit_breakers'] = (
+        CircuitBreakers(
+            app.config.get('CIRCUIT_BREAKER_FAILURES', 5),
+            app.config.get('CIRCUIT_BREAKER_RESET_AFTER', 30)
+        ) if app.config.get('CIRCUIT_BREAKER_ENABLED', True) else None
+    )
+    app.extensions['hedger'] = (
+        Hedger(
+            app.config.get('HEDGE_OPERATIONS', ()),
+            percentile=app.config.get('HEDGE_PERCENTILE', 95),
+            budget=app.config.get('HEDGE_BUDGET', 0.05),
+            max_workers=app.config.get('HEDGE_WORKERS', 16)
+        ) if app.config.get('HEDGE_ENABLED', False) else None
+    )
+    app.extensions['stop_index'] = StopIndex(app.config.get('STOP_INDEX_MAX_STOPS', 100000))
+    if app.config.get('STOP_INDEX_SEED'):
+        app.extensions['stop_index'].load(app.config['STOP_INDEX_SEED'])
+    app.extensions['timetable'] = (
+        TimetableClient(
+            Timetable(app.config['TIMETABLE_PATH']),
+            max_trips=app.config.get('TIMETABLE_MAX_TRIPS', 5)
+        ) if app.config.get('TIMETABLE_PATH') else None
+    )
+    worker_pool.configure(app.config.get('FAN_OUT_WORKERS', 16))
+    app.extensions['metrics'] = (
+        collect_metrics(app.extensions, app.config.get('METRICS_DIR'))
+        if app.config.get('METRICS_ENABLED', True) else None
+    )
+
+
+def collect_metrics(extensions, directory=None) -> Metrics:
+    """
+    metrics reporting the counters of the services in `extensions`,
+    summed over the workers writing their snapshots to `directory`
+    """
+    metrics = Metrics(directory)
+    metrics.collect('swagger_pool', extensions['swagger_pool'].stats)
+    cache = extensions['response_cache']
+    if cache is not None:
+        metrics.collect(
+            'response_cache', cache.stats, label='tier', keyed=isinstance(cache, TieredCache)
+        )
+    metrics.collect('journey_cache', extensions['journey_cache'].stats)
+    for name, label in (
+            ('single_flight', 'key'), ('circuit_breakers', 'operation'), ('hedger', 'operation')
+    ):
+        if extensions[name] is not None:
+            metrics.collect(name, extensions[name].stats, label, keyed=name == 'circuit_breakers')
+    return metrics
+
 
-def load_client():
+def pool() -> swagger_instance.SwaggerPool:
     """
-    loads swagger client as an extension to our current app
-    using our key loading into our environment, during the lifetime of a
-    request
-    :return:
+    returns the swagger pool of the current app
     """
-    current_app.extensions['swagger_client'] =\
-        swagger_instance.start(current_app.config['TRIP_PLANNER_API_KEY'])
+    return current_app.extensions['swagger_pool']
 
 
-def teardown(_):
+def timetable_connection() -> Optional[TimetableClient]:
     """
-    pop our swagger client from the application context stack after a request is completed
-    :param _:
-    :return:
+    a client planning over the offline timetable, None when no timetable is configured
     """
-    current_app.extensions.pop('swagger_client', None)
+    timetable = current_app.extensions['timetable']
+    return timetable.sibling() if timetable is not None else None
 
 
-def connection() -> Client:
+@traced('client.connection')
+def connection(refresh=False) -> Client:
     """
     build and return our Client connection to be used during a request
+    :param refresh: bool -> the client always calls the api, refreshing the cache
     :return: Client configured with a swagger instance to interact with our API
     """
     return Client(
-        current_app.extensions['swagger_client']
+        pool(), current_app.extensions['response_cache'],
+        current_app.config.get('FAN_OUT_DEADLINE'), current_app.extensions['stop_index'],
+        current_app.extensions['timetable']
+        if current_app.config.get('TIMETABLE_FALLBACK', True) else None,
+        flight=current_app.extensions['single_flight'],
+        breakers=current_app.extensions['circuit_breakers'],
+        call_deadline=current_app.config.get('TRIP_PLANNER_DEADLINE'), refresh=refresh,
+        hedger=current_app.extensions['hedger'], metrics=current_app.extensions['metrics']
     )
@@ -0,0 +1,320 @@
+"""
+asyncio variant of the api client, for the ASGI app (`flask_server.asgi`):
+the same methods as `Client`, as coroutines sending their calls with `AsyncApi`,
+so a worker keeps many api calls in flight on one thread
+(requires the `async` extra). the blocking parts, reading and writing a sqlite
+response cache and the offline timetable fallback, run in the event loop's
+default executor
+"""
+import asyncio
+import logging
+from contextvars import copy_context
+from functools import partial, wraps
+from time import perf_counter
+from typing import TYPE_CHECKING, Awaitable, Callable, List
+
+import aiohttp
+from quart import current_app
+
+from flask_server.client.client_class import (
+    Client, _is_outage, _record, upstream_errors
+)
+from flask_server.services.async_api import AsyncApi
+from flask_server.services.circuit_breaker import CircuitOpenError
+from flask_server.services.response_cache import ResponseCache
+from flask_server.services.single_flight import AsyncSingleFlight
+from flask_server.services.swagger_instance import api_exception
+from flask_server.services.tracing import span
+
+if TYPE_CHECKING:
+    from swagger_client.models.additional_info_response import AdditionalInfoResponse
+    from swagger_client.models.departure_monitor_response import DepartureMonitorResponse
+    from swagger_client.models.stop_finder_response import StopFinderResponse
+    from swagger_client.models.trip_request_response import TripRequestResponse
+
+logger = logging.getLogger(__name__)
+
+
+def async_upstream_errors() -> tuple:
+    """
+    errors of a call the api did not answer, aiohttp's connection errors included
+    """
+    return upstream_errors() + (aiohttp.ClientError,)
+
+# background refreshes of stale responses, referenced until done
+_REFRESHES = set()
+
+
+async def blocking(function, *args, **kwargs):
+    """
+    returns `function(*args, **kwargs)` run in the event loop's default executor
+    (with the caller's context, so spans nest), for blocking io eg. sqlite
+    """
+    return await asyncio.get_event_loop().run_in_executor(
+        None, partial(copy_context().run, function, *args, **kwargs)
+    )
+
+
+def _measured(method):
+    """
+    `client_class._measured` for coroutine methods
+    """
+    @wraps(method)
+    async def measured(self, *args, **kwargs):
+        started = perf_counter()
+        with span(f'client.{method.__name__}') as current:
+            try:
+                return await method(self, *args, **kwargs)
+            finally:
+                _record(self, method.__name__, started, current)
+    return measured
+
+
+class AsyncClient(Client):
+    """# Async Client API Class for Trip Planner
+    `Client` with coroutine methods, sharing its caches, circuit breakers, stop index,
+    fallback and metrics, and its data / error semantics (slow calls are not hedged)
+    - `_api` *protected* : AsyncApi -> sends the api calls of the worker
+    - `_flight` *protected* : AsyncSingleFlight -> shares identical concurrent api calls
+    """
+
+    def __init__(
+            self, api=None, cache=None, deadline=None, stop_index=None, fallback=None,
+            flight=None, breakers=None, call_deadline=None, refresh=False, metrics=None
+    ):
+        super().__init__(
+            None, cache, deadline, stop_index, fallback, flight=flight, breakers=breakers,
+            call_deadline=call_deadline, refresh=refresh, metrics=metrics
+        )
+        self._api = api
+
+    async def _request(self, operation: str, *args, key=None, **kwargs):
+        """
+        `Client._request` sending the call with `AsyncApi`, stale responses are
+        refreshed by a background task
+        """
+        cache = self._cache if key is not None else None
+        key = (operation,) + key if key is not None else None
+        breaker = self._breakers.get(operation) if self._breakers is not None else None
+        self.from_cache = self.from_fallback = self.stale = False
+        self.exception = None
+        self.max_age = 0.0
+
+        async def cached(function, *args):
+            if isinstance(cache, ResponseCache):  # in memory, never blocks
+                return function(*args)
+            return await blocking(function, *args)
+
+        async def fetch():
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenError(operation)
+            try:
+                with span('upstream', operation=operation):
+                    response = await self._api.call(operation, *args, **kwargs)
+            except (api_exception(), aiohttp.ClientError, TimeoutError) as err:
+                if breaker is not None and _is_outage(err):
+                    breaker.failure()
+                elif breaker is not None:
+                    breaker.success()
+                raise
+            except asyncio.CancelledError:  # gave up on, not an answer of the api
+                raise
+            except Exception:  # eg. an invalid response, the probe of a half open circuit too
+                if breaker is not None:
+                    breaker.failure()
+                raise
+            if breaker is not None:
+                breaker.success()
+            if cache is not None:
+                await cached(cache.set, key, response)
+            return response
+
+        async def call():
+            if self._flight is not None and key is not None:
+                return await self._flight.do(key, fetch, self.call_deadline)
+            return await fetch()
+
+        async def revalidate():
+            try:
+                await call()
+            except async_upstream_errors() as err:
+                logger.warning('refreshing %s failed: %s', operation, err)
+
+        if cache is not None and not self.refresh:
+            data = await cached(cache.get, key)
+            if data is not None:
+                self.from_cache = True
+                self.max_age = await cached(cache.time_left, key)
+                return data
+            data = await cached(cache.get_stale, key)
+            if data is not None:
+                self.from_cache = self.stale = True
+                refresh = asyncio.ensure_future(revalidate())
+                _REFRESHES.add(refresh)
+                refresh.add_done_callback(_REFRESHES.discard)
+                return data
+
+        try:
+            data = await call()
+        except async_upstream_errors() as err:
+            self.exception = err
+            raise
+        if cache is not None:
+            self.max_age = cache.ttl_for(key)
+        return data
+
+    async def gather(
+            self, *calls: Callable[['AsyncClient'], Awaitable], deadline=None, limit=None
+    ) -> List['AsyncClient']:
+        """### Gather
+        `Client.gather` for coroutines eg.\
+        `lambda client: client.find_stops_by_name('any', query)`,
+        calls still running at the deadline are cancelled and reported as errors
+        """
+        clients = [self.sibling() for _ in calls]
+        if not calls:
+            return clients
+        running = asyncio.Semaphore(len(calls) if limit is None else limit)
+
+        async def run(call, client):
+            async with running:
+                await call(client)
+
+        tasks = [asyncio.ensure_future(run(call, client)) for call, client in zip(calls, clients)]
+        done, _ = await asyncio.wait(tasks, timeout=self.deadline if deadline is None else deadline)
+        for index, task in enumerate(tasks):
+            if task in done:
+                task.result()  # re-raise unexpected errors from the call
+            else:
+                task.cancel()
+                clients[index] = self.sibling()
+                clients[index].error = 404
+        return clients
+
+    @_measured
+    async def find_stops_by_name(
+            self, _type: str, query: str, is_id=False
+    ) -> 'StopFinderResponse':
+        """### Find Stop by name
+        see `Client.find_stops_by_name`
+        """
+        args, kwargs = self._stops_call(_type, query, is_id)
+        try:
+            req = await self._request(*args, **kwargs)
+            self.data = req
+            self.error = 404 if not req.locations else 200
+            if self._stop_index is not None:  # cache hits too, eg. cached by another worker
+                self._stop_index.add_locations(req.locations)
+        except async_upstream_errors() as err:
+            logger.warning('stop finder request failed: %s', err)
+            self.data = None
+            self.error = 404
+            await blocking(self._fall_back, 'find_stops_by_name', _type, query, is_id)
+        return self.data
+
+    @_measured
+    async def find_destinations_for(
+            self, _type: str, query: str, request_type: str,
+            date_time=None
+    ) -> 'DepartureMonitorResponse':
+        """### find destinations for specific stop/location
+        see `Client.find_destinations_for`
+        """
+        args, kwargs = self._departures_call(_type, query, request_type, date_time)
+        try:
+            req = await self._request(*args, **kwargs)
+            self.error = 404 if req.stop_events is None else 200
+            self.data = req
+        except async_upstream_errors() as err:
+            logger.warning('departure monitor request failed: %s', err)
+            self.data = None
+            self.error = 404
+            await blocking(
+                self._fall_back, 'find_destinations_for', _type, query, request_type, date_time
+            )
+        return self.data
+
+    @_measured
+    async def find_trips_for_stop(
+            self, *args, **kwargs
+    ) -> 'TripRequestResponse':
+        """### Find Trips For Stop
+        see `Client.find_trips_for_stop`
+        """
+        call_args, call_kwargs = self._trips_call(*args, **kwargs)
+        try:
+            req = await self._request(*call_args, **call_kwargs)
+            self.error = 404 if req.journeys is None else 200
+            self.data = req
+        except async_upstream_errors() as err:
+            logger.warning('trip request failed: %s', err)
+            self.data = None
+            self.error = 404
+            await blocking(self._fall_back, 'find_trips_for_stop', *args, **kwargs)
+        return self.data
+
+    @_measured
+    async def request_status_info(
+            self, stop, publication_status="current"
+    ) -> 'AdditionalInfoResponse':
+        """
+        see `Client.request_status_info`
+        """
+        try:
+            args, kwargs = self._status_call(stop, publication_status)
+            req = await self._request(*args, **kwargs)
+            self.data = req
+            self.error = 404 if req.infos.current is None else 200
+        except async_upstream_errors() as err:
+            logger.warning('additional info request failed: %s', err)
+            self.data = None
+            self.error = 404
+        return self.data
+
+
+def init_app(app):
+    """
+    Creates the worker's `AsyncApi` and registry of api calls in flight in our app
+    extensions, next to those of `flask_server.client.init_app`, the api session is
+    opened and closed with the app serving
+    """
+    app.extensions['async_api'] = AsyncApi(
+        app.config['TRIP_PLANNER_API_KEY'], app.config.get('TRIP_PLANNER_HOST'),
+        timeout=app.config.get('TRIP_PLANNER_TIMEOUT'),
+        retries=app.config.get('TRIP_PLANNER_RETRIES'),
+        connections=app.config.get('ASYNC_CONNECTIONS', 100)
+    )
+    app.extensions['async_single_flight'] = (
+        AsyncSingleFlight() if app.config.get('SINGLE_FLIGHT_ENABLED', True) else None
+    )
+    metrics = app.extensions.get('metrics')
+    if metrics is not None:
+        metrics.collect('async_api', app.extensions['async_api'].stats)
+        if app.extensions['async_single_flight'] is not None:
+            metrics.collect('async_single_flight', app.extensions['async_single_flight'].stats)
+
+    @app.before_serving
+    async def open_api():
+        await app.extensions['async_api'].start()
+
+    @app.after_serving
+    async def close_api():
+        await app.extensions['async_api'].close()
+
+
+def connection(refresh=False) -> AsyncClient:
+    """
+    build and return our AsyncClient connection to be used during a request
+    :param refresh: bool -> the client always calls the api, refreshing the cache
+    :return: AsyncClient sending calls with the worker's `AsyncApi`
+    """
+    return AsyncClient(
+        current_app.extensions['async_api'], current_app.extensions['response_cache'],
+        current_app.config.get('FAN_OUT_DEADLINE'), current_app.extensions['stop_index'],
+        current_app.extensions['timetable']
+        if current_app.config.get('TIMETABLE_FALLBACK', True) else None,
+        flight=current_app.extensions['async_single_flight'],
+        breakers=current_app.extensions['circuit_breakers'],
+        call_deadline=current_app.config.get('TRIP_PLANNER_DEADLINE'), refresh=refresh,
+        metrics=current_app.extensions['metrics']
+    )
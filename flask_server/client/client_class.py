@@ -3,38 +3,430 @@ Defines a client class to handle request from the trip planner api
 hands back data filtered from the trip planner back to
 the server. Caching Class
 """
+import logging
+import threading
+from contextvars import copy_context
+from copy import copy
 from datetime import datetime
+from functools import wraps
+from time import perf_counter
+from typing import TYPE_CHECKING, Callable, List
 
 from dateutil import tz
-from swagger_client.models.additional_info_response import AdditionalInfoResponse
-from swagger_client.models.departure_monitor_response import DepartureMonitorResponse
-from swagger_client.models.stop_finder_response import StopFinderResponse
-from swagger_client.models.trip_request_response import TripRequestResponse
-from swagger_client.rest import ApiException
+from urllib3.exceptions import TimeoutError as Urllib3TimeoutError
 from urllib3.util.retry import MaxRetryError
+from flask_server.services import profiler, worker_pool
 from flask_server.services.app_locals import JSON_FORMAT, COORDINATE_FORMAT
-from flask_server.services.data_service import create_date_and_time, date_parser
+from flask_server.services.circuit_breaker import CircuitOpenError
+from flask_server.services.data_service import create_date_and_time, date_parser, SYDNEY
+from flask_server.services.swagger_instance import api_exception
+from flask_server.services.tracing import span
+
+if TYPE_CHECKING:
+    from swagger_client.models.additional_info_response import AdditionalInfoResponse
+    from swagger_client.models.departure_monitor_response import DepartureMonitorResponse
+    from swagger_client.models.stop_finder_response import StopFinderResponse
+    from swagger_client.models.trip_request_response import TripRequestResponse
+
+logger = logging.getLogger(__name__)
+
+
+def upstream_errors() -> tuple:
+    """
+    errors of a call the api did not answer: unreachable, rejected, circuit open or too slow
+    (a function, so that swagger_client is only imported once an error is raised)
+    """
+    return MaxRetryError, api_exception(), CircuitOpenError, TimeoutError
+
+
+def _is_outage(err: Exception) -> bool:
+    """
+    whether an api error counts against the operation's circuit, requests the
+    api rejected as invalid show it is up
+    """
+    if isinstance(err, api_exception()):
+        return err.status is None or err.status >= 500 or err.status == 429
+    return True
+
+
+def _outcome(client: 'Client') -> str:
+    """
+    outcome of a client's last call: ok, 404 (answered without results), timeout,
+    api_exception (rejected), unreachable or circuit_open
+    """
+    err = client.exception
+    if err is None:
+        return 'ok' if client.error == 200 else '404'
+    if isinstance(err, CircuitOpenError):
+        return 'circuit_open'
+    if isinstance(err, api_exception()):
+        return 'api_exception'
+    # urllib3 gives up on a timed out call with a MaxRetryError
+    if isinstance(err, TimeoutError) or isinstance(
+            getattr(err, 'reason', None), Urllib3TimeoutError
+    ):
+        return 'timeout'
+    return 'unreachable'
+
+
+def _source(client: 'Client') -> str:
+    """
+    where a client's last response came from: api, cache, stale (cache) or fallback
+    """
+    if client.from_fallback:
+        return 'fallback'
+    if client.stale:
+        return 'stale'
+    return 'cache' if client.from_cache else 'api'
+
+
+def _record(client: 'Client', method: str, started: float, current):
+    """
+    record the outcome and source of a client method's call on its span, and
+    its latency when the client has metrics
+    """
+    outcome, source = _outcome(client), _source(client)
+    if current is not None:
+        current.set(outcome=outcome, source=source)
+    if client._metrics is not None:  # pylint: disable=protected-access
+        client._metrics.observe(  # pylint: disable=protected-access
+            'client_call_seconds', (
+                ('method', method), ('outcome', outcome), ('source', source)
+            ), perf_counter() - started, 'latency of the api client calls'
+        )
+
+
+def _measured(method):
+    """
+    record the latency of a client method by outcome and source, when the client has
+    metrics, and trace it as a span
+    """
+    @wraps(method)
+    def measured(self, *args, **kwargs):
+        started = perf_counter()
+        with span(f'client.{method.__name__}') as current:
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                _record(self, method.__name__, started, current)
+    return measured
 
 
 class Client:
     """# Client API Class for Trip Planner
     initialises a swagger client to connect
     to the trip planner api
-    - `_instance` *protected* : TripPlannerAPI -> initialises swagger client instance
+    - `_pool` *protected* : SwaggerPool -> pool of swagger instances borrowed per call
+    - `_cache` *protected* : ResponseCache -> caches responses by request parameters
+    - `deadline`: float -> seconds `gather` waits for concurrent calls
+    - `_stop_index` *protected* : StopIndex -> autocomplete index fed with found stops
+    - `from_cache`: bool -> whether the last response was served from the cache
+    - `_fallback` *protected* : TimetableClient -> answers calls the api failed
+    - `from_fallback`: bool -> whether the last response came from the fallback
+    - `_flight` *protected* : SingleFlight -> shares identical concurrent api calls
+    - `_breakers` *protected* : CircuitBreakers -> fail calls at once while the api is down
+    - `_hedger` *protected* : Hedger -> repeats slow calls, using the first answer
+    - `_metrics` *protected* : Metrics -> records the latency of each call
+    - `exception`: Exception -> error of the last api call, None when it was answered
+    - `call_deadline`: float -> seconds to wait for an identical call already in flight
+    - `stale`: bool -> whether the last response expired and is being refreshed in the background
+    - `refresh`: bool -> skip cached responses, always calling the api (and caching the response)
+    - `max_age`: float -> seconds the last response stays fresh in the cache
     - `result`: TripPlannerResponse -> Response from API server
     - `error`: int -> http error code / msg
     """
 
-    def __init__(self, instance=None):
-        # start up swagger client instance upon initialisation
-        self._instance = instance
+    def __init__(
+            self, pool=None, cache=None, deadline=None, stop_index=None, fallback=None,
+            flight=None, breakers=None, call_deadline=None, refresh=False, hedger=None,
+            metrics=None
+    ):
+        # swagger instances are borrowed from the pool for each upstream call
+        self._pool = pool
+        self._cache = cache
+        self._flight = flight
+        self._breakers = breakers
+        self._hedger = hedger
+        self._metrics = metrics
+        self.call_deadline = call_deadline
+        self.refresh = refresh
+        self._stop_index = stop_index
+        self._fallback = fallback
+        self.deadline = deadline
+        self.from_cache = False
+        self.from_fallback = False
+        self.stale = False
+        self.exception = None
+        self.max_age = 0.0
         self.error = None
         self.data = None
         self.version = '10.2.1.42'  # stable version
 
+    def _request(self, operation: str, *args, key=None, **kwargs):
+        """
+        send a request to the api by calling `operation` on a pooled swagger instance,
+        applying the pool's per call timeout.
+        responses are served from / saved to the cache under `key`,
+        a tuple of the normalised request parameters (not cached when None),
+        concurrent calls with the same key share one api request, and slow calls of
+        hedged operations are sent again.
+        an expired response still in the cache is served at once (marked `stale`)
+        while a background call refreshes it, and calls fail straight away
+        while the operation's circuit is open
+        """
+        cache = self._cache if key is not None else None
+        key = (operation,) + key if key is not None else None
+        breaker = self._breakers.get(operation) if self._breakers is not None else None
+        self.from_cache = self.from_fallback = self.stale = False
+        self.exception = None
+        self.max_age = 0.0
+
+        def upstream():
+            with span('upstream', operation=operation), self._pool.lease() as instance:
+                return getattr(instance, operation)(
+                    *args, _request_timeout=self._pool.timeout, **kwargs
+                )
+
+        def fetch():
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenError(operation)
+            try:
+                if self._hedger is not None and self._hedger.hedges(operation):
+                    response = self._hedger.run(operation, upstream)
+                else:
+                    response = upstream()
+            except (MaxRetryError, api_exception()) as err:
+                if breaker is not None and _is_outage(err):
+                    breaker.failure()
+                elif breaker is not None:
+                    breaker.success()
+                raise
+            except Exception:  # eg. an invalid response, the probe of a half open circuit too
+                if breaker is not None:
+                    breaker.failure()
+                raise
+            if breaker is not None:
+                breaker.success()
+            if cache is not None:
+                cache.set(key, response)
+            return response
+
+        def call():
+            if self._flight is not None and key is not None:
+                return self._flight.do(key, fetch, self.call_deadline)
+            return fetch()
+
+        def revalidate():
+            try:
+                call()
+            except upstream_errors() as err:
+                logger.warning('refreshing %s failed: %s', operation, err)
+
+        if cache is not None and not self.refresh:
+            data = cache.get(key)
+            if data is not None:
+                self.from_cache = True
+                self.max_age = cache.time_left(key)
+                return data
+            data = cache.get_stale(key)
+            if data is not None:
+                self.from_cache = self.stale = True
+                worker_pool.get_executor().submit(revalidate)
+                return data
+
+        try:
+            data = call()
+        except upstream_errors() as err:
+            self.exception = err
+            raise
+        if cache is not None:
+            self.max_age = cache.ttl_for(key)
+        return data
+
+    def sibling(self) -> 'Client':
+        """
+        a new client sharing our swagger pool and cache, with its own `data` / `error`
+        """
+        sibling = copy(self)
+        sibling.data = sibling.error = None
+        sibling.from_cache = sibling.from_fallback = sibling.stale = False
+        sibling.exception = None
+        sibling.max_age = 0.0
+        return sibling
+
+    def _fall_back(self, method: str, *args, **kwargs):
+        """
+        answer a call the api failed with the fallback provider, when one is configured
+        """
+        if self._fallback is None:
+            return self.data
+        fallback = self._fallback.sibling()
+        self.data = getattr(fallback, method)(*args, **kwargs)
+        self.error = fallback.error
+        self.from_fallback = True
+        self.max_age = 0.0
+        return self.data
+
+    def gather(
+            self, *calls: Callable[['Client'], object], deadline=None, limit=None
+    ) -> List['Client']:
+        """### Gather
+        send several api calls at once and wait for all of them
+
+        Args:
+        - `calls`: functions taking a client and calling one of its methods eg.\
+        `lambda client: client.find_stops_by_name('any', query)`
+        - `deadline`: float -> seconds to wait for every call, defaults to `self.deadline`
+        - `limit`: int -> most calls running at once, the rest start as calls finish
+
+        returns a client per call holding its `data` and `error`,
+        calls still running (or not started) at the deadline are reported as errors
+        """
+        clients = [self.sibling() for _ in calls]
+        calls = [profiler.attached(call) for call in calls]
+        executor = worker_pool.get_executor()
+        futures = [None] * len(calls)
+        waiting = iter(range(len(calls)))
+        state = {'finished': 0, 'expired': False}
+        finished = threading.Condition()
+
+        def start_next(_=None):
+            with finished:
+                if _ is not None:
+                    state['finished'] += 1
+                    finished.notify()
+                index = None if state['expired'] else next(waiting, None)
+            if index is not None:
+                # spans of the call nest under the caller's
+                futures[index] = executor.submit(
+                    copy_context().run, calls[index], clients[index]
+                )
+                futures[index].add_done_callback(start_next)
+
+        for _ in range(len(calls) if limit is None else min(limit, len(calls))):
+            start_next()
+        with finished:
+            finished.wait_for(
+                lambda: state['finished'] == len(calls),
+                self.deadline if deadline is None else deadline
+            )
+            state['expired'] = True
+        for index, future in enumerate(futures):
+            if future is not None and future.done():
+                future.result()  # re-raise unexpected errors from the call
+            else:
+                # the late call keeps running, hand back a fresh client instead
+                if future is not None:
+                    future.cancel()
+                clients[index] = self.sibling()
+                clients[index].error = 404
+        return clients
+
+    def _stops_call(self, _type: str, query: str, is_id=False) -> (tuple, dict):
+        """
+        arguments of `_request` finding stops by name or id
+        """
+        # if search based on trip_id. returns the best match on true
+        tf_nswsf = "true" if is_id else ""
+        return (
+            ('tfnsw_stopfinder_request', JSON_FORMAT, _type, query, COORDINATE_FORMAT),
+            dict(
+                version=self.version, tf_nswsf=tf_nswsf,
+                key=(_type, query.strip() if is_id else query.strip().lower(), is_id)
+            )
+        )
+
+    def _departures_call(
+            self, _type: str, query: str, request_type: str, date_time=None
+    ) -> (tuple, dict):
+        """
+        arguments of `_request` finding the departures of a stop
+        """
+        format_date = '%Y%m%d'
+        format_time = '%H%M'
+        # departures for "now" share a cache entry, the countdown is worked out later
+        key_time = 'now' if date_time is None else None
+        if date_time is None:
+            date_time = datetime.now(tz.tzlocal()).astimezone(SYDNEY)
+            # format datetime to a string
+            date_str, time = create_date_and_time(date_time, format_date, format_time)
+        else:
+            date_str, time = date_time
+            is_date = date_parser(f'{date_str} {time}', '%Y-%m-%d %I:%M%p')
+            if is_date:
+                date_str, time = create_date_and_time(is_date, format_date, format_time)
+        return (
+            (
+                'tfnsw_dm_request', JSON_FORMAT, COORDINATE_FORMAT, _type, query,
+                request_type, date_str, time
+            ),
+            dict(
+                mode='direct', tf_nswdm="true", version=self.version,
+                key=(_type, query, request_type, key_time or (date_str, time))
+            )
+        )
+
+    def _trips_call(self, *args, **kwargs) -> (tuple, dict):
+        """
+        arguments of `_request` finding trips, see `find_trips_for_stop`
+        """
+        format_date = '%Y%m%d'
+        format_time = '%H%M'
+        departure, destination, dep = args
+        key_time = 'now' if not kwargs.get('date_time', False) else None
+        if not kwargs.get('date_time', False):
+            date_time = datetime.now(
+                tz.tzlocal()
+            ).astimezone(tz=SYDNEY)
+            # format datetime to a string
+            date_str, time = create_date_and_time(
+                date_time, format_date, format_time
+            )
+        else:
+            date_str, time = kwargs['date_time']
+            date_time = datetime.strptime(
+                f'{date_str} {time}', '%Y-%m-%d %I:%M%p'
+            )
+            if date_time:
+                date_str, time = create_date_and_time(
+                    date_time, format_date, format_time
+                )
+
+        calc_number_of_trips = (
+            5 if not kwargs.get('calc_number_of_trips', False)
+            else kwargs['calc_number_of_trips']
+        )
+        return (
+            (
+                'tfnsw_trip_request2', JSON_FORMAT, COORDINATE_FORMAT, dep, date_str, time,
+                *departure, *destination
+            ),
+            dict(
+                tf_nswtr="true", calc_number_of_trips=calc_number_of_trips,
+                version=self.version, key=(
+                    tuple(map(str, departure)), tuple(map(str, destination)), dep,
+                    key_time or (date_str, time), calc_number_of_trips
+                )
+            )
+        )
+
+    @staticmethod
+    def _status_call(stop, publication_status="current") -> (tuple, dict):
+        """
+        arguments of `_request` finding the status messages of a stop
+        """
+        return (
+            ('tfnsw_addinfo_request', JSON_FORMAT),
+            dict(
+                itd_l_pxx_sel_stop=stop, filter_publication_status=publication_status,
+                key=(stop, publication_status)
+            )
+        )
+
+    @_measured
     def find_stops_by_name(
             self, _type: str, query: str, is_id=False
-    ) -> StopFinderResponse:
+    ) -> 'StopFinderResponse':
         """### Find Stop by name
         find a stop from a specified POI, or suburb
 
@@ -43,23 +435,18 @@ class Client:
         - `any`, `stop`, `platform`, etc.
         - query: search query, usually a stop ID or a name type: (str)
         """
-        # if search based on trip_id. returns the best match on true
-        tf_nswsf = "true" if is_id else ""
+        args, kwargs = self._stops_call(_type, query, is_id)
         try:
-            req = self._instance.tfnsw_stopfinder_request(
-                JSON_FORMAT, _type, query, COORDINATE_FORMAT,
-                version=self.version, tf_nswsf=tf_nswsf
-            )
+            req = self._request(*args, **kwargs)
             self.data = req
             self.error = 404 if not req.locations else 200
-        except MaxRetryError as err:
-            print(err)
-            self.data = None
-            self.error = 404
-        except ApiException as err:
-            print(err)
+            if self._stop_index is not None:  # cache hits too, eg. cached by another worker
+                self._stop_index.add_locations(req.locations)
+        except upstream_errors() as err:  # server unreachable, rejected the request or too slow
+            logger.warning('stop finder request failed: %s', err)
             self.data = None
             self.error = 404
+            self._fall_back('find_stops_by_name', _type, query, is_id)
         return self.data
 
     def find_stops_near_coord(self, *params):
@@ -67,10 +454,11 @@ class Client:
         Not implemented
         """
 
+    @_measured
     def find_destinations_for(
             self, _type: str, query: str, request_type: str,
             date_time=None
-    ) -> DepartureMonitorResponse:
+    ) -> 'DepartureMonitorResponse':
         """### find destinations for specific stop/location
         find destinations for a specified stop taking in arrival/departure times, etc
 
@@ -79,39 +467,23 @@ class Client:
         usually any or stop, refer to the API docs for more info
         - `query`: str -> station to search, can be key words, suburbs, IDs, etc
         """
-        format_date = '%Y%m%d'
-        format_time = '%H%M'
-        if date_time is None:
-            date_time = datetime.now(tz.tzlocal()).astimezone(tz.gettz("Australia/Sydney"))
-            # format datetime to a string
-            date_str, time = create_date_and_time(date_time, format_date, format_time)
-        else:
-            date_str, time = date_time
-            is_date = date_parser(f'{date_str} {time}', '%Y-%m-%d %I:%M%p')
-            if is_date:
-                date_str, time = create_date_and_time(is_date, format_date, format_time)
+        args, kwargs = self._departures_call(_type, query, request_type, date_time)
         # sends a request to the api using the swagger instance
         try:
-            req = self._instance.tfnsw_dm_request(
-                JSON_FORMAT, COORDINATE_FORMAT, _type, query,
-                request_type, date_str, time,
-                mode='direct', tf_nswdm="true", version=self.version
-            )
+            req = self._request(*args, **kwargs)
             self.error = 404 if req.stop_events is None else 200
             self.data = req
-        except MaxRetryError as err:
-            print(err)
-            self.data = None
-            self.error = 404
-        except ApiException as err:
-            print(err)
+        except upstream_errors() as err:  # server unreachable, rejected the request or too slow
+            logger.warning('departure monitor request failed: %s', err)
             self.data = None
             self.error = 404
+            self._fall_back('find_destinations_for', _type, query, request_type, date_time)
         return self.data
 
+    @_measured
     def find_trips_for_stop(
             self, *args, **kwargs
-    ) -> TripRequestResponse:
+    ) -> 'TripRequestResponse':
         """### Find Trips For Stop
         find trips (possible departures) for a stop by taking in the departure origin,
         destination a specified time and saves the result to the client `self.result` property
@@ -129,67 +501,32 @@ class Client:
             - `wheelchair`: str -> default set to 'off'
             set 'on' to return wheelchair accessible options
         """
-        format_date = '%Y%m%d'
-        format_time = '%H%M'
-        departure, destination, dep = args
-        if not kwargs.get('date_time', False):
-            date_time = datetime.now(
-                tz.tzlocal()
-            ).astimezone(tz=tz.gettz('Australia/Sydney'))
-            # format datetime to a string
-            date_str, time = create_date_and_time(
-                date_time, format_date, format_time
-            )
-        else:
-            date_str, time = kwargs['date_time']
-            date_time = datetime.strptime(
-                f'{date_str} {time}', '%Y-%m-%d %I:%M%p'
-            )
-            if date_time:
-                date_str, time = create_date_and_time(
-                    date_time, format_date, format_time
-                )
-
-        calc_number_of_trips = (
-            5 if not kwargs.get('calc_number_of_trips', False)
-            else kwargs['calc_number_of_trips']
-        )
+        call_args, call_kwargs = self._trips_call(*args, **kwargs)
         try:
-            req = self._instance.tfnsw_trip_request2(
-                JSON_FORMAT, COORDINATE_FORMAT, dep, date_str, time, *departure,
-                *destination, tf_nswtr="true", calc_number_of_trips=calc_number_of_trips,
-                version=self.version
-            )
+            req = self._request(*call_args, **call_kwargs)
             self.error = 404 if req.journeys is None else 200
             self.data = req
-        except MaxRetryError as err:  # server cannot be reached
-            print(err)
-            self.data = None
-            self.error = 404
-        except ApiException as err:  # server rejected request
-            print(err)
+        except upstream_errors() as err:  # server unreachable, rejected the request or too slow
+            logger.warning('trip request failed: %s', err)
             self.data = None
             self.error = 404
+            self._fall_back('find_trips_for_stop', *args, **kwargs)
         return self.data
 
+    @_measured
     def request_status_info(
             self, stop, publication_status="current"
-    ) -> AdditionalInfoResponse:
+    ) -> 'AdditionalInfoResponse':
         """
         find detailed status reports on potential, train works, delays for specified stops.
         """
         try:
-            req = self._instance.tfnsw_addinfo_request(
-                JSON_FORMAT, itd_l_pxx_sel_stop=stop, filter_publication_status=publication_status
-            )
+            args, kwargs = self._status_call(stop, publication_status)
+            req = self._request(*args, **kwargs)
             self.data = req
-            self.error = 404 if req.infos.current is None else 404
-        except MaxRetryError as err:
-            print(err)
-            self.data = None
-            self.error = 404
-        except ApiException as err:
-            print(err)
+            self.error = 404 if req.infos.current is None else 200
+        except upstream_errors() as err:  # server unreachable, rejected the request or too slow
+            logger.warning('additional info request failed: %s', err)
             self.data = None
             self.error = 404
         return self.data
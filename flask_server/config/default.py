@@ -1,3 +1,111 @@
 from os import environ
 
 TRIP_PLANNER_API_KEY= environ.get('TRIP_PLANNER_API_KEY')
+# base url of the api, eg. a local `benchmarks.fake_tfnsw` server, the swagger client's by default
+TRIP_PLANNER_HOST = environ.get('TRIP_PLANNER_HOST')
+
+# swagger instances kept warm per worker process
+TRIP_PLANNER_POOL_SIZE = int(environ.get('TRIP_PLANNER_POOL_SIZE', 4))
+TRIP_PLANNER_KEEP_ALIVE = environ.get('TRIP_PLANNER_KEEP_ALIVE', '1') == '1'
+# (connect, read) timeout in seconds for every call to the api
+TRIP_PLANNER_TIMEOUT = (
+    float(environ.get('TRIP_PLANNER_CONNECT_TIMEOUT', 3.05)),
+    float(environ.get('TRIP_PLANNER_READ_TIMEOUT', 10))
+)
+# times a call is retried after failing to connect (reads are never retried), and the
+# seconds a call waits for an identical one already in flight
+TRIP_PLANNER_RETRIES = int(environ.get('TRIP_PLANNER_RETRIES', 1))
+TRIP_PLANNER_DEADLINE = float(environ.get('TRIP_PLANNER_DEADLINE', 15))
+# api errors in a row failing an operation's calls at once, and for how many seconds
+CIRCUIT_BREAKER_ENABLED = environ.get('CIRCUIT_BREAKER_ENABLED', '1') == '1'
+CIRCUIT_BREAKER_FAILURES = int(environ.get('CIRCUIT_BREAKER_FAILURES', 5))
+CIRCUIT_BREAKER_RESET_AFTER = float(environ.get('CIRCUIT_BREAKER_RESET_AFTER', 30))
+# send a second, identical call when one of these operations is slower than the percentile of
+# its recent latencies, for at most a budget share of extra calls, using threads of its own
+HEDGE_ENABLED = environ.get('HEDGE_ENABLED', '0') == '1'
+HEDGE_OPERATIONS = [
+    operation.strip() for operation in environ.get(
+        'HEDGE_OPERATIONS', 'tfnsw_trip_request2,tfnsw_dm_request'
+    ).split(',') if operation.strip()
+]
+HEDGE_PERCENTILE = float(environ.get('HEDGE_PERCENTILE', 95))
+HEDGE_BUDGET = float(environ.get('HEDGE_BUDGET', 0.05))
+HEDGE_WORKERS = int(environ.get('HEDGE_WORKERS', 16))
+
+# in-process cache of api responses
+RESPONSE_CACHE_ENABLED = environ.get('RESPONSE_CACHE_ENABLED', '1') == '1'
+RESPONSE_CACHE_MAX_ENTRIES = int(environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+# estimated bytes of the responses it holds (trip responses weigh hundreds of KB), 0 for no limit
+RESPONSE_CACHE_MAX_BYTES = int(environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# 'memory' (per worker), 'sqlite' (shared by the workers of a host) or 'tiered' (both)
+RESPONSE_CACHE_BACKEND = environ.get('RESPONSE_CACHE_BACKEND', 'memory')
+RESPONSE_CACHE_PATH = environ.get('RESPONSE_CACHE_PATH', 'responses.db')
+RESPONSE_CACHE_SHARED_MAX_ENTRIES = int(environ.get('RESPONSE_CACHE_SHARED_MAX_ENTRIES', 10000))
+# seconds an expired response is still served (marked stale) while it is refreshed
+RESPONSE_CACHE_STALE_FOR = int(environ.get('RESPONSE_CACHE_STALE_FOR', 10 * 60))
+# seconds each api operation's responses are cached for
+RESPONSE_CACHE_TTLS = {
+    'tfnsw_stopfinder_request': int(environ.get('CACHE_TTL_STOPS', 6 * 60 * 60)),
+    'tfnsw_dm_request': int(environ.get('CACHE_TTL_DEPARTURES', 30)),
+    'tfnsw_trip_request2': int(environ.get('CACHE_TTL_TRIPS', 60)),
+    'tfnsw_addinfo_request': int(environ.get('CACHE_TTL_STATUS', 5 * 60)),
+}
+
+# latency histograms of the routes and api calls, and service counters, on /metrics
+METRICS_ENABLED = environ.get('METRICS_ENABLED', '1') == '1'
+# directory the workers of a host write their metrics to, so that a scrape reports them all
+METRICS_DIR = environ.get('METRICS_DIR', 'metrics')
+# profile requests sending the secret in an X-Profile header or `profile` argument, and a
+# random share of every request, writing collapsed stacks for flamegraphs to the directory
+PROFILE_SECRET = environ.get('PROFILE_SECRET')
+PROFILE_SAMPLE_RATE = float(environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = environ.get('PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL = float(environ.get('PROFILE_INTERVAL', 0.005))
+# trace a share of the requests into spans, kept in memory for /debug/traces ('memory')
+# or appended to a json lines file (its path). /debug/traces asks for the secret when set
+TRACING_ENABLED = environ.get('TRACING_ENABLED', '0') == '1'
+TRACING_SAMPLE_RATE = float(environ.get('TRACING_SAMPLE_RATE', 1))
+TRACING_SINK = environ.get('TRACING_SINK', 'memory')
+TRACING_BUFFER_SIZE = int(environ.get('TRACING_BUFFER_SIZE', 200))
+TRACING_SECRET = environ.get('TRACING_SECRET')
+
+# directory of the templates' compiled bytecode, shared by the worker processes and restarts
+TEMPLATE_CACHE_DIR = environ.get('TEMPLATE_CACHE_DIR', 'template_cache')
+
+# connections the asyncio serving mode (`flask_server.start_async`) opens to the api at once,
+# per worker
+ASYNC_CONNECTIONS = int(environ.get('ASYNC_CONNECTIONS', 100))
+
+# identical api calls made at the same time share one request
+SINGLE_FLIGHT_ENABLED = environ.get('SINGLE_FLIGHT_ENABLED', '1') == '1'
+
+# threads sending concurrent api calls per worker, and the seconds a route waits for them
+FAN_OUT_WORKERS = int(environ.get('FAN_OUT_WORKERS', 16))
+FAN_OUT_DEADLINE = float(environ.get('FAN_OUT_DEADLINE', 15))
+# stops per departure board request, and the api calls a board sends at once
+BOARD_MAX_STOPS = int(environ.get('BOARD_MAX_STOPS', 30))
+BOARD_CONCURRENCY = int(environ.get('BOARD_CONCURRENCY', 8))
+
+# parsed journeys kept per trip query for paging / concession changes
+JOURNEY_CACHE_MAX_ENTRIES = int(environ.get('JOURNEY_CACHE_MAX_ENTRIES', 256))
+JOURNEY_CACHE_TTL = int(environ.get('JOURNEY_CACHE_TTL', 60))
+
+# stops held by the autocomplete index, and an optional json / json lines file to seed it
+STOP_INDEX_MAX_STOPS = int(environ.get('STOP_INDEX_MAX_STOPS', 100000))
+STOP_INDEX_SEED = environ.get('STOP_INDEX_SEED')
+
+# directory of a timetable imported with `python -m flask_server.timetable.gtfs_import`,
+# used to answer stop / departure / trip lookups when the api fails
+TIMETABLE_PATH = environ.get('TIMETABLE_PATH')
+TIMETABLE_FALLBACK = environ.get('TIMETABLE_FALLBACK', '1') == '1'
+# most trips in a journey planned over the timetable
+TIMETABLE_MAX_TRIPS = int(environ.get('TIMETABLE_MAX_TRIPS', 5))
+
+# refresh the responses of the saved stops and trips in the background, most recently
+# viewed first, from the one worker of a host holding the lock file
+PREFETCH_ENABLED = environ.get('PREFETCH_ENABLED', '0') == '1'
+# api calls per minute, and seconds between rounds (moved randomly by up to the jitter share)
+PREFETCH_BUDGET_PER_MINUTE = int(environ.get('PREFETCH_BUDGET_PER_MINUTE', 20))
+PREFETCH_INTERVAL = float(environ.get('PREFETCH_INTERVAL', 60))
+PREFETCH_JITTER = float(environ.get('PREFETCH_JITTER', 0.2))
+PREFETCH_LOCK_PATH = environ.get('PREFETCH_LOCK_PATH', 'prefetch.lock')
@@ -12,7 +12,11 @@ class DepartureInfo:
     `seconds` int -> seconds to departure,
     `route`: str -> route origin,
     `dest`: str -> route destination,
+    `location`: str -> stop / platform departed from,
+    `stop_id`: str -> id of the location
     """
+    __slots__ = ('time_to_arrive', 'route', 'dest', 'stop_id', 'location')
+
     def __init__(self, *props):
         hours, minutes, seconds, route, dest, location, _id = props
         self.time_to_arrive = hours, minutes, seconds
@@ -35,4 +39,4 @@ class DepartureInfo:
         """
         returns class properties as dict, reserved for api usage
         """
-        return self.__dict__
+        return {prop: getattr(self, prop) for prop in self.__slots__}
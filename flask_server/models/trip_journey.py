@@ -21,7 +21,14 @@ class TripJourney:
     `arrival`: tuple -> tuple of time(str) of arrival (day, time),
 
     `stops`s: dict -> describes all stop information of trip, containing times
+
+    `coords`: list -> (lat, long) of every stop, tuples may be shared between journeys
     """
+    __slots__ = (
+        'total_fare', 'total_duration', 'departure', 'arrival', 'stops', 'coords',
+        'origin', 'destination'
+    )
+
     def __init__(self, *args):
 
         (
@@ -61,7 +68,7 @@ class TripJourney:
         """
         turn to a class object to a dictionary
         """
-        return self.__dict__
+        return {prop: getattr(self, prop) for prop in self.__slots__}
 
     def number_of_stops(self):
         """
@@ -0,0 +1,175 @@
+"""
+/api/v1 routes, json versions of the /stops and /trip pages.
+responses carry an ETag (answering If-None-Match with 304) and a Cache-Control
+max-age of the time the upstream data stays cached (`no-cache` when stale, `private`
+for the departures' countdowns, relative to the request time), `fields` selects the
+keys returned for each item eg. ?fields=route,dest. `stale` is true when the
+data expired and is being refreshed (the api may be down)
+"""
+import hashlib
+import json
+
+from flask import Blueprint, Response, request
+
+from flask_server import client as api
+from flask_server.routes.stops import find_board_departures
+from flask_server.routes.trips import find_journeys
+from flask_server.services.app_locals import VALID_TRANSPORT
+from flask_server.services.data_service import (
+    stop_information_generator, departure_info_generator,
+    status_info_generator, validate_date_time
+)
+
+try:  # optional, faster encoder: pip install trip_planner[fast-json]
+    import orjson
+except ImportError:
+    orjson = None
+
+API_BLUEPRINT = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def dumps(payload) -> bytes:
+    """
+    compact json encoding of a payload, with orjson when installed
+    """
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def json_response(payload, max_age=0.0, status=200, stale=False, private=False) -> Response:
+    """
+    json response for the current request, successful responses are conditional on
+    their ETag and may be cached for `max_age` seconds
+    :param stale: the payload is expired data being refreshed, caches must revalidate it
+    :param private: the payload is relative to the request time (countdowns), only
+    the client may cache it
+    """
+    body = dumps(payload)
+    response = Response(body, status=status, mimetype='application/json')
+    if status != 200:
+        response.cache_control.no_store = True
+        return response
+    response.set_etag(hashlib.sha1(body).hexdigest())
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    if stale:
+        response.cache_control.no_cache = True
+        max_age = 0
+    response.cache_control.max_age = int(max_age)
+    return response.make_conditional(request)
+
+
+def select_fields(items, fields=None) -> list:
+    """
+    dicts of items limited to `fields` (from the request's `fields` argument by default)
+    :param items: dicts
+    """
+    if fields is None:
+        fields = {field.strip() for field in request.args.get('fields', '').split(',')}
+        fields.discard('')
+    if not fields:
+        return list(items)
+    return [{key: value for key, value in item.items() if key in fields} for item in items]
+
+
+@API_BLUEPRINT.route('/stops')
+def get_stops():
+    """
+    :route: /api/v1/stops
+    stops matching key words, filtered like /stops
+    :return: json
+    """
+    query = request.args.get('query', '')
+    client = api.connection()
+    stops = client.find_stops_by_name('any', query)
+    if client.error == 404:
+        return json_response({'error': 404}, status=404)
+
+    is_suburb = bool(request.args.get('suburb', False))
+    selections = [
+        int(key) for key in VALID_TRANSPORT if request.args.get(str(key), False)
+    ]
+    data = stop_information_generator(stops.locations, selections, query, is_suburb)
+    return json_response({'stale': client.stale, 'stops': select_fields(
+        {'id': id_, 'name': name, 'coord': coord} for id_, name, coord in data
+    )}, client.max_age, stale=client.stale)
+
+
+@API_BLUEPRINT.route('/stops/departures/<id_>')
+def get_departures(id_: str):
+    """
+    :route: /api/v1/stops/departures/<id>
+    departures from a stop, optionally after `date` and `time`
+    :return: json
+    """
+    date_time = validate_date_time(request.args.get('date', ''), request.args.get('time', ''))
+    expected_type = request.args.get('expected_type', 'dep')
+    departures_client, stop_client = api.connection().gather(
+        lambda sibling: sibling.find_destinations_for(
+            'any', id_, expected_type, date_time=date_time
+        ),
+        lambda sibling: sibling.find_stops_by_name('any', id_, is_id=True)
+    )
+    if departures_client.error == 404:
+        return json_response({'error': 404}, status=404)
+    name = stop_client.data.locations[0].name if stop_client.error == 200 else id_
+    departures = departure_info_generator(departures_client.data, date_time)
+    return json_response({
+        'id': id_, 'name': name, 'stale': departures_client.stale,
+        'departures': select_fields(departure.to_dict() for departure in departures)
+    }, departures_client.max_age, stale=departures_client.stale, private=True)
+
+
+@API_BLUEPRINT.route('/stops/departures')
+def get_board_departures():
+    """
+    :route: /api/v1/stops/departures?ids=<id>,<id>
+    departures of several stops in departure order
+    :return: json
+    """
+    departures, ids, max_age, stale = find_board_departures()
+    if departures is None:
+        return json_response({'error': 404}, status=404)
+    date_time = validate_date_time(request.args.get('date', ''), request.args.get('time', ''))
+    departures_info = departure_info_generator(departures, date_time)
+    return json_response({
+        'ids': ids, 'stale': stale,
+        'departures': select_fields(departure.to_dict() for departure in departures_info)
+    }, max_age, stale=stale, private=True)
+
+
+@API_BLUEPRINT.route('/stops/status/<id_>')
+def get_status_info(id_: str):
+    """
+    :route: /api/v1/stops/status/<id>
+    status messages (track work, delays) of a stop
+    :return: json
+    """
+    client = api.connection()
+    client.request_status_info(id_)
+    if client.error == 404:
+        return json_response({'stale': False, 'statuses': []})
+    statuses = status_info_generator(client.data.infos.current)
+    return json_response({'stale': client.stale, 'statuses': select_fields(
+        {'priority': priority, 'title': title, 'content': content, 'from': from_time, 'to': to}
+        for priority, title, content, from_time, to in statuses
+    )}, client.max_age, stale=client.stale)
+
+
+@API_BLUEPRINT.route('/trip/journeys')
+def get_journeys():
+    """
+    :route: /api/v1/trip/journeys
+    every journey of a trip query, taking the arguments of /trip/journeys
+    :return: json
+    """
+    trips, max_age, stale = find_journeys()
+    if trips is None:
+        return json_response({'error': 404}, status=404)
+    concession_type = request.args.get('concession_type', 'ADULT')
+    return json_response({'stale': stale, 'journeys': select_fields(
+        trips.page(page_no, concession_type).to_dict() for page_no in range(len(trips))
+    )}, max_age, stale=stale)
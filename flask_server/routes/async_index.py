@@ -0,0 +1,46 @@
+"""
+Index / Home Page of the ASGI app, `routes.index` with a coroutine view,
+the saved items are read from sqlite off the event loop
+"""
+from quart import Blueprint, g, render_template
+
+from flask_server.client.async_client import blocking
+from flask_server.services.cache_class import Cache
+
+ASYNC_INDEX_BLUEPRINT = Blueprint('index', __name__)
+
+
+@ASYNC_INDEX_BLUEPRINT.before_request
+async def load_cache():
+    """
+    load up cache trips cache
+    """
+    g.trips_db = Cache('trips')
+    g.stops_db = Cache('stops')
+
+
+@ASYNC_INDEX_BLUEPRINT.route('/')
+async def home():
+    """## Home Page Route
+    Dashboard with sitemap
+    """
+    trips_db: Cache = g.trips_db
+    stops_db: Cache = g.stops_db
+
+    await blocking(trips_db.read_db)
+    await blocking(stops_db.read_db)
+
+    return await render_template(
+        'index.jinja2',
+        trips=trips_db.data[trips_db.key],
+        stops=stops_db.data[stops_db.key]
+    )
+
+
+@ASYNC_INDEX_BLUEPRINT.teardown_request
+async def teardown_current_context(_):
+    """
+    delete cache instance after request completion
+    """
+    g.pop('trips_db', None)
+    g.pop('stops_db', None)
@@ -0,0 +1,70 @@
+"""
+/metrics route of the ASGI app, `routes.metrics` with coroutine views.
+records the latency of every request until its response is built, the
+snapshots of the workers are written and read off the event loop
+"""
+import asyncio
+import logging
+from time import perf_counter
+
+from quart import Blueprint, Response, current_app, g, request
+
+from flask_server.client.async_client import blocking
+
+logger = logging.getLogger(__name__)
+
+ASYNC_METRICS_BLUEPRINT = Blueprint('metrics', __name__)
+# the snapshot being written, at most one at a time
+_dumping = set()
+
+
+def _dumped(future: asyncio.Future):
+    """
+    forget a finished snapshot write, logging its error
+    """
+    _dumping.discard(future)
+    if not future.cancelled() and future.exception() is not None:
+        logger.error('writing the metrics snapshot failed', exc_info=future.exception())
+
+
+@ASYNC_METRICS_BLUEPRINT.before_app_request
+async def start_timer():
+    """
+    note when the request started
+    """
+    g.request_started = perf_counter()
+
+
+@ASYNC_METRICS_BLUEPRINT.after_app_request
+async def record_latency(response):
+    """
+    record the request's latency by route, method and status
+    """
+    metrics = current_app.extensions.get('metrics')
+    started = g.get('request_started')
+    if metrics is None or started is None:
+        return response
+    labels = (
+        ('route', request.url_rule.rule if request.url_rule is not None else 'unmatched'),
+        ('method', request.method), ('status', str(response.status_code))
+    )
+    metrics.observe(
+        'request_seconds', labels, perf_counter() - started, 'latency of the requests by route'
+    )
+    if metrics.dump_due() and not _dumping:
+        future = asyncio.get_event_loop().run_in_executor(None, metrics.dump)
+        _dumping.add(future)
+        future.add_done_callback(_dumped)
+    return response
+
+
+@ASYNC_METRICS_BLUEPRINT.route('/metrics')
+async def get_metrics():
+    """
+    :route: /metrics
+    :return: prometheus text
+    """
+    metrics = current_app.extensions.get('metrics')
+    if metrics is None:
+        return Response('metrics are disabled\n', status=404, mimetype='text/plain')
+    return Response(await blocking(metrics.render), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,199 @@
+"""
+/stops route of the ASGI app, `routes.stops` with coroutine views
+"""
+from types import SimpleNamespace
+from typing import List, Optional
+
+from quart import Blueprint, current_app, g, jsonify, redirect, render_template, request
+
+from flask_server.client import async_client as api
+from flask_server.services.app_locals import VALID_TRANSPORT
+from flask_server.services.cache_class import Cache
+from flask_server.services.data_service import (
+    departures_by_location, status_info_generator, stop_information_generator,
+    validate_date_time
+)
+from flask_server.services.prefetch import STOPS, record_access
+
+ASYNC_STOP_BLUEPRINT = Blueprint('stops', __name__, url_prefix='/stops')
+
+
+@ASYNC_STOP_BLUEPRINT.before_request
+async def create_stop_db():
+    """
+    instantiate cache connection to the stops database
+    """
+    g.stop_db = Cache('stops')
+
+
+async def find_board_departures() -> (Optional[SimpleNamespace], List[str], float, bool):
+    """
+    `routes.stops.find_board_departures`, the stops are queried on the event loop
+    :return: (departures or None when no stop was found, stop ids queried,
+    seconds the departures stay cached, whether some departures are stale)
+    """
+    ids = [
+        id_.strip() for value in request.args.getlist('ids') + request.args.getlist('id')
+        for id_ in value.split(',')
+    ]
+    ids = list(dict.fromkeys(id_ for id_ in ids if id_))
+    ids = ids[:current_app.config.get('BOARD_MAX_STOPS', 30)]
+    # a stop's departures include those of its platforms
+    stop_index = current_app.extensions['stop_index']
+    requested = set(ids)
+    ids = [id_ for id_ in ids if stop_index.parent_of(id_) not in requested]
+
+    date_time = validate_date_time(request.args.get('date', ''), request.args.get('time', ''))
+    expected_type = request.args.get('expected_type', 'dep')
+    clients = await api.connection().gather(
+        *(
+            lambda sibling, stop=stop: sibling.find_destinations_for(
+                'any', stop, expected_type, date_time=date_time
+            ) for stop in ids
+        ),
+        limit=current_app.config.get('BOARD_CONCURRENCY', 8)
+    )
+    found = [client for client in clients if client.error == 200]
+    if not found:
+        return None, ids, 0.0, False
+    events, seen = [], set()
+    for client in found:
+        for event in client.data.stop_events:
+            key = event.location.id, event.transportation.number, event.departure_time_planned
+            if key not in seen:
+                seen.add(key)
+                events.append(event)
+    events.sort(key=lambda event: event.departure_time_planned or '')
+    return (
+        SimpleNamespace(stop_events=events), ids, min(client.max_age for client in found),
+        any(client.stale for client in found)
+    )
+
+
+@ASYNC_STOP_BLUEPRINT.route('/departures')
+async def get_board_departures():
+    """
+    :route: /stops/departures?ids=<id>,<id>
+    departure board of several stops, grouped by location like `get_departures`
+    """
+    departures, ids, _, stale = await find_board_departures()
+    if departures is None:
+        return await render_template("404.jinja2")
+    date_time = validate_date_time(request.args.get('date', ''), request.args.get('time', ''))
+    return await render_template(
+        "departures.jinja2", departures_info=departures_by_location(departures, date_time),
+        id=','.join(ids), name='Departure Board', date_time=date_time, board=True,
+        stale=stale
+    )
+
+
+@ASYNC_STOP_BLUEPRINT.route('/departures/<id_>')
+async def get_departures(id_: str):
+    """
+    get departures for a certain stop ID
+    """
+    client = api.connection()
+    date_time = validate_date_time(request.args.get('date', ''), request.args.get('time', ''))
+    expected_type = request.args.get('expected_type', 'dep')
+    # look up the stop name alongside its departures
+    departures_client, stop_client = await client.gather(
+        lambda sibling: sibling.find_destinations_for(
+            'any', id_, expected_type, date_time=date_time
+        ),
+        lambda sibling: sibling.find_stops_by_name('any', id_, is_id=True)
+    )
+    if departures_client.error == 404:
+        return await render_template("404.jinja2")
+    await api.blocking(record_access, STOPS, id_, current_app)
+    name = stop_client.data.locations[0].name if stop_client.error == 200 else id_
+    return await render_template(
+        "departures.jinja2",
+        departures_info=departures_by_location(departures_client.data, date_time),
+        id=id_, name=name, date_time=date_time, stale=departures_client.stale
+    )
+
+
+@ASYNC_STOP_BLUEPRINT.route('/status/<id_>')
+async def get_status_info(id_):
+    """
+    get status info from ID
+    """
+    client = api.connection()
+    response = await client.request_status_info(id_)
+    if client.error == 404:
+        return await render_template('statuses.jinja2', statuses=[])
+    await api.blocking(record_access, STOPS, id_, current_app)
+    return await render_template(
+        'statuses.jinja2', statuses=status_info_generator(response.infos.current),
+        stale=client.stale
+    )
+
+
+@ASYNC_STOP_BLUEPRINT.route('/autocomplete')
+async def autocomplete():
+    """
+    :route: /stops/autocomplete
+    stops matching partially typed key words as json, see `routes.stops.autocomplete`
+    """
+    query = request.args.get('query', '').strip()
+    limit = min(max(1, request.args.get('limit', 10, type=int)), 50)
+    selections = [
+        int(key) for key in VALID_TRANSPORT if request.args.get(str(key), False)
+    ]
+    if len(query) < 2:
+        return jsonify(query=query, results=[])
+
+    stop_index = current_app.extensions['stop_index']
+    results = stop_index.search(query, limit, selections)
+    if not results:
+        # adds the stops found to the index
+        await api.connection().find_stops_by_name('any', query)
+        results = stop_index.search(query, limit, selections)
+    return jsonify(query=query, results=results)
+
+
+@ASYNC_STOP_BLUEPRINT.route('/save', methods=['POST'])
+async def save_stop():
+    """
+    save stop information into db
+    """
+    form = await request.form
+    stop_id, stop_name = form.get('id', ''), form.get('name', '')
+    if stop_id and stop_name:
+        await api.blocking(g.stop_db.write_db, (stop_id, stop_name))
+    return redirect('/')
+
+
+@ASYNC_STOP_BLUEPRINT.route('')
+async def get_stop_information():
+    """
+    :route: /stops
+    returns a list of stops from entered key words
+    """
+    client = api.connection()
+    req = request.args.get('query', '')
+    stops = await client.find_stops_by_name('any', req)
+    if client.error == 404:
+        return await render_template(
+            'stops.jinja2', data=[], selected_type=[], date=False, time=False
+        ), 404
+
+    is_suburb = bool(request.args.get('suburb', False))  # convert input to boolean
+    selections = [
+        int(request.args.get(str(key), False))
+        for key in VALID_TRANSPORT if int(request.args.get(str(key), False))
+    ]
+    return await render_template(
+        'stops.jinja2',
+        data=stop_information_generator(stops.locations, selections, req, is_suburb),
+        selected_type=selections, date=request.args.get('date', ''),
+        time=request.args.get('time', ''), stale=client.stale
+    )
+
+
+@ASYNC_STOP_BLUEPRINT.teardown_request
+async def teardown_stops_db(_):
+    """
+    delete connection to db after request
+    """
+    g.pop('stop_db', None)
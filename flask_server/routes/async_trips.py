@@ -0,0 +1,137 @@
+"""
+/trips route of the ASGI app, `routes.trips` with coroutine views
+"""
+from typing import Optional
+
+from quart import Blueprint, current_app, g, redirect, render_template, request
+
+from flask_server.client import async_client as api
+from flask_server.services.cache_class import Cache
+from flask_server.services.data_service import stop_information_generator, validate_date_time
+from flask_server.services.journey_cache import JourneyResults
+from flask_server.services.prefetch import TRIPS, record_access
+
+ASYNC_TRIP_BLUEPRINT = Blueprint('trips', __name__, url_prefix='/trip')
+
+
+@ASYNC_TRIP_BLUEPRINT.before_request
+async def load_trips():
+    """
+    instantiate trips cache
+    """
+    g.trip_db = Cache('trips')
+
+
+async def find_journeys() -> (Optional[JourneyResults], float, bool):
+    """
+    `routes.trips.find_journeys` querying the api on the event loop
+    (journeys of the offline timetable are planned by the blocking app)
+    :return: (journeys or None when the query failed, seconds the journeys stay cached,
+    whether the journeys are stale)
+    """
+    type_origin, origin = request.args.get('originType', 'any'), request.args.get('origin', '')
+    type_dest, destination = request.args.get('destType', 'any'), request.args.get('dest', '')
+    dep = request.args.get('dep', 'dep')  # enable user to query departure or arrival times
+    date = request.args.get('date', '')
+    time = request.args.get('time', '')
+
+    date_time = validate_date_time(date, time) if date and time else None
+    journey_cache = current_app.extensions['journey_cache']
+    key = ('journeys', 'api', type_origin, origin, type_dest, destination, dep, date_time or 'now')
+    trips = journey_cache.get(key)
+    if trips is None:
+        client = api.connection()
+        if date_time is None:
+            response = await client.find_trips_for_stop(
+                (type_origin, origin), (type_dest, destination), dep
+            )
+        else:
+            response = await client.find_trips_for_stop(
+                (type_origin, origin), (type_dest, destination), dep, date_time=date_time
+            )
+        if client.error == 404:
+            return None, 0.0, False
+        trips = JourneyResults(response.journeys)
+        if client.stale:
+            return trips, 0.0, True
+        journey_cache.set(key, trips)
+    return trips, journey_cache.time_left(key), False
+
+
+@ASYNC_TRIP_BLUEPRINT.route('/journeys')
+async def get_trip_info():
+    """
+    :route: /journeys
+    returns a list of journeys for a specified trip
+    """
+    origin = request.args.get('origin', '')
+    destination = request.args.get('dest', '')
+    page = int(request.args.get('page', '1')) - 1
+    concession_type = request.args.get('concession_type', 'ADULT')
+
+    trips, _, stale = await find_journeys()
+    if trips is None:
+        return await render_template("404.jinja2"), 404
+    await api.blocking(record_access, TRIPS, f'{origin}>{destination}', current_app)
+
+    return await render_template(
+        'journeys.jinja2', trip=trips.page(page, concession_type), pages=len(trips),
+        page_no=page, destination=destination, origin=origin,
+        concession_type=concession_type, stale=stale
+    )
+
+
+@ASYNC_TRIP_BLUEPRINT.route('/planner')
+async def plan_trip():
+    """
+    route for trip planning
+    """
+    origins = []
+    destinations = []
+
+    origin_stop = request.args.get('origin', False)
+    destination_stop = request.args.get('destination', False)
+    origin_is_suburb = bool(request.args.get('origin_suburb', False))
+    dest_is_suburb = bool(request.args.get('dest_suburb', False))
+    if origin_stop and destination_stop:
+        # resolve origin and destination at the same time
+        origins, destinations = await api.connection().gather(
+            lambda sibling: sibling.find_stops_by_name('any', origin_stop, True),
+            lambda sibling: sibling.find_stops_by_name('any', destination_stop, True)
+        )
+        if 404 in (origins.error, destinations.error):
+            return await render_template(
+                "trip-planner.jinja2", origins=[], destinations=[], err=404
+            )
+        origins = stop_information_generator(
+            origins.data.locations, [], origin_stop, origin_is_suburb
+        )
+        destinations = stop_information_generator(
+            destinations.data.locations, [], destination_stop, dest_is_suburb
+        )
+
+    return await render_template(
+        "trip-planner.jinja2", origins=origins, destinations=destinations, err=200
+    )
+
+
+@ASYNC_TRIP_BLUEPRINT.route('/save', methods=['POST'])
+async def save_journey():
+    """
+    save a journey by name
+    """
+    form = await request.form
+    destination = form.get('destination_id', ''), form.get('destination_name', '')
+    origin = form.get('origin_id', ''), form.get('origin_name', '')
+    if '' not in destination or '' not in origin:
+        trip_db: Cache = g.trip_db
+        await api.blocking(trip_db.write_db, (origin, destination))
+    return redirect('/')
+
+
+@ASYNC_TRIP_BLUEPRINT.teardown_request
+async def teardown_trips(_):
+    """
+    remove trips database instance after request completion
+    """
+    g.pop('trip_db', None)
@@ -0,0 +1,52 @@
+"""
+/metrics route, prometheus metrics of the workers (see `services.metrics`).
+records the latency of every request, until its response (streamed or not) is sent
+"""
+from time import perf_counter
+
+from flask import Blueprint, Response, current_app, g, request
+
+METRICS_BLUEPRINT = Blueprint('metrics', __name__)
+
+
+@METRICS_BLUEPRINT.before_app_request
+def start_timer():
+    """
+    note when the request started
+    """
+    g.request_started = perf_counter()
+
+
+@METRICS_BLUEPRINT.after_app_request
+def record_latency(response):
+    """
+    record the request's latency by route, method and status once its response is sent
+    """
+    metrics = current_app.extensions.get('metrics')
+    started = g.get('request_started')
+    if metrics is None or started is None:
+        return response
+    labels = (
+        ('route', request.url_rule.rule if request.url_rule is not None else 'unmatched'),
+        ('method', request.method), ('status', str(response.status_code))
+    )
+
+    def observe():
+        metrics.observe(
+            'request_seconds', labels, perf_counter() - started, 'latency of the requests by route'
+        )
+        metrics.dump()
+    response.call_on_close(observe)
+    return response
+
+
+@METRICS_BLUEPRINT.route('/metrics')
+def get_metrics():
+    """
+    :route: /metrics
+    :return: prometheus text
+    """
+    metrics = current_app.extensions.get('metrics')
+    if metrics is None:
+        return Response('metrics are disabled\n', status=404, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
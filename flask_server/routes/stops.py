@@ -1,17 +1,20 @@
 """
 /stops route
 """
-from flask import request, render_template, redirect, Blueprint, g
+from types import SimpleNamespace
+from typing import List, Optional
+
+from flask import request, render_template, redirect, Blueprint, g, current_app, jsonify
 
 from flask_server import client as api
 from flask_server.services.app_locals import VALID_TRANSPORT
 from flask_server.services.cache_class import Cache
+from flask_server.services.prefetch import record_access, STOPS
 from flask_server.services.data_service import (
-    stop_information_generator, departure_info_generator,
+    stop_information_generator, departures_by_location,
     status_info_generator,
     validate_date_time)
-
-
+from flask_server.services.streaming import stream_template
 
 STOP_BLUEPRINT = Blueprint('stops', __name__, url_prefix='/stops')
 
@@ -19,12 +22,76 @@ STOP_BLUEPRINT = Blueprint('stops', __name__, url_prefix='/stops')
 @STOP_BLUEPRINT.before_request
 def create_stop_db():
     """
-    instantiate cache connection to stops.json (stub)
+    instantiate cache connection to the stops database
     :return:
     """
     g.stop_db = Cache('stops')
 
 
+def find_board_departures() -> (Optional[SimpleNamespace], List[str], float, bool):
+    """
+    departures of every stop in the current request's `ids` (comma separated)
+    and `id` arguments, for departure boards. duplicate ids and platforms of
+    requested stops are dropped, the stops are queried concurrently under one
+    deadline and their departures merged in departure order
+    :return: (departures or None when no stop was found, stop ids queried,
+    seconds the departures stay cached, whether some departures are stale)
+    """
+    ids = [
+        id_.strip() for value in request.args.getlist('ids') + request.args.getlist('id')
+        for id_ in value.split(',')
+    ]
+    ids = list(dict.fromkeys(id_ for id_ in ids if id_))
+    ids = ids[:current_app.config.get('BOARD_MAX_STOPS', 30)]
+    # a stop's departures include those of its platforms
+    stop_index = current_app.extensions['stop_index']
+    requested = set(ids)
+    ids = [id_ for id_ in ids if stop_index.parent_of(id_) not in requested]
+
+    date_time = validate_date_time(request.args.get('date', ''), request.args.get('time', ''))
+    expected_type = request.args.get('expected_type', 'dep')
+    clients = api.connection().gather(
+        *(
+            lambda sibling, stop=stop: sibling.find_destinations_for(
+                'any', stop, expected_type, date_time=date_time
+            ) for stop in ids
+        ),
+        limit=current_app.config.get('BOARD_CONCURRENCY', 8)
+    )
+    found = [client for client in clients if client.error == 200]
+    if not found:
+        return None, ids, 0.0, False
+    events, seen = [], set()
+    for client in found:
+        for event in client.data.stop_events:
+            key = event.location.id, event.transportation.number, event.departure_time_planned
+            if key not in seen:
+                seen.add(key)
+                events.append(event)
+    events.sort(key=lambda event: event.departure_time_planned or '')
+    return (
+        SimpleNamespace(stop_events=events), ids, min(client.max_age for client in found),
+        any(client.stale for client in found)
+    )
+
+
+@STOP_BLUEPRINT.route('/departures')
+def get_board_departures():
+    """
+    :route: /stops/departures?ids=<id>,<id>
+    departure board of several stops, grouped by location like `get_departures`
+    """
+    departures, ids, _, stale = find_board_departures()
+    if departures is None:
+        return render_template("404.jinja2")
+    date_time = validate_date_time(request.args.get('date', ''), request.args.get('time', ''))
+    return stream_template(
+        "departures.jinja2", departures_info=departures_by_location(departures, date_time),
+        id=','.join(ids), name='Departure Board', date_time=date_time, board=True,
+        stale=stale
+    )
+
+
 @STOP_BLUEPRINT.route('/departures/<id_>')
 def get_departures(id_: str):
     """
@@ -37,23 +104,23 @@ def get_departures(id_: str):
     date_time = validate_date_time(date, time)
 
     expected_type = request.args.get('expected_type', 'dep')
-    departures = client.find_destinations_for(
-        'any', id_, expected_type, date_time=date_time
+    # look up the stop name alongside its departures
+    departures_client, stop_client = client.gather(
+        lambda sibling: sibling.find_destinations_for(
+            'any', id_, expected_type, date_time=date_time
+        ),
+        lambda sibling: sibling.find_stops_by_name('any', id_, is_id=True)
     )
-    if client.error == 404:
+    if departures_client.error == 404:
         return render_template("404.jinja2")
-    departures_info = departure_info_generator(departures, date_time)
-    sorted_departures = {}
-    for departure in departures_info:
-        location_key = sorted_departures.get(departure.location, False)
-        if not location_key:
-            sorted_departures[departure.location] = []
-        sorted_departures[departure.location].append(departure)
-    name = client.find_stops_by_name('any', id_, is_id=True).locations[0].name
-
-    return render_template(
-        "departures.jinja2", departures_info=sorted_departures, id=id_, name=name,
-        date_time=date_time
+    record_access(STOPS, id_)
+    # departures are grouped by location as the page streams
+    departures_info = departures_by_location(departures_client.data, date_time)
+    name = stop_client.data.locations[0].name if stop_client.error == 200 else id_
+
+    return stream_template(
+        "departures.jinja2", departures_info=departures_info, id=id_, name=name,
+        date_time=date_time, stale=departures_client.stale
     )
 
 
@@ -65,12 +132,38 @@ def get_status_info(id_):
     :return: View
     """
     client = api.connection()
-    statuses = client.request_status_info(id_).infos.current
+    response = client.request_status_info(id_)
     if client.error == 404:
         return render_template('statuses.jinja2', statuses=[])
+    record_access(STOPS, id_)
+
+    statuses = status_info_generator(response.infos.current)
+    return stream_template('statuses.jinja2', statuses=statuses, stale=client.stale)
+
+
+@STOP_BLUEPRINT.route('/autocomplete')
+def autocomplete():
+    """
+    :route: /stops/autocomplete
+    returns stops matching partially typed key words as json, from the local
+    stop index, the api is only queried when the index has no match
+    :return: json
+    """
+    query = request.args.get('query', '').strip()
+    limit = min(max(1, request.args.get('limit', 10, type=int)), 50)
+    selections = [
+        int(key) for key in VALID_TRANSPORT if request.args.get(str(key), False)
+    ]
+    if len(query) < 2:
+        return jsonify(query=query, results=[])
 
-    statuses = status_info_generator(statuses)
-    return render_template('statuses.jinja2', statuses=statuses)
+    stop_index = current_app.extensions['stop_index']
+    results = stop_index.search(query, limit, selections)
+    if not results:
+        # adds the stops found to the index
+        api.connection().find_stops_by_name('any', query)
+        results = stop_index.search(query, limit, selections)
+    return jsonify(query=query, results=results)
 
 
 @STOP_BLUEPRINT.route('/save', methods=['POST'])
@@ -113,9 +206,9 @@ def get_stop_information():
 
     locations = stops.locations
     data = stop_information_generator(locations, selections, req, is_suburb)
-    return render_template(
+    return stream_template(
         'stops.jinja2', data=data, selected_type=selections,
-        date=date, time=time
+        date=date, time=time, stale=client.stale
     )
 
 
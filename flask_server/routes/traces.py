@@ -0,0 +1,28 @@
+"""
+/debug/traces route, the most recent request traces of the worker answering
+"""
+import hmac
+
+from flask import Blueprint, current_app, jsonify, request
+
+from flask_server.services.tracing import RingBufferSink
+
+TRACES_BLUEPRINT = Blueprint('traces', __name__, url_prefix='/debug')
+
+
+@TRACES_BLUEPRINT.route('/traces')
+def get_traces():
+    """
+    :route: /debug/traces?limit=<n>
+    traces kept in memory (`TRACING_SINK=memory`), most recent first
+    :return: json
+    """
+    sink = current_app.extensions.get('traces')
+    secret = current_app.config.get('TRACING_SECRET')
+    given = request.headers.get('X-Trace-Secret', '')
+    if not isinstance(sink, RingBufferSink) or (
+            secret and not hmac.compare_digest(given.encode(), secret.encode())
+    ):
+        return jsonify(error=404), 404
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify(traces=sink.traces(limit))
@@ -1,12 +1,17 @@
 """
 /trips route
 """
-from flask import request, render_template, Blueprint, g, redirect
+from typing import Optional
+
+from flask import request, render_template, Blueprint, g, redirect, current_app
 
 from flask_server import client as api
 from flask_server.services.cache_class import Cache
+from flask_server.services.journey_cache import JourneyResults
+from flask_server.services.prefetch import record_access, TRIPS
+from flask_server.services.tracing import span
 from flask_server.services.data_service import (
-    trip_journeys_generator, stop_information_generator, validate_date_time
+    stop_information_generator, validate_date_time
 )
 TRIP_BLUEPRINT = Blueprint('trips', __name__, url_prefix='/trip')
 
@@ -20,12 +25,12 @@ def load_trips():
     g.trip_db = Cache('trips')
 
 
-@TRIP_BLUEPRINT.route('/journeys')
-def get_trip_info():
+def find_journeys() -> (Optional[JourneyResults], float, bool):
     """
-    :route: /journeys
-    returns a list of journeys for a specified trip
-    :return:
+    journeys for the trip query in the current request's arguments, kept per query
+    so that other pages and concession types reuse them (stale journeys are not kept)
+    :return: (journeys or None when the query failed, seconds the journeys stay cached,
+    whether the journeys are stale)
     """
     type_origin, origin = (
         request.args.get('originType', 'any'),
@@ -36,31 +41,59 @@ def get_trip_info():
         request.args.get('destType', 'any'),
         request.args.get('dest', '')
     )
-    page = int(request.args.get('page', '1')) - 1
     dep = request.args.get('dep', 'dep')  # enable user to query departure or arrival times
     date = request.args.get('date', '')
     time = request.args.get('time', '')
-    concession_type = request.args.get('concession_type', 'ADULT')
+    # 'local' plans the journeys over the offline timetable instead of the api
+    engine = request.args.get('engine', 'api')
 
-    client = api.connection()
-    if not date or not time:
-        trips = client.find_trips_for_stop(
-            (type_origin, origin), (type_dest, destination), dep
-        )
-    else:
-        date_time = validate_date_time(date, time)
+    date_time = validate_date_time(date, time) if date and time else None
+    journey_cache = current_app.extensions['journey_cache']
+    key = (
+        'journeys', engine, type_origin, origin, type_dest, destination, dep, date_time or 'now'
+    )
+    trips = journey_cache.get(key)
+    if trips is None:
+        client = (engine == 'local' and api.timetable_connection()) or api.connection()
+        if date_time is None:
+            response = client.find_trips_for_stop(
+                (type_origin, origin), (type_dest, destination), dep
+            )
+        else:
+            response = client.find_trips_for_stop(
+                (type_origin, origin), (type_dest, destination), dep, date_time=date_time
+            )
+        if client.error == 404:
+            return None, 0.0, False
+        with span('journey_results', journeys=len(response.journeys)):
+            trips = JourneyResults(response.journeys)
+        if client.stale:
+            return trips, 0.0, True
+        journey_cache.set(key, trips)
+    return trips, journey_cache.time_left(key), False
 
-        trips = client.find_trips_for_stop(
-            (type_origin, origin), (type_dest, destination), dep, date_time=date_time
-        )
-    if client.error == 404:
-        return render_template("404.jinja2"), 404
 
-    trips = list(trip_journeys_generator(trips.journeys, concession_type))
+@TRIP_BLUEPRINT.route('/journeys')
+def get_trip_info():
+    """
+    :route: /journeys
+    returns a list of journeys for a specified trip
+    :return:
+    """
+    origin = request.args.get('origin', '')
+    destination = request.args.get('dest', '')
+    page = int(request.args.get('page', '1')) - 1
+    concession_type = request.args.get('concession_type', 'ADULT')
+
+    trips, _, stale = find_journeys()
+    if trips is None:
+        return render_template("404.jinja2"), 404
+    record_access(TRIPS, f'{origin}>{destination}')
 
     return render_template(
-        'journeys.jinja2', trip=trips[page], pages=len(trips), page_no=page,
-        destination=destination, origin=origin, concession_type=concession_type
+        'journeys.jinja2', trip=trips.page(page, concession_type), pages=len(trips),
+        page_no=page, destination=destination, origin=origin,
+        concession_type=concession_type, stale=stale
     )
 
 
@@ -80,24 +113,21 @@ def plan_trip():
     dest_is_suburb = bool(dest_is_suburb)
     if origin_stop and destination_stop:
         client = api.connection()
-        origins = client.find_stops_by_name('any', origin_stop, True)
-
-        if client.error == 404:
-            render_template(
-                "trip-planner.jinja2", origins=[], destinations=[], err=404
-            )
-
-        destinations = client.find_stops_by_name('any', destination_stop, True)
-        if client.error == 404:
-            render_template(
+        # resolve origin and destination at the same time
+        origins, destinations = client.gather(
+            lambda sibling: sibling.find_stops_by_name('any', origin_stop, True),
+            lambda sibling: sibling.find_stops_by_name('any', destination_stop, True)
+        )
+        if 404 in (origins.error, destinations.error):
+            return render_template(
                 "trip-planner.jinja2", origins=[], destinations=[], err=404
             )
 
         origins = stop_information_generator(
-            origins.locations, [], origin_stop, origin_is_suburb
+            origins.data.locations, [], origin_stop, origin_is_suburb
         )
         destinations = stop_information_generator(
-            destinations.locations, [], destination_stop, dest_is_suburb
+            destinations.data.locations, [], destination_stop, dest_is_suburb
         )
 
     return render_template(
@@ -117,7 +147,6 @@ def save_journey():
         trip_db: Cache = g.trip_db
         trip_db.read_db()
         trip_db.write_db((origin, destination))
-        print(trip_db.data)
     return redirect('/')
 
 
@@ -0,0 +1,157 @@
+"""
+non-blocking calls to the trip planner api for the asyncio serving mode: the
+swagger operations are sent with one aiohttp session per worker process and
+their responses deserialized into the same swagger models as the blocking client's
+(requires the `async` extra)
+"""
+import asyncio
+from types import SimpleNamespace
+
+import aiohttp
+
+from flask_server.services.swagger_instance import api_exception
+from flask_server.services.tracing import span
+
+DEFAULT_HOST = 'https://api.transport.nsw.gov.au/v1/tp'
+
+# operation: (path, response model, query parameters of the positional arguments)
+OPERATIONS = {
+    'tfnsw_stopfinder_request': (
+        '/stop_finder', 'StopFinderResponse',
+        ('outputFormat', 'type_sf', 'name_sf', 'coordOutputFormat')
+    ),
+    'tfnsw_dm_request': (
+        '/departure_mon', 'DepartureMonitorResponse',
+        (
+            'outputFormat', 'coordOutputFormat', 'type_dm', 'name_dm',
+            'departureMonitorMacro', 'itdDate', 'itdTime'
+        )
+    ),
+    'tfnsw_trip_request2': (
+        '/trip', 'TripRequestResponse',
+        (
+            'outputFormat', 'coordOutputFormat', 'depArrMacro', 'itdDate', 'itdTime',
+            'type_origin', 'name_origin', 'type_destination', 'name_destination'
+        )
+    ),
+    'tfnsw_addinfo_request': ('/add_info', 'AdditionalInfoResponse', ('outputFormat',)),
+}
+# query parameters of the keyword arguments, as the swagger client names them
+QUERY_NAMES = {
+    'version': 'version', 'mode': 'mode', 'tf_nswsf': 'TfNSWSF', 'tf_nswdm': 'TfNSWDM',
+    'tf_nswtr': 'TfNSWTR', 'calc_number_of_trips': 'calcNumberOfTrips',
+    'itd_l_pxx_sel_stop': 'itdLPxx_selStop', 'filter_publication_status': 'filterPublicationStatus',
+}
+
+
+class AsyncApi:
+    """
+    Process wide sender of api calls from coroutines, over one aiohttp session
+        :var host: base url of the api
+        :var timeout: per call timeout, (connect, read) or total seconds
+        :var retries: times a call is retried after failing to connect
+        :var connections: most connections open to the api at once
+        :var calls: int -> calls sent
+        :methods
+            start
+            close
+            call
+            stats
+    """
+    def __init__(
+            self, api_key, host=None, timeout=None, retries=None, connections=100
+    ):
+        self.api_key = api_key
+        self.host = (host or DEFAULT_HOST).rstrip('/')
+        self.timeout = timeout
+        self.retries = retries or 0
+        self.connections = connections
+        self.calls = 0
+        self._session = None
+        # only used to deserialize responses, never sends a request
+        self._deserializer = None
+
+    def _client_timeout(self) -> aiohttp.ClientTimeout:
+        if isinstance(self.timeout, (tuple, list)):
+            connect, read = self.timeout
+            return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        return aiohttp.ClientTimeout(total=self.timeout)
+
+    async def start(self):
+        """
+        open the session, from the event loop of the worker serving requests
+        """
+        if self._deserializer is None:
+            # pylint: disable=import-outside-toplevel
+            from swagger_client.api_client import ApiClient
+            self._deserializer = ApiClient()
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections),
+                timeout=self._client_timeout(),
+                # the token is sent as the swagger client sends its access token
+                headers={'Authorization': f'Bearer {self.api_key}', 'Accept': 'application/json'},
+            )
+
+    async def close(self):
+        """
+        close the session and its connections
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _params(self, operation: str, args: tuple, kwargs: dict) -> (str, str, dict):
+        path, response_type, names = OPERATIONS[operation]
+        params = dict(zip(names, args))
+        params.update(
+            (QUERY_NAMES[name], value) for name, value in kwargs.items() if value is not None
+        )
+        return self.host + path, response_type, {
+            name: str(value).lower() if isinstance(value, bool) else str(value)
+            for name, value in params.items()
+        }
+
+    async def _get(self, url: str, params: dict) -> str:
+        """
+        body of a successful call, connecting at most `retries` + 1 times
+        :raises: ApiException when the api answers with an error
+        """
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                async with self._session.get(url, params=params) as response:
+                    body = await response.text()
+                    if response.status >= 400:
+                        raise api_exception()(status=response.status, reason=response.reason)
+                    return body
+            except aiohttp.ClientConnectorError:
+                if attempts > self.retries:
+                    raise
+
+    async def call(self, operation: str, *args, **kwargs):
+        """
+        send a swagger operation eg. 'tfnsw_dm_request' with the swagger method's arguments
+        :return: the swagger model of the response
+        :raises: ApiException (rejected), aiohttp.ClientError (unreachable),
+        TimeoutError (too slow)
+        """
+        await self.start()
+        url, response_type, params = self._params(operation, args, kwargs)
+        self.calls += 1
+        try:
+            body = await self._get(url, params)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f'{operation} timed out') from None
+        with span('swagger.deserialize'):
+            return self._deserializer.deserialize(SimpleNamespace(data=body), response_type)
+
+    def stats(self) -> dict:
+        """
+        returns call counters
+        """
+        return {
+            'calls': self.calls,
+            'connections': self.connections,
+        }
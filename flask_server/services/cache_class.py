@@ -1,50 +1,180 @@
 """
-contains definition to our cache class (json stub file)
+contains definition to our cache class (sqlite database, saved items were
+previously kept in a json stub file which is migrated on first use)
 """
 from pathlib import Path
 import json
+import os
+import sqlite3
+import threading
+import time
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+# seconds between two recorded accesses of the same saved item by a process
+TOUCH_INTERVAL = 60
+
+
+def _encode(item) -> str:
+    """
+    canonical json text of an item, identical items encode to the same text
+    """
+    return json.dumps(item, separators=(',', ':'), ensure_ascii=False)
+
+
+class _Store:
+    """
+    sqlite database holding the items of one cache, shared by every
+    `Cache` of that name in the process. sqlite's file locks serialise writes
+    across workers, while reads are served from an in-memory mirror that is
+    only reloaded after another connection committed a change.
+    the last access of each saved item is kept alongside, by item key (eg. stop id)
+    """
+    def __init__(self, key):
+        self.key = key
+        self.pid = os.getpid()
+        self.items = None
+        self.version = None
+        self.lock = threading.Lock()
+        self.touched = {}
+        self.connection = sqlite3.connect(
+            key + '.db', timeout=10, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self._migrate()
+
+    def _migrate(self):
+        """
+        create the schema and import items from the old `<key>.json` file, once
+        """
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS items ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, item TEXT NOT NULL UNIQUE)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS accessed (key TEXT PRIMARY KEY, at REAL NOT NULL)'
+            )
+            if connection.execute('PRAGMA user_version').fetchone()[0] == 0:
+                path = Path(self.key + '.json')
+                if path.is_file():
+                    with open(path, 'r') as database:
+                        items = json.load(database).get(self.key, [])
+                    connection.executemany(
+                        'INSERT OR IGNORE INTO items (item) VALUES (?)',
+                        ((_encode(item),) for item in items if item is not None)
+                    )
+                connection.execute('PRAGMA user_version = 1')
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def read(self) -> list:
+        """
+        returns all saved items in insertion order
+        """
+        with self.lock:
+            version = self.connection.execute('PRAGMA data_version').fetchone()[0]
+            if self.items is None or version != self.version:
+                self.items = [
+                    json.loads(item) for item, in
+                    self.connection.execute('SELECT item FROM items ORDER BY id')
+                ]
+                self.version = version
+            return list(self.items)
+
+    def write(self, item):
+        """
+        save an item, duplicates of an already saved item are ignored
+        """
+        text = _encode(item)
+        with self.lock:
+            cursor = self.connection.execute(
+                'INSERT OR IGNORE INTO items (item) VALUES (?)', (text,)
+            )
+            if cursor.rowcount and self.items is not None:
+                self.items.append(json.loads(text))
+
+    def touch(self, key: str):
+        """
+        record an access of the saved item `key`, at most every `TOUCH_INTERVAL` seconds
+        """
+        now = time.time()
+        if now - self.touched.get(key, 0) < TOUCH_INTERVAL:
+            return
+        with self.lock:
+            self.touched[key] = now
+            self.connection.execute(
+                'INSERT OR REPLACE INTO accessed (key, at) VALUES (?, ?)', (key, now)
+            )
+
+    def accessed(self) -> dict:
+        """
+        returns the time of the last recorded access of each item key
+        """
+        with self.lock:
+            return dict(self.connection.execute('SELECT key, at FROM accessed'))
+
+
+def _get_store(key) -> _Store:
+    """
+    returns the store for key, opened once per process
+    """
+    store = _STORES.get(key)
+    if store is None or store.pid != os.getpid():
+        with _STORES_LOCK:
+            store = _STORES.get(key)
+            if store is None or store.pid != os.getpid():
+                store = _STORES[key] = _Store(key)
+    return store
 
 
 class Cache:
     """
     Cache service class that handles reading and writing
-    from a json database
+    from a sqlite database, the database is opened on first use
         :var filename
         :methods
             read_db
             write_db
+            touch
+            accessed
     """
     def __init__(self, filename):
-        self.filename = filename + '.json'
+        self.filename = filename + '.db'
         self.key = filename
         self.data = {
             self.key: []
         }
-        path = Path(self.filename)
-        if not path.is_file():
-            self.write_db(None, update=False)
 
-    def write_db(self, data, update=True):
+    def write_db(self, data):
         """
-        update json contents with new item
-        :param data: item to append to json file
-        :param update: check whether database must be updated
+        save a new item to the database
+        :param data: item to save, items already saved are not duplicated
         :return:
         """
-        if update:
-            self.read_db()
-            self.data[self.key].append(data)
-        try:
-            with open(self.filename, 'w+') as database:
-                json.dump(self.data, database, indent=2)
-        except json.JSONDecodeError as err:
-            raise err
+        store = _get_store(self.key)
+        store.write(data)
+        self.data = {self.key: store.read()}
 
     def read_db(self):
         """
         read our database and store the results in our class object
         :return:
         """
-        with open(self.filename, 'r') as database:
-            data = json.load(database)
-        self.data = data
+        self.data = {self.key: _get_store(self.key).read()}
+
+    def touch(self, item_key: str):
+        """
+        record that a saved item (eg. a stop id) was just viewed
+        """
+        _get_store(self.key).touch(item_key)
+
+    def accessed(self) -> dict:
+        """
+        returns the last access time of each viewed item key
+        """
+        return _get_store(self.key).accessed()
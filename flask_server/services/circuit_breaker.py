@@ -0,0 +1,130 @@
+"""
+circuit breakers around the api operations: after `failures` upstream errors
+in a row an operation's circuit opens and its calls fail at once, without
+waiting on the api, for `reset_after` seconds. one call is then let through
+(half open), its success closes the circuit and its failure opens it again,
+a probe not reporting back within `reset_after` seconds lets another one through
+"""
+import os
+import threading
+from time import monotonic
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    raised instead of calling an operation whose circuit is open
+    """
+    def __init__(self, operation: str):
+        super().__init__(f'circuit open for {operation}')
+        self.operation = operation
+
+
+class CircuitBreaker:
+    """
+    circuit of one api operation
+        :var state: str -> 'closed', 'open' or 'half_open'
+        :var failures: int -> upstream errors in a row
+        :var opened: int -> times the circuit opened
+        :var rejected: int -> calls failed without calling the api
+    """
+    def __init__(self, failures=5, reset_after=30.0):
+        self.max_failures = failures
+        self.reset_after = reset_after
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        whether a call may go to the api, moves an open circuit to half open
+        once `reset_after` passed, letting a single call probe the api (and
+        another one every `reset_after` seconds while no probe reports back)
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if monotonic() - self._opened_at >= self.reset_after:
+                # opened long enough, or its probe was lost: probe again
+                self.state = HALF_OPEN
+                self._opened_at = monotonic()
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self):
+        """
+        record a call answered by the api
+        """
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def failure(self):
+        """
+        record a call the api failed, opening the circuit after too many
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.max_failures:
+                if self.state != OPEN:
+                    self.opened += 1
+                self.state = OPEN
+                self._opened_at = monotonic()
+
+    def stats(self) -> dict:
+        """
+        returns circuit counters
+        """
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'opened': self.opened,
+            'rejected': self.rejected,
+        }
+
+
+class CircuitBreakers:
+    """
+    Process wide circuits, one per api operation, safe to share between threads
+        :var failures: int -> errors in a row opening a circuit
+        :var reset_after: float -> seconds an open circuit fails calls for
+        :methods
+            get
+            stats
+    """
+    def __init__(self, failures=5, reset_after=30.0):
+        self.failures = failures
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._breakers = {}
+
+    def get(self, operation: str) -> CircuitBreaker:
+        """
+        returns the circuit of an operation, created closed on first use
+        (circuits inherited from a parent process are dropped)
+        """
+        breaker = self._breakers.get(operation) if self._pid == os.getpid() else None
+        if breaker is not None:
+            return breaker
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._breakers = {}
+            breaker = self._breakers.get(operation)
+            if breaker is None:
+                breaker = self._breakers[operation] = CircuitBreaker(
+                    self.failures, self.reset_after
+                )
+            return breaker
+
+    def stats(self) -> dict:
+        """
+        returns the counters of each operation's circuit
+        """
+        return {operation: breaker.stats() for operation, breaker in self._breakers.items()}
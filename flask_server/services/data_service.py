@@ -4,18 +4,40 @@ filtering/mapping through data like stop information, departures and journey inf
 and converting data types
 such as dates, etc
 """
+import logging
+import sys
 from datetime import datetime
-from typing import Sequence, Dict
+from functools import lru_cache
+from itertools import groupby
+from operator import attrgetter
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Sequence, Dict, List, Optional, Iterator, Tuple
 from dateutil import tz
-from swagger_client.models import (
-    DepartureMonitorResponse, StopFinderLocation,
-    TripRequestResponseJourney, AdditionalInfoResponseMessage
-)
 
 from flask_server.models.departure_info import DepartureInfo
+from flask_server.services.app_locals import VALID_PERSONS
 from flask_server.models.trip_journey import TripJourney
+from flask_server.services.tracing import traced
 import re
 
+if TYPE_CHECKING:
+    from swagger_client.models import (
+        DepartureMonitorResponse, StopFinderLocation,
+        TripRequestResponseJourney, AdditionalInfoResponseMessage
+    )
+
+logger = logging.getLogger(__name__)
+
+# Specify Timezone to convert to and from ie UTC -> Sydney localtime
+# this pulls localtime information from `/usr/share/zoneinfo` (linux sys)
+# this includes daylight savings info eg. AEST-10AEDT,M10.1.0,M4.1.0/3
+# zones are only looked up once, when the module is imported
+UTC = tz.tzutc()
+SYDNEY = tz.gettz('Australia/Sydney')
+# format of timestamps returned by the api eg. 2019-10-01T09:30:00Z
+UTC_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
 def validate_date_time(date, time):
     time_test = re.search('^(0[1-9]|1[0-2]):[0-5][0-9]([AP]M)$', time)
     date_test = re.search(
@@ -28,7 +50,7 @@ def validate_date_time(date, time):
     return date_time
 
 def stop_information_generator(
-        locations: Sequence[StopFinderLocation],
+        locations: Sequence['StopFinderLocation'],
         selected_types: Sequence[int], query: str, is_suburb=False
 ) -> Sequence[tuple]:
     """
@@ -58,8 +80,28 @@ def stop_information_generator(
         yield location.id, location.name, location.coord
 
 
+@lru_cache(maxsize=4096)
+def parse_utc_timestamp(timestamp: str) -> datetime:
+    """
+    fast path of `date_parser` for api timestamps in `UTC_FORMAT`,
+    converted to Sydney localtime. conversions are memoised as the same
+    timestamps repeat across journeys, legs and page loads
+
+    raises ValueError on malformed timestamps
+    :rtype: datetime
+    """
+    if len(timestamp) != 20 or timestamp[10] != 'T' or timestamp[19] != 'Z':
+        raise ValueError(
+            f"time data {timestamp!r} does not match format {UTC_FORMAT!r}"
+        )
+    # fromisoformat is implemented in C, unlike strptime
+    return datetime.fromisoformat(
+        timestamp[:19]
+    ).replace(tzinfo=UTC).astimezone(SYDNEY)
+
+
 def date_parser(
-        departure_time: str, time_format="%Y-%m-%dT%H:%M:%SZ"
+        departure_time: str, time_format=UTC_FORMAT
 ) -> datetime:
     """
     parses a date string using the specified date_time_format
@@ -73,25 +115,47 @@ def date_parser(
 
     :rtype: datetime
     """
-    # Specify Timezone to convert to and from ie UTC -> Sydney localtime
-    # this pulls localtime information from `/usr/share/zoneinfo` (linux sys)
-    # this includes daylight savings info eg. AEST-10AEDT,M10.1.0,M4.1.0/3
-    from_zone = tz.gettz('UTC')
-    to_zone = tz.gettz('Australia/Sydney')
     # replace will specify the date format to convert from (UTC)
     # and `as times zone` will convert it to specified timezone eg. Australian EST
     try:
+        if time_format == UTC_FORMAT:
+            return parse_utc_timestamp(departure_time)
         parsed_date = datetime.strptime(
             departure_time, time_format
-        ).replace(tzinfo=from_zone).astimezone(to_zone)
+        ).replace(tzinfo=UTC).astimezone(SYDNEY)
     except ValueError as err:
-        print(err)
+        logger.debug('unparsable date %r: %s', departure_time, err)
         parsed_date = None
     return parsed_date
 
 
+def date_parser_batch(timestamps: Sequence[Optional[str]]) -> List[Optional[datetime]]:
+    """
+    converts a list of api timestamps (`UTC_FORMAT`) to Sydney localtime in one call,
+    missing or malformed timestamps are returned as None
+
+    :rtype: list
+    """
+    parse = parse_utc_timestamp
+    parsed = []
+    append = parsed.append
+    for timestamp in timestamps:
+        try:
+            append(parse(timestamp) if timestamp is not None else None)
+        except ValueError:
+            append(None)
+    return parsed
+
+
+def _intern(text: Optional[str]) -> Optional[str]:
+    """
+    interned copy of a name repeated across responses, eg. stop or route names
+    """
+    return sys.intern(text) if text is not None else None
+
+
 def departure_info_generator(
-        events: DepartureMonitorResponse, date_time=None
+        events: 'DepartureMonitorResponse', date_time=None
 ) -> Sequence[DepartureInfo]:
     """## Generate departure information for a stop
     args
@@ -102,22 +166,23 @@ def departure_info_generator(
     :return DepartureInfo
     """
 
-    for event in events.stop_events:
-        route = event.transportation.number
-        dest = event.transportation.destination.name
-        location = event.location.name
-        id_ = event.location.id
-        departure_time = event.departure_time_planned
-        parsed_date = date_parser(departure_time)
-        print(parsed_date)
-        # ensure datetime is formatted with timezone info
-        # convert date to AEST
-        if date_time is None:
-            planned_date = datetime.now(tz.tzlocal()).astimezone(tz=tz.gettz('Australia/Sydney'))
-        else:
-            planned_date = datetime.strptime(
-                f'{date_time[0]} {date_time[1]}', '%Y-%m-%d %I:%M%p'
-            ).replace(tzinfo=tz.gettz('AEST'))
+    # ensure datetime is formatted with timezone info
+    # convert date to AEST
+    if date_time is None:
+        planned_date = datetime.now(tz.tzlocal()).astimezone(tz=SYDNEY)
+    else:
+        planned_date = datetime.strptime(
+            f'{date_time[0]} {date_time[1]}', '%Y-%m-%d %I:%M%p'
+        ).replace(tzinfo=SYDNEY)
+    stop_events = events.stop_events
+    departure_times = date_parser_batch(
+        [event.departure_time_planned for event in stop_events]
+    )
+    for event, parsed_date in zip(stop_events, departure_times):
+        route = _intern(event.transportation.number)
+        dest = _intern(event.transportation.destination.name)
+        location = _intern(event.location.name)
+        id_ = _intern(event.location.id)
         countdown = parsed_date - planned_date
         # if the train has already passed skip to next data set
 
@@ -131,6 +196,26 @@ def departure_info_generator(
         yield DepartureInfo(hours, minutes, seconds, route, dest, location, id_)
 
 
+@traced('data_service.departures_by_location')
+def departures_by_location(
+        events: 'DepartureMonitorResponse', date_time=None
+) -> Iterator[Tuple[str, Iterator[DepartureInfo]]]:
+    """
+    departures of a stop grouped by location (eg. platform), locations in order of
+    their first departure and departures in time order within each.
+    only the stop events are reordered up front, each departure is built
+    as the groups are iterated
+    :return: (location, departures) pairs, consume each group before the next
+    """
+    first_seen = {}
+    for event in events.stop_events:
+        first_seen.setdefault(event.location.name, len(first_seen))
+    ordered = SimpleNamespace(stop_events=sorted(
+        events.stop_events, key=lambda event: first_seen[event.location.name]
+    ))
+    return groupby(departure_info_generator(ordered, date_time), key=attrgetter('location'))
+
+
 def create_date_and_time(
         date: datetime, format_date: str, format_time: str
 ) -> (str, str):
@@ -150,50 +235,71 @@ def create_date_and_time(
     return today, time
 
 
-def get_stop_info(legs) -> (Dict, Sequence[float]):
+def _stop_time(sequence) -> Optional[str]:
+    """
+    attempt to get live updates/ estimated otherwise get planned dep/arrival times
+    of a stop in a leg's stop sequence
+    """
+    if sequence.departure_time_estimated is not None:
+        return sequence.departure_time_estimated
+    if sequence.arrival_time_estimated is not None:
+        return sequence.arrival_time_estimated
+    if sequence.departure_time_planned is not None:
+        return sequence.departure_time_planned
+    return sequence.arrival_time_planned
+
+
+def _shared(value, interned: dict):
+    """
+    returns the equal value already in `interned`, adding value when new
+    """
+    return interned.setdefault(value, value)
+
+
+def get_stop_info(legs, interned: dict = None) -> (Dict, Sequence[float]):
     """
     gets stop information in all legs of the current trip journey as dictionary
-    as well as the coordinates in the list as coords
+    as well as the coordinates in the list as coords.
+    names are interned, and (name, time) pairs and coordinates are shared through
+    `interned` so that journeys of the same response hold one copy of each
     :return: result, coords
     """
+    interned = {} if interned is None else interned
     result = {}
     coords = []
     type_ = ''
     for leg in legs:
         if leg.stop_sequence is None:
             continue
+        # parse the times of every stop in the leg at once
+        departure_times = date_parser_batch([
+            _stop_time(sequence) for sequence in leg.stop_sequence
+        ])
         for seq_num, sequence in enumerate(leg.stop_sequence):
             if seq_num == 0:
                 # create new key entry for each leg/ network change in journey
                 # Note that the Api returns None when it means a walking trip
-                type_ = (
+                type_ = sys.intern(
                     leg.transportation.name
                     if leg.transportation.name is not None else 'Walking'
                 )
                 result[type_] = []
 
-            # attempt to get live updates/ estimated otherwise get planned dep/arrival times
-            if sequence.departure_time_estimated is not None:
-                departure_time = date_parser(sequence.departure_time_estimated)
-            elif sequence.arrival_time_estimated is not None:
-                departure_time = date_parser(sequence.arrival_time_estimated)
-            elif sequence.departure_time_planned is not None:
-                departure_time = date_parser(sequence.departure_time_planned)
-            elif sequence.arrival_time_planned is not None:
-                departure_time = date_parser(sequence.arrival_time_planned)
-            else:
+            departure_time = departure_times[seq_num]
+            if departure_time is None:
                 # if no information is available output message:
                 departure_time = 'Unavailable'
-            if departure_time != 'Unavailable':
+            else:
                 # parse dates and return the formatted time string only
-                _, departure_time = create_date_and_time(departure_time, '', '%H:%M')
-            coords.append(sequence.coord)
-            result[type_].append((sequence.name, departure_time))
+                departure_time = sys.intern(departure_time.strftime('%H:%M'))
+            coord = sequence.coord
+            coords.append(_shared(tuple(coord), interned) if coord is not None else None)
+            result[type_].append(_shared((_intern(sequence.name), departure_time), interned))
     return result, coords
 
 
 def trip_journeys_generator(
-        journeys: Sequence[TripRequestResponseJourney], concession_type: str
+        journeys: Sequence['TripRequestResponseJourney'], concession_type: str
 ) -> Sequence[TripJourney]:
     """
     ## yields trip information from journeys.
@@ -208,31 +314,55 @@ def trip_journeys_generator(
     arrive_day, arrive_time: tuple -> (str, str) -> arrival day/time information,
     stops: dict -> all stops in journey
     """
+    interned = {}
     for journey in journeys:
-        fares = journey.fare.tickets
-        total_fare = sum(
-            float(fare.properties.price_total_fare)
-            for fare in fares if fare.person == concession_type
-        )  # Sum of fare
-        total_fare = round(total_fare, 2)
-        # calculate total duration in minutes and round up 2 decimal places
-        total_duration = sum(leg.duration for leg in journey.legs) / 60
-        total_duration = round(total_duration, 2)
-        origin, dest = journey.legs[0].origin.name, journey.legs[-1].destination.name
-        depart = date_parser(journey.legs[0].origin.departure_time_estimated)
-        depart_day, depart_time = create_date_and_time(depart, '%A,  %d-%m-%Y', '%H:%M%Z')
-
-        arrive = date_parser(journey.legs[-1].destination.arrival_time_estimated)
-        arrive_day, arrive_time = create_date_and_time(arrive, '%A,  %d-%m-%Y', '%H:%M%Z')
-        stops, coords = get_stop_info(journey.legs)  # get list of stops in legs as dict
-        yield TripJourney(
-            total_fare, total_duration,
-            depart_day, depart_time,
-            arrive_day, arrive_time, stops, coords, origin, dest
+        yield build_trip_journey(
+            journey, journey_fares(journey).get(concession_type, 0.0), interned
         )
 
 
-def status_info_generator(current_infos: Sequence[AdditionalInfoResponseMessage]):
+def journey_fares(journey: 'TripRequestResponseJourney') -> Dict[str, float]:
+    """
+    total fare of a journey for every concession type in `VALID_PERSONS`,
+    worked out in a single pass over its tickets
+    :return: dict -> concession type: total fare
+    """
+    totals = dict.fromkeys(VALID_PERSONS, 0.0)
+    for fare in journey.fare.tickets:
+        if fare.person in totals:
+            totals[fare.person] += float(fare.properties.price_total_fare)  # Sum of fare
+    return {person: round(total, 2) for person, total in totals.items()}
+
+
+@traced('data_service.build_trip_journey')
+def build_trip_journey(
+        journey: 'TripRequestResponseJourney', total_fare: float, interned: dict = None
+) -> TripJourney:
+    """
+    build the TripJourney model of a single journey
+    Args:
+    journey: TripRequestResponseJourney -> journey received from the API Call
+    total_fare: float -> cost of journey for the selected concession type
+    interned: dict -> values shared with the other journeys of the response
+    """
+    # calculate total duration in minutes and round up 2 decimal places
+    total_duration = sum(leg.duration for leg in journey.legs) / 60
+    total_duration = round(total_duration, 2)
+    origin, dest = journey.legs[0].origin.name, journey.legs[-1].destination.name
+    depart = date_parser(journey.legs[0].origin.departure_time_estimated)
+    depart_day, depart_time = create_date_and_time(depart, '%A,  %d-%m-%Y', '%H:%M%Z')
+
+    arrive = date_parser(journey.legs[-1].destination.arrival_time_estimated)
+    arrive_day, arrive_time = create_date_and_time(arrive, '%A,  %d-%m-%Y', '%H:%M%Z')
+    stops, coords = get_stop_info(journey.legs, interned)  # get list of stops in legs as dict
+    return TripJourney(
+        total_fare, total_duration,
+        depart_day, depart_time,
+        arrive_day, arrive_time, stops, coords, origin, dest
+    )
+
+
+def status_info_generator(current_infos: Sequence['AdditionalInfoResponseMessage']):
     """
     generates status info for a stop
     :param current_infos:
@@ -0,0 +1,214 @@
+"""
+hedged api calls: when a call has not returned after the `percentile` of its
+operation's recent latencies, an identical call is sent and whichever answers
+first is used. hedges are limited to a `budget` share of the recent calls made
+(each call earns `budget` of a hedge, saved up to `BURST` hedges), so a slow api
+is never sent more than that many extra requests, even after a quiet period.
+the call losing the race is not cancelled (a sent request cannot be), so hedges
+also wait while the extra calls still running hold every hedge thread. first calls
+are sent by their own threads, they never queue behind hedges
+"""
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from time import monotonic
+from typing import Tuple
+
+from flask_server.services import profiler
+
+# latencies kept per operation, and the number needed before calls are hedged
+WINDOW = 512
+MIN_SAMPLES = 20
+# hedges the budget saves up at most
+BURST = 10
+# threads sending the first call of hedged operations, at least the number of threads
+# making api calls (request and fan-out threads) so that first calls never queue
+PRIMARY_WORKERS = 64
+
+
+class LatencyWindow:
+    """
+    latencies of the most recent calls of an operation
+    """
+    def __init__(self, size=WINDOW):
+        self._latencies = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        """
+        record the latency of a call
+        """
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, percentile: float):
+        """
+        returns the latency under which `percentile` % of the recent calls returned,
+        None until `MIN_SAMPLES` calls were recorded
+        """
+        with self._lock:
+            if len(self._latencies) < MIN_SAMPLES:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(int(len(latencies) * percentile / 100), len(latencies) - 1)]
+
+
+class Hedger:
+    """
+    Process wide hedging of the api calls of `operations`, safe to share between threads
+        :var operations: set -> api operations hedged eg. 'tfnsw_trip_request2'
+        :var percentile: float -> latency percentile after which a call is hedged
+        :var budget: float -> most hedges as a share of the calls made eg. 0.05
+        :var min_delay: float -> seconds a call is always given before hedging
+        :var max_workers: int -> threads sending the hedges
+        :var calls / fired / won / over_budget / busy: int -> calls made, hedges sent,
+        hedges answering first, hedges skipped for lack of budget and while too many
+        extra calls were running
+        :methods
+            hedges
+            run
+            stats
+    """
+    def __init__(
+            self, operations, percentile=95.0, budget=0.05, min_delay=0.05, max_workers=16,
+            primary_workers=PRIMARY_WORKERS
+    ):
+        self.operations = set(operations)
+        self.percentile = percentile
+        self.budget = budget
+        self.min_delay = min_delay
+        self.max_workers = max_workers
+        self.primary_workers = primary_workers
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+        self.over_budget = 0
+        self.busy = 0
+        self._tokens = 0.0
+        self._extra_calls = 0  # hedges, or the calls they beat, still running
+        self._lock = threading.Lock()
+        self._windows = {operation: LatencyWindow() for operation in self.operations}
+        self._executor = None
+        self._primary_executor = None
+        self._pid = None
+
+    def hedges(self, operation: str) -> bool:
+        """
+        whether calls of an operation are hedged
+        """
+        return operation in self.operations
+
+    def _get_executors(self) -> Tuple[ThreadPoolExecutor, ThreadPoolExecutor]:
+        """
+        threads sending the first calls and the hedges, built per process (threads do
+        not survive a fork)
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._primary_executor = ThreadPoolExecutor(
+                        max_workers=self.primary_workers, thread_name_prefix='api-primary'
+                    )
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix='api-hedge'
+                    )
+                    self.calls = self.fired = self.won = self.over_budget = self.busy = 0
+                    self._tokens = 0.0
+                    self._extra_calls = 0
+                    self._pid = os.getpid()
+        return self._primary_executor, self._executor
+
+    def _take_budget(self) -> bool:
+        """
+        count a hedge when the budget allows one more and a hedge thread is free
+        of extra calls
+        """
+        with self._lock:
+            if self._tokens < 1:
+                self.over_budget += 1
+                return False
+            if self._extra_calls >= self.max_workers:
+                self.busy += 1
+                return False
+            self._tokens -= 1
+            self.fired += 1
+            self._extra_calls += 1
+            return True
+
+    def _finished(self, primary: Future, hedge: Future):
+        """
+        count the extra call of a hedged call as finished once both of its calls are
+        """
+        running = [2]
+
+        def done(_):
+            with self._lock:
+                running[0] -= 1
+                if not running[0]:
+                    self._extra_calls -= 1
+        primary.add_done_callback(done)
+        hedge.add_done_callback(done)
+
+    def _timed(self, operation: str, function):
+        """
+        `function` recording its latency when it succeeds
+        """
+        window = self._windows[operation]
+
+        def timed():
+            started = monotonic()
+            result = function()
+            window.add(monotonic() - started)
+            return result
+        return timed
+
+    def run(self, operation: str, function):
+        """
+        returns `function()`, calling it a second time when the first call is
+        slower than the operation's latency percentile and the budget allows
+        :raises: the error of the first call, when no call succeeded
+        """
+        primary_executor, executor = self._get_executors()
+        with self._lock:
+            self.calls += 1
+            self._tokens = min(self._tokens + self.budget, BURST)
+        timed = self._timed(operation, function)
+        delay = self._windows[operation].percentile(self.percentile)
+        if delay is None:  # too few latencies to hedge on, call from this thread
+            return timed()
+        timed = profiler.attached(timed)
+        primary = primary_executor.submit(copy_context().run, timed)
+        done, _ = wait([primary], timeout=max(delay, self.min_delay))
+        if done or not self._take_budget():
+            return primary.result()
+        hedge = executor.submit(copy_context().run, timed)
+        self._finished(primary, hedge)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.won += 1
+                    return future.result()
+        return primary.result()  # both failed, raise the first call's error
+
+    def stats(self) -> dict:
+        """
+        returns hedging counters and the current hedge delay of each operation
+        """
+        return {
+            'calls': self.calls,
+            'fired': self.fired,
+            'won': self.won,
+            'over_budget': self.over_budget,
+            'busy': self.busy,
+            'extra_calls': self._extra_calls,
+            'delays': {
+                operation: window.percentile(self.percentile)
+                for operation, window in self._windows.items()
+            },
+        }
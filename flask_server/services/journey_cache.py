@@ -0,0 +1,50 @@
+"""
+journeys returned for a trip request, kept between page loads so that
+paging through journeys or changing the concession type does not query the api again
+"""
+import threading
+from copy import copy
+from typing import Sequence
+
+from flask_server.models.trip_journey import TripJourney
+from flask_server.services.data_service import build_trip_journey, journey_fares
+
+
+class JourneyResults:
+    """
+    raw journeys of one trip request, with fares for every concession type
+    worked out up front and each page's TripJourney built on first request
+        :var journeys: journeys received from the api
+        :var fares: list -> dict of concession type: total fare, per journey
+        :methods
+            page
+    """
+    def __init__(self, journeys: Sequence):
+        self.journeys = journeys
+        self.fares = [journey_fares(journey) for journey in journeys]
+        self._pages = {}
+        self._interned = {}  # stop names / coordinates shared by the pages
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.journeys)
+
+    def page(self, page_no: int, concession_type: str) -> TripJourney:
+        """
+        returns the journey at `page_no` priced for `concession_type`
+        :raises IndexError: when there is no such page
+        """
+        fare = self.fares[page_no].get(concession_type, 0.0)
+        with self._lock:
+            trips = self._pages.setdefault(page_no, {})
+            trip = trips.get(concession_type)
+            if trip is None:
+                base = next(iter(trips.values()), None)
+                if base is None:
+                    trip = build_trip_journey(self.journeys[page_no], fare, self._interned)
+                else:
+                    # stops and times are shared, only the fare differs
+                    trip = copy(base)
+                    trip.total_fare = fare
+                trips[concession_type] = trip
+        return trip
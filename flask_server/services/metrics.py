@@ -0,0 +1,267 @@
+"""
+latency histograms of the routes and api calls, and the counters of the
+process wide services (caches, pools, ...), rendered in the prometheus text
+format. each worker process keeps its own metrics and, given a directory, writes
+a snapshot of them there (at most every `DUMP_INTERVAL` seconds), so that the
+worker answering a scrape reports the histograms and counters summed over every
+worker (exited ones included, so that totals never go back) and the gauges of
+each live worker labelled by `pid`
+"""
+import json
+import os
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from time import monotonic
+
+# upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = 'trip_planner_'
+# keys of the services' `stats()` that only ever increase, reported as counters `<name>_total`
+COUNTERS = frozenset((
+    'hits', 'misses', 'stale_hits', 'evictions', 'expirations', 'errors', 'calls', 'coalesced',
+    'fired', 'won', 'over_budget', 'busy', 'opened', 'rejected', 'refreshed', 'skipped',
+))
+# seconds between two snapshots of a worker's metrics
+DUMP_INTERVAL = 1.0
+
+
+class Histogram:
+    """
+    latencies of one labelled series, counted per bucket
+    """
+    __slots__ = ('counts', 'total', 'lock')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last bucket is +Inf
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        """
+        record a latency
+        """
+        index = bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += seconds
+
+
+def _labels(pairs) -> str:
+    """
+    prometheus text of label pairs eg. {route="/stops",status="200"}
+    """
+    if not pairs:
+        return ''
+    text = ','.join(
+        '{}="{}"'.format(
+            name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+        ) for name, value in pairs
+    )
+    return '{' + text + '}'
+
+
+def stats_samples(name: str, stats: dict, label: str, labels=()):
+    """
+    (metric name, label pairs, value, 'counter' or 'gauge') of the counters of a
+    service's `stats()`, dict values are series labelled `label` by their keys and
+    text values are reported as a label of a series at 1 eg. state="open"
+    """
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            for inner_key, inner in value.items():
+                yield from _samples(f'{name}_{key}', labels + ((label, inner_key),), key, inner)
+        else:
+            yield from _samples(f'{name}_{key}', labels, key, value)
+
+
+def _samples(name: str, labels: tuple, key: str, value):
+    """
+    sample of one counter, None values (unknown yet) are skipped
+    """
+    if value is None:
+        return
+    if isinstance(value, str):
+        yield name, labels + ((key, value),), 1, 'gauge'
+    elif key in COUNTERS:
+        yield name + '_total', labels, float(value), 'counter'
+    else:
+        yield name, labels, float(value), 'gauge'
+
+
+def clear_directory(directory):
+    """
+    drop the snapshots of earlier runs, before the workers start
+    """
+    for path in Path(directory).glob('*.json'):
+        path.unlink()
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Metrics:
+    """
+    Process wide metrics registry, safe to share between threads
+        :var directory: str -> where the workers write their snapshots, None to only
+        report the metrics of the process
+        :methods
+            observe
+            collect
+            dump_due
+            dump
+            render
+    """
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._dumped = 0.0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def observe(self, name: str, labels: tuple, seconds: float, help_text=''):
+        """
+        record a latency of the histogram `name`
+        :param labels: ((label, value), ...) of the series, in the same order for each call
+        """
+        if self._pid != os.getpid():  # counts inherited from a parent process are dropped
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._histograms = {}
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault((name, labels), Histogram())
+                self._help.setdefault(name, help_text)
+        histogram.observe(seconds)
+
+    def collect(self, name: str, stats, label='key', keyed=False):
+        """
+        report the `stats()` of a service as counters / gauges prefixed by `name` when rendering
+        :param stats: function returning a dict of counters
+        :param label: label of the keys of nested dicts eg. 'operation'
+        :param keyed: the keys of `stats()` are values of `label`, each holding a dict of counters
+        """
+        self._collectors.append((name, stats, label, keyed))
+
+    def _snapshot(self) -> dict:
+        """
+        histograms, help texts and service samples of this process, as json
+        """
+        with self._lock:
+            histograms = list(self._histograms.items()) if self._pid == os.getpid() else []
+        snapshot = {'help': dict(self._help), 'histograms': [], 'samples': []}
+        for (name, labels), histogram in histograms:
+            with histogram.lock:
+                snapshot['histograms'].append(
+                    [name, labels, list(histogram.counts), histogram.total]
+                )
+        for name, stats, label, keyed in self._collectors:
+            values = stats()
+            samples = (
+                sample for key, counters in values.items()
+                for sample in stats_samples(PREFIX + name, counters, label, ((label, key),))
+            ) if keyed else stats_samples(PREFIX + name, values, label)
+            snapshot['samples'].extend(samples)
+        return snapshot
+
+    def dump_due(self) -> bool:
+        """
+        whether `dump` would write a snapshot now
+        """
+        return bool(self.directory) and monotonic() - self._dumped >= DUMP_INTERVAL
+
+    def dump(self, force=False):
+        """
+        write the snapshot of this process to the directory, at most every
+        `DUMP_INTERVAL` seconds unless forced
+        """
+        if self.directory and (force or self.dump_due()):
+            self._dumped = monotonic()
+            self._write(self._snapshot())
+
+    def _write(self, snapshot: dict):
+        """
+        replace the snapshot file of this process, errors are ignored (a scrape
+        then reports the process' previous snapshot)
+        """
+        path = Path(self.directory) / f'{os.getpid()}.json'
+        try:
+            temporary = path.with_suffix('.tmp')
+            temporary.write_text(json.dumps(snapshot))
+            os.replace(temporary, path)
+        except OSError:
+            pass
+
+    def _snapshots(self) -> dict:
+        """
+        snapshot of every worker by pid, this process' own being current
+        """
+        own = self._snapshot()
+        snapshots = {}
+        if self.directory:
+            self._dumped = monotonic()
+            self._write(own)
+            for path in Path(self.directory).glob('*.json'):
+                try:
+                    snapshots[int(path.stem)] = json.loads(path.read_text())
+                except (OSError, ValueError):  # being replaced, or not a snapshot
+                    continue
+        snapshots[os.getpid()] = own
+        return snapshots
+
+    def render(self) -> str:
+        """
+        returns every metric in the prometheus text format
+        """
+        histograms, help_texts, series = {}, {}, {}
+        for pid, snapshot in self._snapshots().items():
+            alive = pid == os.getpid() or _alive(pid)
+            help_texts.update(snapshot['help'])
+            for name, labels, counts, total in snapshot['histograms']:
+                merged = histograms.setdefault(
+                    (name, tuple(map(tuple, labels))), [[0] * len(counts), 0.0]
+                )
+                merged[0] = [count + other for count, other in zip(merged[0], counts)]
+                merged[1] += total
+            for metric, labels, value, kind in snapshot['samples']:
+                labels = tuple(map(tuple, labels))
+                if kind == 'gauge':  # a state of the worker, not summed
+                    if not alive:
+                        continue
+                    labels += (('pid', pid),)
+                values = series.setdefault(metric, (kind, {}))[1]
+                values[labels] = values.get(labels, 0) + value
+
+        lines = []
+        current = None
+        for (name, labels), (counts, total) in sorted(histograms.items()):
+            metric = PREFIX + name
+            if name != current:
+                current = name
+                if help_texts.get(name):
+                    lines.append(f'# HELP {metric} {help_texts[name]}')
+                lines.append(f'# TYPE {metric} histogram')
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{metric}_sum{_labels(labels)} {total}')
+            lines.append(f'{metric}_count{_labels(labels)} {cumulative}')
+        # the samples of a metric have to be listed together
+        for metric, (kind, values) in series.items():
+            lines.append(f'# TYPE {metric} {kind}')
+            lines.extend(f'{metric}{_labels(labels)} {value}' for labels, value in values.items())
+        return '\n'.join(lines) + '\n'
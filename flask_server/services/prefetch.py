@@ -0,0 +1,258 @@
+"""
+background refresh of the departures, statuses and journeys of the stops and
+trips saved on the dashboard, so that opening them is answered from the
+response cache. items are refreshed most recently viewed first, within a
+budget of api calls per minute, in one worker per host (the one holding the
+lock file). use a shared response cache (`RESPONSE_CACHE_BACKEND`) so that
+every worker benefits
+"""
+import logging
+import os
+import random
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not available on windows, every process prefetches
+    fcntl = None
+
+from flask import current_app
+
+from flask_server import client as api
+from flask_server.services.cache_class import Cache, TOUCH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+STOPS, TRIPS = 'stops', 'trips'
+
+
+def item_key(name: str, item) -> str:
+    """
+    key of a saved item, a stop's id or '<origin id>><destination id>' for a trip
+    """
+    if name == TRIPS:
+        (origin_id, _), (destination_id, _) = item
+        return f'{origin_id}>{destination_id}'
+    return str(item[0])
+
+
+def record_access(name: str, key: str, app=None):
+    """
+    record a view of a saved stop / trip, other keys are ignored, as are all
+    views when prefetching is disabled
+    :param name: 'stops' or 'trips'
+    :param key: see `item_key`
+    :param app: app of the request, the current flask app by default
+    """
+    prefetcher = (app or current_app).extensions.get('prefetcher')
+    if prefetcher is not None:
+        prefetcher.record_access(name, key)
+
+
+class TokenBucket:
+    """
+    allows `rate` calls per minute, bursting up to a minute's worth
+    """
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        """
+        spend a token, False when the budget is used up
+        """
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / 60)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Prefetcher:
+    """
+    Background thread refreshing the saved items into the response cache
+        :var budget: int -> api calls per minute
+        :var interval: float -> seconds between refresh rounds
+        :var jitter: float -> share of the interval rounds are randomly moved by
+        :var lock_path: file locked by the prefetching process
+        :var refreshed / skipped / errors: int -> counters of api calls
+        :methods
+            start
+            stop
+            record_access
+            run_once
+            stats
+    """
+    def __init__(self, app, budget=20, interval=60.0, jitter=0.2, lock_path='prefetch.lock'):
+        self.app = app
+        self.budget = budget
+        self.interval = interval
+        self.jitter = jitter
+        self.lock_path = lock_path
+        self.refreshed = 0
+        self.skipped = 0
+        self.errors = 0
+        self._bucket = TokenBucket(budget)
+        self._lock_file = None
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        # keys of the saved items by name, reloaded every `TOUCH_INTERVAL` seconds
+        self._saved_keys = {}
+        self._saved_keys_at = 0.0
+
+    def start(self):
+        """
+        start the refresh thread of the current process, once
+        (threads do not survive a fork, so each worker checks on its first request)
+        """
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._lock_file = None
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='prefetch', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        stop the refresh thread after its current call
+        """
+        self._stopped.set()
+
+    def record_access(self, name: str, key: str):
+        """
+        record a view of a saved stop / trip, checked against the keys of the saved
+        items in memory, so views of other items cost no database access
+        """
+        now = time.monotonic()
+        if now - self._saved_keys_at > TOUCH_INTERVAL:
+            saved_keys = {}
+            for cache_name in (STOPS, TRIPS):
+                cache = Cache(cache_name)
+                cache.read_db()
+                saved_keys[cache_name] = {
+                    item_key(cache_name, item) for item in cache.data[cache.key]
+                }
+            self._saved_keys, self._saved_keys_at = saved_keys, now
+        if key in self._saved_keys.get(name, ()):
+            Cache(name).touch(key)
+
+    def _is_leader(self) -> bool:
+        """
+        whether this process holds the prefetch lock file, taking it when free
+        """
+        if fcntl is None:
+            return True
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file  # held (and the lock with it) for the life of the process
+        return True
+
+    def _run(self):
+        while not self._stopped.wait(
+                self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        ):
+            try:
+                if self._is_leader():
+                    with self.app.app_context():
+                        self.run_once()
+            except Exception:  # pylint: disable=broad-except
+                # a failed round (unreadable saved items, lock file...) must not end the thread
+                logger.exception('prefetch round failed')
+                self.errors += 1
+
+    def _saved_items(self) -> list:
+        """
+        (name, item) of every saved stop and trip, most recently viewed first
+        """
+        items = []
+        for name in (STOPS, TRIPS):
+            cache = Cache(name)
+            cache.read_db()
+            accessed = cache.accessed()
+            items.extend(
+                (accessed.get(item_key(name, item), 0), name, item)
+                for item in cache.data[cache.key]
+            )
+        items.sort(key=lambda entry: entry[0], reverse=True)
+        return [(name, item) for _, name, item in items]
+
+    @staticmethod
+    def _calls(name: str, item) -> list:
+        """
+        client calls refreshing what the pages of a saved item request
+        """
+        if name == TRIPS:
+            (origin_id, _), (destination_id, _) = item
+            return [lambda client: client.find_trips_for_stop(
+                ('any', origin_id), ('any', destination_id), 'dep'
+            )]
+        stop_id = item[0]
+        return [
+            lambda client: client.find_destinations_for('any', stop_id, 'dep'),
+            lambda client: client.request_status_info(stop_id),
+        ]
+
+    def run_once(self):
+        """
+        refresh the saved items in priority order until the budget is used up,
+        needs an app context
+        """
+        client = api.connection(refresh=True)
+        for name, item in self._saved_items():
+            for call in self._calls(name, item):
+                if self._stopped.is_set():
+                    return
+                if not self._bucket.take():
+                    self.skipped += 1
+                    continue
+                call(client)
+                if client.error == 200:
+                    self.refreshed += 1
+                else:
+                    self.errors += 1
+
+    def stats(self) -> dict:
+        """
+        returns prefetch counters
+        """
+        return {
+            'leader': self._lock_file is not None or fcntl is None,
+            'refreshed': self.refreshed,
+            'skipped': self.skipped,
+            'errors': self.errors,
+        }
+
+
+def init_app(app):
+    """
+    start prefetching on the first request of each worker when `PREFETCH_ENABLED`
+    """
+    if not app.config.get('PREFETCH_ENABLED', False):
+        app.extensions['prefetcher'] = None
+        return
+    prefetcher = app.extensions['prefetcher'] = Prefetcher(
+        app,
+        budget=app.config.get('PREFETCH_BUDGET_PER_MINUTE', 20),
+        interval=app.config.get('PREFETCH_INTERVAL', 60),
+        jitter=app.config.get('PREFETCH_JITTER', 0.2),
+        lock_path=app.config.get('PREFETCH_LOCK_PATH', 'prefetch.lock')
+    )
+    app.before_request(prefetcher.start)
+    if app.extensions.get('metrics') is not None:
+        app.extensions['metrics'].collect('prefetch', prefetcher.stats)
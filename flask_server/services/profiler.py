@@ -0,0 +1,182 @@
+"""
+opt-in request profiling: the stacks of a profiled request's thread, and of the
+threads while they send its api calls, are sampled until its response (streamed
+or not) is sent, and written as collapsed stacks (one `frame;frame;frame count` line per
+stack) for flamegraph tools eg. `flamegraph.pl profile.collapsed > profile.svg`.
+
+a request is profiled when it carries `PROFILE_SECRET` in the `X-Profile` header
+or the `profile` query argument, and at random at `PROFILE_SAMPLE_RATE`.
+profiles are written to `PROFILE_DIR`, the file name is returned in `X-Profile-File`.
+work handed to other threads is only sampled when submitted `attached` to the request
+"""
+import hmac
+import os
+import random
+import sys
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from itertools import count
+
+from flask import g, request
+
+_profile_ids = count()
+# sampler of the request being profiled, None when it is not
+_SAMPLER = ContextVar('profile_sampler', default=None)
+
+
+def _frame_name(frame) -> str:
+    """
+    `function (directory/file.py:line)` of a frame
+    """
+    code = frame.f_code
+    path = code.co_filename.replace('\\', '/').rsplit('/', 2)[-2:]
+    return f'{code.co_name} ({"/".join(path)}:{code.co_firstlineno})'.replace(';', ':')
+
+
+def collapse(frame, root: str) -> str:
+    """
+    collapsed stack of a frame, outermost frame first, under a `root` frame
+    """
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.append(root)
+    return ';'.join(reversed(names))
+
+
+def attached(function):
+    """
+    `function` sampling the thread running it, while it runs, with the profile of
+    the request submitting it (the function itself when the request is not profiled)
+    """
+    sampler = _SAMPLER.get()
+    if sampler is None:
+        return function
+
+    @wraps(function)
+    def run(*args, **kwargs):
+        thread = threading.current_thread()
+        sampler.attach(thread.ident, thread.name.rsplit('_', 1)[0])
+        try:
+            return function(*args, **kwargs)
+        finally:
+            sampler.detach(thread.ident)
+    return run
+
+
+class StackSampler:
+    """
+    samples the stacks of a thread, and of the threads running work attached to it,
+    every `interval` seconds
+        :var stacks: Counter -> samples of each collapsed stack
+        :methods
+            start
+            stop
+            attach
+            detach
+    """
+    def __init__(self, thread_id: int, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._attached = {}  # thread id: root frame name
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        """
+        start sampling
+        """
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        """
+        stop sampling, returns the samples of each stack
+        """
+        self._stopped.set()
+        self._thread.join()
+        return self.stacks
+
+    def attach(self, thread_id: int, root: str):
+        """
+        sample a thread running work of the request, under a `root` frame
+        """
+        self._attached[thread_id] = root
+
+    def detach(self, thread_id: int):
+        """
+        stop sampling a thread once the request's work is done
+        """
+        self._attached.pop(thread_id, None)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            roots = {self.thread_id: 'request'}
+            roots.update(self._attached.copy())
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            for thread_id, root in roots.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[collapse(frame, root)] += 1
+
+
+def write_collapsed(stacks: Counter, path: str):
+    """
+    write samples as collapsed stacks, most sampled first
+    """
+    with open(path, 'w') as file:
+        for stack, samples in stacks.most_common():
+            file.write(f'{stack} {samples}\n')
+
+
+def _requested(secret) -> bool:
+    """
+    whether the current request asks to be profiled with the secret
+    """
+    given = request.headers.get('X-Profile') or request.args.get('profile')
+    return bool(secret and given) and hmac.compare_digest(given.encode(), secret.encode())
+
+
+def init_app(app):
+    """
+    profile requests asking for it with `PROFILE_SECRET`, and `PROFILE_SAMPLE_RATE` of the others
+    """
+    secret = app.config.get('PROFILE_SECRET')
+    sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    if not secret and not sample_rate:
+        return
+    directory = app.config.get('PROFILE_DIR', 'profiles')
+    interval = app.config.get('PROFILE_INTERVAL', 0.005)
+
+    @app.before_request
+    def start_profile():
+        requested = _requested(secret)
+        if not requested and not (sample_rate and random.random() < sample_rate):
+            return
+        os.makedirs(directory, exist_ok=True)
+        endpoint = (request.endpoint or 'unmatched').replace('.', '-')
+        g.profile_requested = requested
+        g.profile_path = os.path.join(directory, '{}-{}-{}-{}.collapsed'.format(
+            datetime.now().strftime('%Y%m%dT%H%M%S'), endpoint, os.getpid(), next(_profile_ids)
+        ))
+        g.profiler = StackSampler(threading.get_ident(), interval)
+        _SAMPLER.set(g.profiler)
+        g.profiler.start()
+
+    @app.after_request
+    def name_profile(response):
+        if g.get('profile_requested'):
+            response.headers['X-Profile-File'] = os.path.basename(g.profile_path)
+        return response
+
+    @app.teardown_request
+    def write_profile(_):
+        # the request context is torn down once a streamed response has been sent
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            _SAMPLER.set(None)  # the thread serves other requests next
+            write_collapsed(profiler.stop(), g.profile_path)
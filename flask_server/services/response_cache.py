@@ -0,0 +1,172 @@
+"""
+in-process cache for responses received from the trip planner api,
+entries expire after a ttl set per api operation and the least recently
+used entries are evicted once the cache holds too many or too large responses
+(sizes are estimated when a response is stored). expired entries are kept for
+`stale_for` more seconds, to be served by `get_stale` while they are refreshed
+"""
+import sys
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+_ATOMS = (str, bytes, int, float, bool, type(None))
+
+
+def approximate_size(value) -> int:
+    """
+    bytes held by a response: the objects reachable through its attributes,
+    dicts and sequences, objects shared within it counted once
+    """
+    size, seen, stack = 0, set(), [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, _ATOMS):
+            continue
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, '__dict__'):
+            stack.append(item.__dict__)
+    return size
+
+
+class ResponseCache:
+    """
+    TTL + LRU response cache, safe to share between threads.
+    keys are tuples starting with the api operation name, which selects the ttl
+        :var max_entries: number of responses held before evicting
+        :var max_bytes: estimated size of the responses held before evicting, None for no limit
+        :var ttls: dict -> ttl in seconds for each api operation
+        :var default_ttl: ttl for operations missing from `ttls`
+        :var stale_for: seconds expired entries stay available to `get_stale`
+        :methods
+            get
+            get_stale
+            set
+            ttl_for
+            time_left
+            clear
+            stats
+    """
+    def __init__(self, max_entries=1024, ttls=None, default_ttl=60, stale_for=0, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.stale_for = stale_for
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()  # key: (expires, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def ttl_for(self, key: tuple) -> float:
+        """
+        ttl of a key, looked up by the operation name it starts with
+        """
+        return self.ttls.get(key[0], self.default_ttl)
+
+    def get(self, key: tuple):
+        """
+        returns the cached response for key, or None when missing / expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value, _ = entry
+            now = monotonic()
+            if expires <= now:
+                if expires + self.stale_for <= now:
+                    self._pop(key)
+                    self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_stale(self, key: tuple):
+        """
+        returns the response for key expired less than `stale_for` seconds ago
+        (or still fresh), None otherwise
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] + self.stale_for <= monotonic():
+                return None
+            self.stale_hits += 1
+            return entry[1]
+
+    def time_left(self, key: tuple) -> float:
+        """
+        seconds until the entry for key expires, 0 when missing
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        return max(entry[0] - monotonic(), 0.0) if entry is not None else 0.0
+
+    def _pop(self, key: tuple):
+        """
+        drop an entry, holding the lock
+        """
+        self._bytes -= self._entries.pop(key)[2]
+
+    def set(self, key: tuple, value, ttl=None):
+        """
+        store a response, evicting the least recently used entries when full
+        :param key: normalised request parameters
+        :param value: response to cache, not stored when larger than `max_bytes` on its own
+        :param ttl: seconds until the entry expires, defaults to the operation's ttl
+        """
+        ttl = self.ttl_for(key) if ttl is None else ttl
+        if ttl <= 0:
+            return
+        size = approximate_size(value) if self.max_bytes else 0
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            if self.max_bytes and size > self.max_bytes:
+                return
+            self._entries[key] = monotonic() + ttl, value, size
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes and self._bytes > self.max_bytes
+            ):
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """
+        drop every entry
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        returns cache counters
+        """
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
@@ -0,0 +1,361 @@
+"""
+api response caches shared by every worker process of a host.
+`SharedCache` holds the ttl / serialisation logic common to shared stores and
+leaves reading and writing raw entries to a backend, `SQLiteCache` keeps them
+in a sqlite database (WAL mode, so readers never block each other or the writer).
+a networked store eg. redis plugs in by implementing the four `_raw_*` methods.
+responses are stored as the json of the swagger models, never pickled, so that
+whoever can write the store cannot run code in the workers reading it.
+`TieredCache` puts a process local `ResponseCache` in front of a shared cache.
+
+every cache offers the interface of `ResponseCache` used by the `Client`:
+get, get_stale, set, ttl_for, time_left, clear and stats
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+
+from flask_server.services.response_cache import ResponseCache
+
+# responses larger than this are compressed before being stored
+COMPRESS_OVER_BYTES = 2048
+_COMPRESSED, _PLAIN = b'z', b'p'
+
+
+class SharedCache(ABC):
+    """
+    base class of caches stored outside the process, entries expire after a
+    ttl set per api operation (keys are tuples starting with the operation name)
+        :var ttls: dict -> ttl in seconds for each api operation
+        :var default_ttl: ttl for operations missing from `ttls`
+        :var stale_for: seconds expired entries stay available to `get_stale`
+        :methods
+            get
+            get_stale
+            set
+            ttl_for
+            time_left
+            clear
+            stats
+    """
+    def __init__(self, ttls=None, default_ttl=60, stale_for=0):
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.stale_for = stale_for
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.errors = 0
+        self._api_client = None
+
+    # raw entries, implemented by each backend. `key` is the text of the key tuple,
+    # expiry times are unix timestamps so that every process agrees on them
+    @abstractmethod
+    def _raw_get(self, key: str, since: float) -> Optional[Tuple[float, bytes]]:
+        """
+        (expires, value) of an entry expiring after `since`, or None
+        """
+
+    @abstractmethod
+    def _raw_set(self, key: str, expires: float, value: bytes):
+        """
+        store an entry, the backend enforces its size limit and drops
+        entries `stale_for` seconds after they expire
+        """
+
+    @abstractmethod
+    def _raw_clear(self):
+        """
+        drop every entry
+        """
+
+    @abstractmethod
+    def _raw_count(self) -> int:
+        """
+        number of entries stored
+        """
+
+    @staticmethod
+    def _key(key: tuple) -> str:
+        """
+        text of a key, keys only hold strings, numbers, booleans, None and tuples of them
+        """
+        return repr(key)
+
+    def _client(self):
+        """
+        swagger api client (de)serialising the models, never sends a request
+        """
+        if self._api_client is None:
+            # pylint: disable=import-outside-toplevel
+            from swagger_client.api_client import ApiClient
+            self._api_client = ApiClient()
+        return self._api_client
+
+    def dumps(self, value) -> bytes:
+        """
+        serialise a response (a swagger model) to its model name and json, compressing
+        large ones
+        """
+        data = type(value).__name__.encode() + b'\n' + json.dumps(
+            self._client().sanitize_for_serialization(value)
+        ).encode()
+        if len(data) > COMPRESS_OVER_BYTES:
+            return _COMPRESSED + zlib.compress(data, 1)
+        return _PLAIN + data
+
+    def loads(self, data: bytes):
+        """
+        deserialise a response written by `dumps`, the json is parsed once and
+        turned into models by the api client
+        :raise: zlib.error, ValueError, KeyError, TypeError for corrupt or foreign entries
+        """
+        data = bytes(data)
+        data = zlib.decompress(data[1:]) if data[:1] == _COMPRESSED else data[1:]
+        name, separator, body = data.partition(b'\n')
+        if not separator:
+            raise ValueError('entry without a model name')
+        # pylint: disable=protected-access
+        return self._client()._ApiClient__deserialize(json.loads(body), name.decode())
+
+    def _load(self, entry: Tuple[float, bytes]):
+        """
+        response of an entry, None (a miss) when it can't be deserialised
+        """
+        try:
+            return self.loads(entry[1])
+        except (zlib.error, ValueError, KeyError, TypeError):
+            self.errors += 1
+            return None
+
+    def ttl_for(self, key: tuple) -> float:
+        """
+        ttl of a key, looked up by the operation name it starts with
+        """
+        return self.ttls.get(key[0], self.default_ttl)
+
+    def _entry(self, key: tuple, stale=False) -> Optional[Tuple[float, bytes]]:
+        since = time.time() - (self.stale_for if stale else 0)
+        try:
+            return self._raw_get(self._key(key), since)
+        except (sqlite3.Error, OSError):  # an unavailable cache is a miss
+            self.errors += 1
+            return None
+
+    def get(self, key: tuple):
+        """
+        returns the cached response for key, or None when missing / expired
+        """
+        entry = self._entry(key)
+        value = self._load(entry) if entry is not None else None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def get_stale(self, key: tuple):
+        """
+        returns the response for key expired less than `stale_for` seconds ago
+        (or still fresh), None otherwise
+        """
+        entry = self._entry(key, stale=True)
+        value = self._load(entry) if entry is not None else None
+        if value is not None:
+            self.stale_hits += 1
+        return value
+
+    def time_left(self, key: tuple) -> float:
+        """
+        seconds until the entry for key expires, 0 when missing
+        """
+        entry = self._entry(key)
+        return max(entry[0] - time.time(), 0.0) if entry is not None else 0.0
+
+    def set(self, key: tuple, value, ttl=None):
+        """
+        store a response
+        :param key: normalised request parameters
+        :param value: response to cache, a swagger model
+        :param ttl: seconds until the entry expires, defaults to the operation's ttl
+        """
+        ttl = self.ttl_for(key) if ttl is None else ttl
+        if ttl <= 0:
+            return
+        try:
+            self._raw_set(self._key(key), time.time() + ttl, self.dumps(value))
+        except (sqlite3.Error, OSError):
+            self.errors += 1
+
+    def clear(self):
+        """
+        drop every entry
+        """
+        self._raw_clear()
+
+    def stats(self) -> dict:
+        """
+        returns cache counters, hits and misses are counted by this process only
+        """
+        return {
+            'entries': self._raw_count(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'errors': self.errors,
+        }
+
+
+class SQLiteCache(SharedCache):
+    """
+    shared cache kept in a sqlite database, every process and thread uses its own
+    connection. once more than `max_entries` are stored the entries closest to
+    expiring are evicted, checked every `evict_every` writes of a process
+        :var path: database file
+        :var max_entries: entries kept
+    """
+    def __init__(
+            self, path, max_entries=10000, ttls=None, default_ttl=60, evict_every=64,
+            stale_for=0
+    ):
+        super().__init__(ttls, default_ttl, stale_for)
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.evictions = 0
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, expires REAL NOT NULL, value BLOB NOT NULL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)'
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        connection of the current thread, connections are not shared with forked processes
+        """
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            local.connection.execute('PRAGMA journal_mode=WAL')
+            local.connection.execute('PRAGMA synchronous=NORMAL')
+            local.pid = os.getpid()
+        return local.connection
+
+    def _raw_get(self, key: str, since: float) -> Optional[Tuple[float, bytes]]:
+        return self._connection().execute(
+            'SELECT expires, value FROM responses WHERE key = ? AND expires > ?',
+            (key, since)
+        ).fetchone()
+
+    def _raw_set(self, key: str, expires: float, value: bytes):
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO responses (key, expires, value) VALUES (?, ?, ?)',
+            (key, expires, value)
+        )
+        self._writes += 1
+        if self._writes % self.evict_every == 0:
+            self._evict(connection)
+
+    def _evict(self, connection: sqlite3.Connection):
+        """
+        drop entries past their stale window, then those closest to expiring above `max_entries`
+        """
+        deleted = connection.execute(
+            'DELETE FROM responses WHERE expires <= ?', (time.time() - self.stale_for,)
+        ).rowcount
+        extra = self._raw_count() - self.max_entries
+        if extra > 0:
+            deleted += connection.execute(
+                'DELETE FROM responses WHERE key IN '
+                '(SELECT key FROM responses ORDER BY expires LIMIT ?)', (extra,)
+            ).rowcount
+        self.evictions += deleted
+
+    def _raw_clear(self):
+        self._connection().execute('DELETE FROM responses')
+
+    def _raw_count(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def stats(self) -> dict:
+        return dict(super().stats(), max_entries=self.max_entries, evictions=self.evictions)
+
+
+class TieredCache:
+    """
+    process local cache in front of a shared cache, local misses are read from
+    the shared cache and kept locally until the shared entry expires
+        :var local: ResponseCache
+        :var shared: SharedCache
+    """
+    def __init__(self, local: ResponseCache, shared: SharedCache):
+        self.local = local
+        self.shared = shared
+
+    def ttl_for(self, key: tuple) -> float:
+        """
+        ttl of a key
+        """
+        return self.shared.ttl_for(key)
+
+    def get(self, key: tuple):
+        """
+        returns the cached response for key, or None when missing / expired
+        """
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        # pylint: disable=protected-access
+        entry = self.shared._entry(key)
+        value = self.shared._load(entry) if entry is not None else None
+        if value is None:
+            self.shared.misses += 1
+            return None
+        self.shared.hits += 1
+        self.local.set(key, value, ttl=entry[0] - time.time())
+        return value
+
+    def get_stale(self, key: tuple):
+        """
+        returns the response for key expired less than `stale_for` seconds ago, from
+        either cache, None otherwise
+        """
+        value = self.local.get_stale(key)
+        return value if value is not None else self.shared.get_stale(key)
+
+    def time_left(self, key: tuple) -> float:
+        """
+        seconds until the entry for key expires, 0 when missing
+        """
+        return self.local.time_left(key) or self.shared.time_left(key)
+
+    def set(self, key: tuple, value, ttl=None):
+        """
+        store a response locally and in the shared cache
+        """
+        self.local.set(key, value, ttl if ttl is not None else self.ttl_for(key))
+        self.shared.set(key, value, ttl)
+
+    def clear(self):
+        """
+        drop every entry of both caches
+        """
+        self.local.clear()
+        self.shared.clear()
+
+    def stats(self) -> dict:
+        """
+        returns the counters of both caches
+        """
+        return {'local': self.local.stats(), 'shared': self.shared.stats()}
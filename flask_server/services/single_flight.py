@@ -0,0 +1,148 @@
+"""
+request coalescing: concurrent calls sharing a key wait for the first one
+(the leader) and receive its result or error, instead of each sending an
+identical api request. `SingleFlight` coalesces the calls of threads,
+`AsyncSingleFlight` those of the coroutines of an event loop
+"""
+import asyncio
+import os
+import threading
+
+
+class _Call:
+    """
+    a call in flight, followers wait on `done`
+    """
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Process wide registry of calls in flight, safe to share between threads
+        :var calls: int -> calls executed
+        :var coalesced: int -> calls answered by another caller's call
+        :methods
+            do
+            stats
+    """
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._flights = {}
+
+    def _check_pid(self):
+        """
+        forget calls inherited from a parent process, their threads did not survive the fork
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._flights = {}
+                self.calls = self.coalesced = 0
+
+    def do(self, key: tuple, function, timeout=None):
+        """
+        returns `function()`, or the result of the identical call already in flight under key
+        :param timeout: seconds to wait for a call in flight, None waits for it to finish
+        :raises: the error raised by the call, TimeoutError when the call outlasts `timeout`
+        """
+        self._check_pid()
+        with self._lock:
+            call = self._flights.get(key)
+            leader = call is None
+            if leader:
+                call = self._flights[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError(f'{key[0]} still in flight after {timeout}s')
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function()
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                self.calls += 1
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        """
+        returns flight counters
+        """
+        return {
+            'in_flight': len(self._flights),
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+        }
+
+
+class AsyncSingleFlight:
+    """
+    Registry of the calls in flight of an event loop, for coroutines
+        :var calls: int -> calls executed
+        :var coalesced: int -> calls answered by another caller's call
+        :methods
+            do
+            stats
+    """
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._flights = {}
+
+    async def do(self, key: tuple, function, timeout=None):
+        """
+        returns `await function()`, or the result of the identical call already in flight under key
+        :param timeout: seconds to wait for a call in flight, None waits for it to finish
+        :raises: the error raised by the call, TimeoutError when the call outlasts `timeout`
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            try:
+                # a follower giving up must not cancel the leader's call
+                return await asyncio.wait_for(asyncio.shield(flight), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f'{key[0]} still in flight after {timeout}s') from None
+        flight = self._flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await function()
+        except Exception as err:
+            flight.set_exception(err)
+            flight.exception()  # retrieved, a call without followers logs nothing
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            del self._flights[key]
+            self.calls += 1
+            if not flight.done():  # the leader was cancelled, its followers time out
+                flight.set_exception(TimeoutError(f'{key[0]} was cancelled'))
+                flight.exception()
+
+    def stats(self) -> dict:
+        """
+        returns flight counters
+        """
+        return {
+            'in_flight': len(self._flights),
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+        }
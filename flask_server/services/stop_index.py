@@ -0,0 +1,198 @@
+"""
+in-memory autocomplete index of stops, populated from the stop finder
+responses received from the api (and optionally seeded from a file),
+so that as-you-type searches can be answered without an api call
+"""
+import json
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from heapq import nlargest
+from typing import Iterable, List, Optional, Sequence
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalise(text: str) -> str:
+    """
+    lower case text with punctuation collapsed to single spaces
+    """
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def trigrams(text: str) -> set:
+    """
+    set of 3 letter substrings of normalised text, padded so that
+    word starts weigh more than word middles
+    """
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class StopIndex:
+    """
+    trigram / prefix index of stop names, suburbs, ids and transport modes,
+    safe to share between threads
+        :var max_stops: stops held before new stops are ignored
+        :var min_score: lowest similarity returned by `search`
+        :methods
+            add
+            add_locations
+            load
+            search
+            parent_of
+    """
+    def __init__(self, max_stops=100000, min_score=0.2):
+        self.max_stops = max_stops
+        self.min_score = min_score
+        self._stops = {}
+        self._parents = {}  # platform id: id of its stop / station
+        self._trigrams = defaultdict(set)
+        self._words = defaultdict(set)
+        self._sorted_words = []
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._stops)
+
+    def add(self, stop_id: str, name: str, modes: Sequence[int] = (), coord=None):
+        """
+        add or update a stop
+        :param stop_id: api stop id
+        :param name: stop name, usually `<stop>, <suburb>`
+        :param modes: transport mode ids of the stop, see `VALID_TRANSPORT`
+        :param coord: [lat, long] of the stop
+        """
+        if not stop_id or not name:
+            return
+        text = normalise(name)
+        with self._lock:
+            known = self._stops.get(stop_id)
+            if known is None and len(self._stops) >= self.max_stops:
+                return
+            if known is not None and known['name'] == name:
+                known['modes'] = list(modes or known['modes'])
+                known['coord'] = coord or known['coord']
+                return
+            if known is not None:  # renamed, drop the old name's entries
+                for gram in known['_trigrams']:
+                    self._trigrams[gram].discard(stop_id)
+                for word in known['_text'].split():
+                    self._words[word].discard(stop_id)
+            self._stops[stop_id] = {
+                'id': stop_id, 'name': name,
+                'suburb': name.rsplit(',', 1)[-1].strip(),
+                'modes': list(modes or ()), 'coord': coord,
+                '_text': text, '_trigrams': trigrams(text)
+            }
+            for gram in self._stops[stop_id]['_trigrams']:
+                self._trigrams[gram].add(stop_id)
+            for word in text.split() + [normalise(stop_id)]:
+                if word not in self._words:
+                    self._dirty = True
+                self._words[word].add(stop_id)
+
+    def add_locations(self, locations: Iterable):
+        """
+        add the locations of a stop finder response
+        """
+        for location in locations or ():
+            self.add(location.id, location.name, location.modes, location.coord)
+            if location.type == 'platform' and location.parent is not None:
+                with self._lock:
+                    if len(self._parents) < self.max_stops:
+                        self._parents[location.id] = location.parent.id
+
+    def parent_of(self, stop_id: str) -> Optional[str]:
+        """
+        id of the stop a platform belongs to, None when unknown or not a platform
+        """
+        return self._parents.get(stop_id)
+
+    def load(self, path: str):
+        """
+        seed the index from a json file holding a list of stops, or from
+        a json lines file with a stop per line, stops being dicts of `id`, `name`,
+        and optionally `modes` and `coord`
+        """
+        with open(path, 'r') as seed:
+            text = seed.read().strip()
+        if text.startswith('['):
+            stops = json.loads(text)
+        else:
+            stops = [json.loads(line) for line in text.splitlines() if line.strip()]
+        for stop in stops:
+            self.add(stop['id'], stop['name'], stop.get('modes', ()), stop.get('coord'))
+
+    def _prefixed(self, prefix: str) -> set:
+        """
+        ids of stops having a word starting with prefix
+        """
+        if self._dirty:
+            self._sorted_words = sorted(self._words)
+            self._dirty = False
+        words = self._sorted_words
+        ids = set()
+        position = bisect_left(words, prefix)
+        while position < len(words) and words[position].startswith(prefix):
+            ids |= self._words[words[position]]
+            position += 1
+        return ids
+
+    def search(self, query: str, limit=10, modes: Sequence[int] = ()) -> List[dict]:
+        """
+        stops best matching query, ranked by trigram similarity with a bonus
+        for words starting with the query's words
+        :param query: partial stop name, suburb or id
+        :param limit: maximum number of results
+        :param modes: only return stops serving one of these transport modes
+        :return: list of dicts of `id`, `name`, `suburb`, `modes`, `coord` and `score`
+        """
+        text = normalise(query)
+        if not text:
+            return []
+        grams = trigrams(text)
+        words = text.split()
+        with self._lock:
+            # every word of the query must prefix a word of the stop
+            prefixed = self._prefixed(words[0])
+            for word in words[1:]:
+                prefixed &= self._prefixed(word)
+            if len(prefixed) >= limit:
+                candidates = prefixed
+            else:
+                # not enough prefix matches, add fuzzy matches counting shared trigrams,
+                # trigrams common to a large share of the stops are skipped
+                common = max(100, len(self._stops) // 20)
+                counts = defaultdict(int)
+                for gram in grams:
+                    posting = self._trigrams.get(gram, ())
+                    if len(posting) <= common:
+                        for stop_id in posting:
+                            counts[stop_id] += 1
+                candidates = prefixed.union(
+                    nlargest(limit * 4, counts, key=counts.__getitem__)
+                )
+            ranked = []
+            for stop_id in candidates:
+                stop = self._stops[stop_id]
+                if modes and not any(mode in stop['modes'] for mode in modes):
+                    continue
+                shared = len(grams & stop['_trigrams'])
+                score = shared / (len(grams) + len(stop['_trigrams']) - shared)
+                if stop_id in prefixed:
+                    score += 0.5 + (0.5 if stop['_text'].startswith(text) else 0)
+                if stop_id == query:
+                    score += 2
+                if score >= self.min_score:
+                    ranked.append((score, stop))
+        ranked = nlargest(limit, ranked, key=lambda match: (match[0], match[1]['id']))
+        return [
+            {
+                'id': stop['id'], 'name': stop['name'], 'suburb': stop['suburb'],
+                'modes': stop['modes'], 'coord': stop['coord'], 'score': round(score, 3)
+            }
+            for score, stop in ranked
+        ]
@@ -0,0 +1,46 @@
+"""
+streamed template rendering, the page is sent to the browser in chunks as the
+template renders instead of once the whole page is built
+(flask 1.1 has no `stream_template`)
+"""
+from flask import Response, current_app, stream_with_context
+
+from flask_server.services.tracing import current_span, span
+
+# template events gathered into each chunk sent, avoids a write per line of markup
+STREAM_BUFFER_SIZE = 8
+
+
+def _render_stream(template_name: str, context: dict):
+    """
+    jinja template stream of a template of the current app
+    """
+    app = current_app._get_current_object()  # pylint: disable=protected-access
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return stream
+
+
+def _traced_stream(template_name: str, stream, parent):
+    """
+    the chunks of a template stream, timed as a span of `parent` (including the
+    generators it consumes). the stream is sent once the view returned, so the
+    span the view ran in is passed along
+    """
+    with span(f'render {template_name}', parent, streamed=True):
+        yield from stream
+
+
+def stream_template(template_name: str, **context) -> Response:
+    """
+    render a template as a streamed response, generators passed in the context
+    are consumed while the response is sent, within the request context
+    :return: Response
+    """
+    return Response(
+        stream_with_context(_traced_stream(
+            template_name, _render_stream(template_name, context), current_span()
+        )),
+        mimetype='text/html'
+    )
@@ -1,19 +1,166 @@
 """
-responsible for setting up swagger instance. to be injected in our client class
+responsible for setting up swagger instance. to be injected in our client class.
+the generated swagger_client package (every api model) is only imported once the
+first instance is built or an api error is checked, not when the app starts
 """
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from queue import LifoQueue, Empty, Full
+from typing import TYPE_CHECKING
 
-from swagger_client.api import TripPlannerApi
-from swagger_client.api_client import ApiClient
-from swagger_client import Configuration
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
 
+from flask_server.services.tracing import traced
 
-def start(api_key) -> TripPlannerApi:
+if TYPE_CHECKING:
+    from swagger_client.api import TripPlannerApi
+
+# keep idle sockets to the trip planner api open between requests
+KEEP_ALIVE_OPTIONS = HTTPConnection.default_socket_options + [
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+]
+
+
+def api_exception() -> type:
+    """
+    swagger's ApiException, raised when the api rejects a call
+    """
+    from swagger_client.rest import ApiException  # pylint: disable=import-outside-toplevel
+    return ApiException
+
+
+def start(api_key, keep_alive=True, retries=None, host=None) -> 'TripPlannerApi':
     """
     start an instance of the trip planner api
     :param api_key: trip planner api key
+    :param keep_alive: enable tcp keep-alive on the instance's connections
+    :param retries: times a call is retried after failing to connect, None keeps urllib3's default
+    :param host: base url of the api, None keeps the swagger client's
     :return: TripPlannerApi
     """
+    # pylint: disable=import-outside-toplevel
+    from swagger_client import Configuration
+    from swagger_client.api import TripPlannerApi
+    from swagger_client.api_client import ApiClient
+
     config = Configuration()
     config.access_token = api_key
+    if host:
+        config.host = host.rstrip('/')
+    # an instance is only ever used by one thread at a time (see `SwaggerPool`)
+    config.connection_pool_maxsize = 1
     client = ApiClient(config)
+    # time the conversion of responses into swagger models in traces
+    client.deserialize = traced('swagger.deserialize')(client.deserialize)
+    if keep_alive:
+        client.rest_client.pool_manager.connection_pool_kw['socket_options'] = (
+            KEEP_ALIVE_OPTIONS
+        )
+    if retries is not None:
+        # a read timing out is not retried, the api is already struggling to answer
+        client.rest_client.pool_manager.connection_pool_kw['retries'] = Retry(
+            total=retries, read=0
+        )
     return TripPlannerApi(client)
+
+
+class SwaggerPool:
+    """
+    Process wide pool of swagger instances, so connections (and the
+    thread pool each `ApiClient` owns) are reused across requests instead of
+    being rebuilt every time.
+        :var size: number of idle instances kept warm
+        :var timeout: per call timeout passed to the api, (connect, read) or total seconds
+        :var retries: times a call is retried after failing to connect
+        :var host: base url of the api, None for the swagger client's
+        :var hits: instances handed out from the pool
+        :var misses: instances that had to be built
+        :methods
+            acquire
+            release
+            lease
+            stats
+    """
+    def __init__(
+            self, api_key, size=4, timeout=None, keep_alive=True, retries=None, host=None
+    ):
+        self.api_key = api_key
+        self.size = size
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.retries = retries
+        self.host = host
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._idle = LifoQueue(maxsize=size)
+
+    def _check_pid(self):
+        """
+        drop every instance inherited from a parent process, sockets
+        must never be shared between forked workers
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._idle = LifoQueue(maxsize=self.size)
+                self.hits = self.misses = 0
+
+    def acquire(self) -> 'TripPlannerApi':
+        """
+        take an idle instance from the pool, building a new one when all are in use
+        :return: TripPlannerApi
+        """
+        self._check_pid()
+        try:
+            instance = self._idle.get_nowait()
+        except Empty:
+            instance = None
+        with self._lock:
+            if instance is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if instance is None:
+            instance = start(self.api_key, self.keep_alive, self.retries, self.host)
+        return instance
+
+    def release(self, instance: 'TripPlannerApi'):
+        """
+        hand an instance back to the pool, instances over the pool size are discarded
+        :param instance: instance returned by `acquire`
+        """
+        if self._pid != os.getpid():
+            return
+        try:
+            self._idle.put_nowait(instance)
+        except Full:
+            pass
+
+    @contextmanager
+    def lease(self):
+        """
+        borrow an instance for the duration of a with block
+        """
+        instance = self.acquire()
+        try:
+            yield instance
+        finally:
+            self.release(instance)
+
+    def stats(self) -> dict:
+        """
+        returns pool counters
+        """
+        return {
+            'size': self.size,
+            'idle': self._idle.qsize(),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -0,0 +1,277 @@
+"""
+request tracing: every traced request gets an id (from `X-Request-Id` or a new one)
+and records nested spans with their timings and attributes, until its response
+(streamed or not) is sent. spans started on other threads nest under the span
+that handed them work when the work runs in a copy of its context
+(`contextvars.copy_context().run`), as `Client.gather` and the hedger do.
+
+`span` is a no-op outside a traced request, so code can be instrumented freely.
+finished traces are written, one json line per trace, to a file (`JsonLinesSink`)
+or kept in memory for the /debug/traces endpoint (`RingBufferSink`)
+"""
+import json
+import os
+import random
+import threading
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from itertools import count
+from time import perf_counter, time
+
+from flask import g, request, before_render_template, template_rendered
+
+_current = ContextVar('trace_span', default=None)
+_span_ids = count(1)
+# longest request id accepted from a client
+MAX_REQUEST_ID = 64
+
+
+class Span:
+    """
+    timed part of a trace
+        :var trace: Trace -> trace the span belongs to
+        :var name: str -> what was timed eg. 'client.find_trips_for_stop'
+        :var attributes: dict -> details eg. the api operation and cache outcome
+    """
+    __slots__ = (
+        'trace', 'span_id', 'parent_id', 'name', 'attributes', 'thread', 'start', 'duration'
+    )
+
+    def __init__(self, trace: 'Trace', name: str, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = next(_span_ids)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.thread = threading.current_thread().name
+        self.start = perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        """
+        add attributes to the span
+        """
+        self.attributes.update(attributes)
+
+    def finish(self):
+        """
+        end the span, recording it in its trace
+        """
+        self.duration = perf_counter() - self.start
+        self.trace.spans.append(self)
+
+    def to_dict(self) -> dict:
+        """
+        json ready dict of the span, times in milliseconds from the start of the trace
+        """
+        return {
+            'id': self.span_id, 'parent': self.parent_id, 'name': self.name,
+            'thread': self.thread,
+            'start_ms': round((self.start - self.trace.start) * 1000, 3),
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'attributes': self.attributes,
+        }
+
+
+class Trace:
+    """
+    spans of one request
+        :var trace_id: str -> request id
+        :var spans: list -> finished spans, appended from any thread
+    """
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.timestamp = time()
+        self.start = perf_counter()
+        self.spans = []
+
+    def to_dict(self) -> dict:
+        """
+        json ready dict of the trace, spans in start order
+        """
+        spans = sorted(self.spans, key=lambda span: span.start)
+        return {
+            'trace_id': self.trace_id,
+            'timestamp': self.timestamp,
+            'duration_ms': spans[0].to_dict()['duration_ms'] if spans else None,
+            'spans': [span.to_dict() for span in spans],
+        }
+
+
+@contextmanager
+def span(name: str, parent=None, **attributes):
+    """
+    time a with block as a child of `parent`, the current span by default,
+    yields the Span (None outside a trace)
+    """
+    parent = parent or _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def traced(name: str):
+    """
+    decorator timing each call of a function as a span
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return function(*args, **kwargs)
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    """
+    returns the current span, None outside a traced request
+    """
+    return _current.get()
+
+
+def start_trace(trace_id: str, name: str, **attributes) -> Span:
+    """
+    start a trace with its root span, which becomes the current span
+    """
+    root = Span(Trace(trace_id), name, attributes=attributes)
+    _current.set(root)
+    return root
+
+
+class JsonLinesSink:
+    """
+    appends each trace as a json line to a file
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, trace: Trace):
+        """
+        write a finished trace
+        """
+        line = json.dumps(trace.to_dict(), default=str) + '\n'
+        with self._lock, open(self.path, 'a') as file:
+            file.write(line)
+
+
+class RingBufferSink:
+    """
+    keeps the most recent traces of the process in memory
+    """
+    def __init__(self, size=200):
+        self._traces = deque(maxlen=size)
+
+    def emit(self, trace: Trace):
+        """
+        keep a finished trace, dropping the oldest
+        """
+        self._traces.append(trace)
+
+    def traces(self, limit=None) -> list:
+        """
+        dicts of the kept traces, most recent first
+        """
+        traces = list(self._traces)[::-1]
+        return [trace.to_dict() for trace in traces[:limit]]
+
+
+def _request_id() -> str:
+    """
+    id of the current request, the client's `X-Request-Id` when usable
+    """
+    given = request.headers.get('X-Request-Id', '')
+    if 0 < len(given) <= MAX_REQUEST_ID and given.replace('-', '').isalnum():
+        return given
+    return uuid.uuid4().hex
+
+
+def _traced_hook(function, name: str):
+    """
+    a request hook recorded as a span
+    """
+    @wraps(function)
+    def hook(*args, **kwargs):
+        with span(name):
+            return function(*args, **kwargs)
+    return hook
+
+
+def init_app(app):
+    """
+    trace `TRACING_SAMPLE_RATE` of the requests into the `TRACING_SINK` ('memory' or
+    the path of a json lines file), call once every before_request hook is registered
+    """
+    if not app.config.get('TRACING_ENABLED', False):
+        app.extensions['traces'] = None
+        return
+    target = app.config.get('TRACING_SINK', 'memory')
+    sink = app.extensions['traces'] = (
+        RingBufferSink(app.config.get('TRACING_BUFFER_SIZE', 200)) if target == 'memory'
+        else JsonLinesSink(target)
+    )
+    sample_rate = app.config.get('TRACING_SAMPLE_RATE', 1.0)
+
+    def start_request_trace():
+        if sample_rate < 1 and random.random() >= sample_rate:
+            return
+        g.trace_root = start_trace(
+            _request_id(), 'request', method=request.method,
+            route=request.url_rule.rule if request.url_rule is not None else None,
+            path=request.path, pid=os.getpid()
+        )
+
+    # the other hooks (eg. opening the saved items' database) are timed as spans
+    for blueprint, hooks in app.before_request_funcs.items():
+        hooks[:] = [
+            _traced_hook(hook, f'before_request {blueprint or "app"}.{hook.__name__}')
+            for hook in hooks
+        ]
+    app.before_request_funcs.setdefault(None, []).insert(0, start_request_trace)
+
+    @app.after_request
+    def add_request_id(response):
+        root = g.get('trace_root')
+        if root is not None:
+            root.set(status=response.status_code)
+            response.headers['X-Request-Id'] = root.trace.trace_id
+        return response
+
+    @app.teardown_request
+    def finish_request_trace(_):
+        # the request context is torn down once a streamed response has been sent
+        root = g.pop('trace_root', None)
+        if root is not None:
+            _current.set(None)
+            root.finish()
+            sink.emit(root.trace)
+
+    def start_render(_, template=None, **__):
+        parent = _current.get()
+        if parent is not None:
+            render = Span(parent.trace, f'render {template.name}', parent.span_id)
+            g.setdefault('trace_renders', []).append((render, _current.set(render)))
+
+    def finish_render(_, **__):
+        renders = g.get('trace_renders')
+        if renders:
+            render, token = renders.pop()
+            _current.reset(token)
+            render.finish()
+
+    # render_template sends these signals, streamed templates are timed by `stream_template`
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(finish_render, app, weak=False)
@@ -0,0 +1,33 @@
+"""
+process wide thread pool used to send api calls concurrently
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_LOCK = threading.Lock()
+_STATE = {'executor': None, 'pid': None, 'max_workers': 16}
+
+
+def configure(max_workers: int):
+    """
+    set the number of threads of the pool, takes effect when the pool is next created
+    :param max_workers: maximum number of concurrent api calls per process
+    """
+    _STATE['max_workers'] = max_workers
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    returns the thread pool of the current process, created on first use
+    (threads do not survive a fork, so forked workers build their own)
+    :return: ThreadPoolExecutor
+    """
+    if _STATE['pid'] != os.getpid():
+        with _LOCK:
+            if _STATE['pid'] != os.getpid():
+                _STATE['executor'] = ThreadPoolExecutor(
+                    max_workers=_STATE['max_workers'], thread_name_prefix='api-call'
+                )
+                _STATE['pid'] = os.getpid()
+    return _STATE['executor']
@@ -0,0 +1,29 @@
+"""# startup asgi container
+Quart app asgi container (to be used by hypercorn, uvicorn, etc)
+eg. `hypercorn -w 2 flask_server.start_async:APP`
+"""
+
+
+from quart import render_template
+from flask_server.asgi import create_app
+
+APP = create_app()
+
+@APP.errorhandler(404)
+async def not_found(_):
+    """
+    not found error
+    """
+    return await render_template("404.jinja2"), 404
+
+
+@APP.errorhandler(500)
+async def service_unavailable(_):
+    """
+    500 error handler
+    """
+    return "Service Unavailable :(", 500
+
+
+if __name__ == '__main__':
+    APP.run()
@@ -0,0 +1,9 @@
+"""# Offline Timetable
+GTFS static feeds imported into column files which are memory mapped by
+every worker, used to answer api calls locally when the trip planner api
+is slow or unavailable
+    - gtfs_import: builds the column files from a GTFS zip
+    - store: read only, memory mapped access to the columns
+    - raptor: journey planner over the timetable
+    - provider: `Client` compatible stop / departure / trip lookups
+"""
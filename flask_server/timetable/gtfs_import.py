@@ -0,0 +1,332 @@
+"""
+imports a GTFS static feed (zip) into the column files read by `store.Timetable`
+
+usage: python -m flask_server.timetable.gtfs_import <feed.zip> <timetable directory>
+
+stop_times are grouped by trip (in stop sequence order) with a second
+ordering by stop and departure time, both built with counting sorts so that
+large feeds import without holding python objects per row.
+trips are also grouped into patterns (trips visiting the same stops in the
+same order) and transfers between stops are listed, for the journey planner
+"""
+import csv
+import io
+import json
+import sys
+import zipfile
+from array import array
+from pathlib import Path
+
+from flask_server.timetable.store import FORMAT_VERSION, META_FILE, column_file
+
+# gtfs route_type -> api transport mode (see `VALID_TRANSPORT`),
+# covering the basic and the extended route types
+ROUTE_TYPE_MODES = {0: 4, 1: 1, 2: 1, 3: 5, 4: 9, 5: 4, 11: 5, 12: 1}
+EXTENDED_ROUTE_TYPE_MODES = ((100, 1), (200, 7), (400, 1), (700, 5), (900, 4), (1000, 9))
+SCHOOL_BUS_ROUTE_TYPE = 712
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+# seconds to change between platforms of the same station, unless transfers.txt says otherwise
+MIN_TRANSFER_SECONDS = 120
+
+
+def route_type_mode(route_type: int) -> int:
+    """
+    api transport mode of a gtfs route type, defaults to bus
+    """
+    if route_type == SCHOOL_BUS_ROUTE_TYPE:
+        return 11
+    if route_type in ROUTE_TYPE_MODES:
+        return ROUTE_TYPE_MODES[route_type]
+    mode = 5
+    for first_type, type_mode in EXTENDED_ROUTE_TYPE_MODES:
+        if route_type >= first_type:
+            mode = type_mode
+    return mode
+
+
+def parse_time(text: str) -> int:
+    """
+    seconds since midnight of a gtfs time (HH:MM:SS, hours may exceed 23), -1 when empty
+    """
+    text = text.strip()
+    if not text:
+        return -1
+    hours, minutes, seconds = text.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+class StringTable:
+    """
+    deduplicated strings written to strings.blob / strings.offsets
+    """
+    def __init__(self):
+        self.indices = {}
+        self.blob = bytearray()
+        self.offsets = array('I', [0])
+
+    def add(self, text: str) -> int:
+        """
+        returns the index of text, adding it when new
+        """
+        index = self.indices.get(text)
+        if index is None:
+            index = self.indices[text] = len(self.offsets) - 1
+            self.blob += text.encode('utf-8')
+            self.offsets.append(len(self.blob))
+        return index
+
+
+def read_table(feed: zipfile.ZipFile, name: str):
+    """
+    yields the rows of a feed file as dicts, nothing when the file is missing
+    """
+    if name not in feed.namelist():
+        return
+    with feed.open(name) as table:
+        yield from csv.DictReader(io.TextIOWrapper(table, encoding='utf-8-sig'))
+
+
+def counting_sort(keys: array, buckets: int) -> (array, array):
+    """
+    stable ordering of row numbers by an integer key in [0, buckets)
+    :return: (order, starts) -> row numbers grouped by key, and where each key's rows start
+    """
+    starts = array('I', bytes(4 * (buckets + 1)))
+    for key in keys:
+        starts[key + 1] += 1
+    for bucket in range(buckets):
+        starts[bucket + 1] += starts[bucket]
+    fill = array('I', starts)
+    order = array('I', bytes(4 * len(keys)))
+    for row, key in enumerate(keys):
+        order[fill[key]] = row
+        fill[key] += 1
+    return order, starts
+
+
+def build_patterns(columns: dict, trip_count: int, stop_count: int):
+    """
+    group trips stopping at the same stops in the same order into patterns,
+    each pattern's trips ordered by departure from its first stop
+    """
+    trip_starts = columns['trips.stop_times_start']
+    stop_times_stop = columns['stop_times.stop']
+    departures = columns['stop_times.departure']
+    patterns = {}
+    pattern_trips = []
+    trip_pattern = array('i')
+    for trip in range(trip_count):
+        stops = tuple(stop_times_stop[trip_starts[trip]:trip_starts[trip + 1]])
+        pattern = patterns.setdefault(stops, len(patterns))
+        if pattern == len(pattern_trips):
+            pattern_trips.append([])
+        pattern_trips[pattern].append(trip)
+        trip_pattern.append(pattern)
+    columns['trips.pattern'] = trip_pattern
+    pattern_stops = array('I')
+    stops_start = array('I', [0])
+    for stops in patterns:  # insertion ordered, by pattern number
+        pattern_stops.extend(stops)
+        stops_start.append(len(pattern_stops))
+    trips_start = array('I', [0])
+    ordered_trips = array('I')
+    for stops, trips in zip(patterns, pattern_trips):
+        if stops:
+            trips = sorted(trips, key=lambda trip: departures[trip_starts[trip]])
+        ordered_trips.extend(trips)
+        trips_start.append(len(ordered_trips))
+    columns['patterns.stops_start'] = stops_start
+    columns['pattern_stops.stop'] = pattern_stops
+    columns['patterns.trips_start'] = trips_start
+    columns['pattern_trips.trip'] = ordered_trips
+    # patterns through each stop, with the index of the stop in the pattern
+    stop_patterns = [[] for _ in range(stop_count)]
+    for pattern, stops in enumerate(patterns):
+        for index, stop in enumerate(stops):
+            stop_patterns[stop].append((pattern, index))
+    columns['stops.patterns_start'] = array('I', [0])
+    columns['stop_patterns.pattern'] = array('I')
+    columns['stop_patterns.index'] = array('I')
+    for found in stop_patterns:
+        for pattern, index in found:
+            columns['stop_patterns.pattern'].append(pattern)
+            columns['stop_patterns.index'].append(index)
+        columns['stops.patterns_start'].append(len(columns['stop_patterns.pattern']))
+
+
+def build_transfers(columns: dict, listed: dict, stop_count: int):
+    """
+    transfers between platforms of the same station, and those listed in transfers.txt
+    :param listed: dict -> (from stop, to stop): minimum transfer seconds
+    """
+    transfers = dict(listed)
+    stations = {}
+    for stop, parent in enumerate(columns['stops.parent']):
+        if parent >= 0:
+            stations.setdefault(parent, []).append(stop)
+    for platforms in stations.values():
+        for from_stop in platforms:
+            for to_stop in platforms:
+                if from_stop != to_stop:
+                    transfers.setdefault((from_stop, to_stop), MIN_TRANSFER_SECONDS)
+    by_stop = [[] for _ in range(stop_count)]
+    for (from_stop, to_stop), seconds in transfers.items():
+        if from_stop != to_stop:
+            by_stop[from_stop].append((to_stop, seconds))
+    columns['stops.transfers_start'] = array('I', [0])
+    columns['transfers.to'] = array('I')
+    columns['transfers.seconds'] = array('i')
+    for found in by_stop:
+        for to_stop, seconds in sorted(found):
+            columns['transfers.to'].append(to_stop)
+            columns['transfers.seconds'].append(seconds)
+        columns['stops.transfers_start'].append(len(columns['transfers.to']))
+
+
+def import_feed(feed_path, out_dir) -> dict:
+    """
+    import the gtfs zip at `feed_path` into the timetable directory `out_dir`
+    :return: dict -> the meta data written to meta.json
+    """
+    strings = StringTable()
+    columns = {}
+
+    def column(name, typecode):
+        return columns.setdefault(name, array(typecode))
+
+    with zipfile.ZipFile(feed_path) as feed:
+        # stops, parents are resolved once every stop has a row
+        stop_rows = {}
+        parents = []
+        for row in read_table(feed, 'stops.txt'):
+            stop_rows[row['stop_id']] = len(stop_rows)
+            column('stops.id', 'I').append(strings.add(row['stop_id']))
+            column('stops.name', 'I').append(strings.add(row.get('stop_name', '')))
+            column('stops.lat', 'd').append(float(row.get('stop_lat') or 0))
+            column('stops.lon', 'd').append(float(row.get('stop_lon') or 0))
+            column('stops.location_type', 'b').append(int(row.get('location_type') or 0))
+            parents.append(row.get('parent_station', ''))
+        column('stops.parent', 'i').extend(stop_rows.get(parent, -1) for parent in parents)
+
+        route_rows = {}
+        for row in read_table(feed, 'routes.txt'):
+            route_rows[row['route_id']] = len(route_rows)
+            column('routes.id', 'I').append(strings.add(row['route_id']))
+            column('routes.short_name', 'I').append(strings.add(row.get('route_short_name', '')))
+            column('routes.long_name', 'I').append(strings.add(row.get('route_long_name', '')))
+            column('routes.mode', 'b').append(route_type_mode(int(row.get('route_type') or 3)))
+
+        service_rows = {}
+
+        def service(service_id):
+            if service_id not in service_rows:
+                service_rows[service_id] = len(service_rows)
+                column('services.id', 'I').append(strings.add(service_id))
+                column('calendar.days', 'B').append(0)
+                column('calendar.start', 'i').append(0)
+                column('calendar.end', 'i').append(0)
+            return service_rows[service_id]
+
+        for row in read_table(feed, 'calendar.txt'):
+            row_number = service(row['service_id'])
+            columns['calendar.days'][row_number] = sum(
+                1 << bit for bit, day in enumerate(WEEKDAYS) if row.get(day) == '1'
+            )
+            columns['calendar.start'][row_number] = int(row['start_date'])
+            columns['calendar.end'][row_number] = int(row['end_date'])
+        column('calendar_dates.service', 'i')
+        column('calendar_dates.date', 'i')
+        column('calendar_dates.exception', 'b')
+        for row in read_table(feed, 'calendar_dates.txt'):
+            columns['calendar_dates.service'].append(service(row['service_id']))
+            columns['calendar_dates.date'].append(int(row['date']))
+            columns['calendar_dates.exception'].append(int(row['exception_type']))
+
+        trip_rows = {}
+        for row in read_table(feed, 'trips.txt'):
+            trip_rows[row['trip_id']] = len(trip_rows)
+            column('trips.id', 'I').append(strings.add(row['trip_id']))
+            column('trips.route', 'i').append(route_rows[row['route_id']])
+            column('trips.service', 'i').append(service(row['service_id']))
+            column('trips.headsign', 'I').append(strings.add(row.get('trip_headsign', '')))
+
+        listed_transfers = {}
+        for row in read_table(feed, 'transfers.txt'):
+            if row.get('transfer_type') == '3':  # transfer not possible
+                continue
+            stops = stop_rows.get(row['from_stop_id']), stop_rows.get(row['to_stop_id'])
+            if None not in stops:
+                listed_transfers[stops] = int(row.get('min_transfer_time') or 0)
+
+        trips, stops = array('I'), array('I')
+        sequences, arrivals, departures = array('I'), array('i'), array('i')
+        for row in read_table(feed, 'stop_times.txt'):
+            trips.append(trip_rows[row['trip_id']])
+            stops.append(stop_rows[row['stop_id']])
+            sequences.append(int(row['stop_sequence']))
+            arrivals.append(parse_time(row.get('arrival_time', '')))
+            departures.append(parse_time(row.get('departure_time', '')))
+
+    # group stop times by trip, then order each trip by stop sequence
+    order, trip_starts = counting_sort(trips, len(trip_rows))
+    for trip in range(len(trip_rows)):
+        start, end = trip_starts[trip], trip_starts[trip + 1]
+        order[start:end] = array('I', sorted(order[start:end], key=sequences.__getitem__))
+    columns['trips.stop_times_start'] = trip_starts
+    columns['stop_times.trip'] = array('I', (trips[row] for row in order))
+    columns['stop_times.stop'] = array('I', (stops[row] for row in order))
+    arrivals = array('i', (arrivals[row] for row in order))
+    departures = array('i', (departures[row] for row in order))
+    # stops without times (not timepoints) take the previous stop's time
+    for trip in range(len(trip_rows)):
+        last = -1
+        for position in range(trip_starts[trip], trip_starts[trip + 1]):
+            if arrivals[position] < 0:
+                arrivals[position] = departures[position] if departures[position] >= 0 else last
+            if departures[position] < 0:
+                departures[position] = arrivals[position]
+            last = departures[position]
+    columns['stop_times.arrival'] = arrivals
+    columns['stop_times.departure'] = departures
+
+    # second ordering of the stop times by stop, then departure time
+    by_stop, stop_starts = counting_sort(columns['stop_times.stop'], len(stop_rows))
+    for stop in range(len(stop_rows)):
+        start, end = stop_starts[stop], stop_starts[stop + 1]
+        by_stop[start:end] = array('I', sorted(by_stop[start:end], key=departures.__getitem__))
+    columns['stop_times_by_stop.position'] = by_stop
+    columns['stops.departures_start'] = stop_starts
+    build_patterns(columns, len(trip_rows), len(stop_rows))
+    build_transfers(columns, listed_transfers, len(stop_rows))
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name, values in columns.items():
+        with open(column_file(out_dir, name), 'wb') as column_out:
+            values.tofile(column_out)
+    with open(out_dir / 'strings.blob', 'wb') as blob:
+        blob.write(strings.blob)
+    with open(column_file(out_dir, 'strings.offsets'), 'wb') as offsets:
+        strings.offsets.tofile(offsets)
+    meta = {
+        'version': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'feed': Path(feed_path).name,
+        'counts': {
+            'stops': len(stop_rows), 'routes': len(route_rows), 'trips': len(trip_rows),
+            'services': len(service_rows), 'stop_times': len(order)
+        },
+        'columns': {name: values.typecode for name, values in columns.items()},
+    }
+    # written last, a timetable without meta.json is incomplete
+    with open(out_dir / META_FILE, 'w') as meta_out:
+        json.dump(meta, meta_out, indent=2)
+    return meta
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    print(json.dumps(import_feed(sys.argv[1], sys.argv[2])['counts']))
@@ -0,0 +1,295 @@
+"""
+`Client` compatible provider answering stop, departure and trip lookups from
+an imported timetable. responses mimic the swagger response models, so the
+routes and `data_service` generators can consume them unchanged
+"""
+import threading
+from copy import copy
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from dateutil import tz
+
+from flask_server.services.data_service import SYDNEY, UTC, UTC_FORMAT
+from flask_server.services.stop_index import StopIndex
+from flask_server.timetable.raptor import Leg, Raptor
+from flask_server.timetable.store import Timetable
+
+# location types of gtfs stops that can be searched for: stops / platforms and stations
+SEARCHABLE_LOCATION_TYPES = (0, 1)
+
+
+class TimetableClient:
+    """# Timetable Client
+    answers `find_stops_by_name`, `find_destinations_for` and `find_trips_for_stop`
+    from a timetable, with the same arguments, `data` and `error` as `Client`
+    - `timetable`: Timetable -> memory mapped gtfs timetable
+    - `planner`: Raptor -> journey planner over the timetable
+    - `data`: response of the last call
+    - `error`: int -> 200 or 404
+    - `limit`: int -> maximum number of departures returned
+    - `stale`: bool -> always False, timetable answers are never stale
+    """
+    def __init__(self, timetable: Timetable, limit=40, max_trips=5):
+        self.timetable = timetable
+        self.planner = Raptor(timetable, max_trips)
+        self.limit = limit
+        self.data = None
+        self.error = None
+        self.stale = False
+        # shared with siblings
+        self._shared = {'index': None, 'lock': threading.Lock()}
+
+    def sibling(self) -> 'TimetableClient':
+        """
+        a new client sharing our timetable, with its own `data` / `error`
+        """
+        sibling = copy(self)
+        sibling.data = sibling.error = None
+        return sibling
+
+    def _stop_index(self) -> StopIndex:
+        """
+        autocomplete index of the timetable's stops, built on first search
+        """
+        shared = self._shared
+        if shared['index'] is None:
+            with shared['lock']:
+                if shared['index'] is None:
+                    timetable = self.timetable
+                    names = timetable.column('stops.name')
+                    types = timetable.column('stops.location_type')
+                    index = StopIndex(max_stops=timetable.counts['stops'])
+                    for stop in range(timetable.counts['stops']):
+                        if types[stop] in SEARCHABLE_LOCATION_TYPES:
+                            index.add(str(stop), timetable.string(names[stop]))
+                    shared['index'] = index
+        return shared['index']
+
+    def _modes(self, stop: int, sample=2000) -> list:
+        """
+        transport modes of the routes serving a stop or its platforms,
+        from up to `sample` stop times of each
+        """
+        timetable = self.timetable
+        positions = timetable.column('stop_times_by_stop.position')
+        trips = timetable.column('stop_times.trip')
+        routes = timetable.column('trips.route')
+        modes = timetable.column('routes.mode')
+        found = set()
+        for platform in [stop] + timetable.children(stop):
+            for position in timetable.departures_at(platform)[:sample]:
+                found.add(modes[routes[trips[positions[position]]]])
+        return sorted(found)
+
+    def _location(self, stop: int) -> SimpleNamespace:
+        """
+        stop finder location of a stop
+        """
+        timetable = self.timetable
+        parent = timetable.column('stops.parent')[stop]
+        return SimpleNamespace(
+            id=timetable.string(timetable.column('stops.id')[stop]),
+            name=timetable.string(timetable.column('stops.name')[stop]),
+            coord=[timetable.column('stops.lat')[stop], timetable.column('stops.lon')[stop]],
+            modes=self._modes(stop),
+            type='stop' if timetable.column('stops.location_type')[stop] == 1 else 'platform',
+            parent=SimpleNamespace(
+                id=timetable.string(timetable.column('stops.id')[parent])
+            ) if parent >= 0 else None
+        )
+
+    def find_stops_by_name(self, _type: str, query: str, is_id=False) -> SimpleNamespace:
+        """### Find Stop by name
+        find stops matching a name, or the stop with id `query` when `is_id`
+        """
+        if is_id:
+            stop = self.timetable.stop_index(query.strip())
+            stops = [] if stop is None else [stop]
+        else:
+            stops = [int(match['id']) for match in self._stop_index().search(query, 20)]
+        self.data = SimpleNamespace(locations=[self._location(stop) for stop in stops])
+        self.error = 404 if not stops else 200
+        return self.data
+
+    def find_destinations_for(
+            self, _type: str, query: str, request_type: str, date_time=None
+    ) -> SimpleNamespace:
+        """### find destinations for specific stop/location
+        departures from a stop (and its platforms) after `date_time`,
+        a (`%Y-%m-%d`, `%I:%M%p`) tuple of Sydney local time, or now
+        """
+        stop = self.timetable.stop_index(query)
+        if stop is None:
+            self.data, self.error = None, 404
+            return self.data
+        moment = _moment(date_time)
+        events = []
+        # trips of the previous service day may run past midnight (times over 24:00)
+        for days_back in (1, 0):
+            service_day = (moment - timedelta(days=days_back)).date()
+            after = (
+                moment.hour * 3600 + moment.minute * 60 + moment.second + days_back * 86400
+            )
+            events.extend(self._departures(stop, service_day, after))
+        events.sort(key=lambda event: event[0])
+        self.data = SimpleNamespace(stop_events=[event for _, event in events[:self.limit]])
+        self.error = 200
+        return self.data
+
+    def _departures(self, stop: int, service_day, after: int) -> list:
+        """
+        (seconds, stop event) of the departures at a stop and its platforms
+        on `service_day` from `after` seconds
+        """
+        timetable = self.timetable
+        positions = timetable.column('stop_times_by_stop.position')
+        stop_times_trip = timetable.column('stop_times.trip')
+        departures = timetable.column('stop_times.departure')
+        trip_starts = timetable.column('trips.stop_times_start')
+        services = timetable.column('trips.service')
+        date = service_day.year * 10000 + service_day.month * 100 + service_day.day
+        midnight = datetime(service_day.year, service_day.month, service_day.day, tzinfo=SYDNEY)
+        runs = {}
+        events = []
+        for platform in [stop] + timetable.children(stop):
+            found = 0
+            for index in timetable.departures_at(platform, after):
+                position = positions[index]
+                trip = stop_times_trip[position]
+                if position == trip_starts[trip + 1] - 1:
+                    continue  # the trip terminates here
+                service = services[trip]
+                if service not in runs:
+                    runs[service] = timetable.service_runs(service, date)
+                if not runs[service]:
+                    continue
+                seconds = departures[position]
+                departs = (midnight + timedelta(seconds=seconds)).astimezone(UTC)
+                events.append((departs, self._stop_event(platform, trip, departs)))
+                found += 1
+                if found >= self.limit:
+                    break
+        return events
+
+    def _transportation(self, trip: int) -> SimpleNamespace:
+        """
+        route number, name and headsign of a trip
+        """
+        timetable = self.timetable
+        route = timetable.column('trips.route')[trip]
+        short_name = timetable.string(timetable.column('routes.short_name')[route])
+        long_name = timetable.string(timetable.column('routes.long_name')[route])
+        headsign = timetable.string(timetable.column('trips.headsign')[trip])
+        if not headsign:
+            last_stop = timetable.column('stop_times.stop')[timetable.trip_stop_times(trip)[-1]]
+            headsign = timetable.string(timetable.column('stops.name')[last_stop])
+        return SimpleNamespace(
+            number=short_name or long_name, name=long_name or short_name,
+            destination=SimpleNamespace(name=headsign)
+        )
+
+    def _stop_event(self, platform: int, trip: int, departs: datetime) -> SimpleNamespace:
+        """
+        departure monitor stop event of a trip departing a platform
+        """
+        timetable = self.timetable
+        return SimpleNamespace(
+            location=SimpleNamespace(
+                id=timetable.string(timetable.column('stops.id')[platform]),
+                name=timetable.string(timetable.column('stops.name')[platform])
+            ),
+            departure_time_planned=departs.strftime(UTC_FORMAT),
+            transportation=self._transportation(trip)
+        )
+
+    def find_trips_for_stop(
+            self, departure: tuple, destination: tuple, dep: str, date_time=None,
+            calc_number_of_trips=5, **_
+    ) -> SimpleNamespace:
+        """### Find Trips For Stop
+        journeys between two stops (or stations) planned over the timetable,
+        departing after `date_time` or arriving before it when `dep` is 'arr'.
+        only stop ids are supported as origin / destination, not coordinates
+        """
+        timetable = self.timetable
+        stops = [timetable.stop_index(str(location[1])) for location in (departure, destination)]
+        if None in stops or 'coord' in (departure[0], destination[0]):
+            self.data, self.error = None, 404
+            return self.data
+        origin, dest = ([stop] + timetable.children(stop) for stop in stops)
+        moment = _moment(date_time)
+        midnight = datetime(moment.year, moment.month, moment.day, tzinfo=SYDNEY)
+        journeys = self.planner.plan(
+            origin, dest, moment.hour * 3600 + moment.minute * 60 + moment.second,
+            moment.year * 10000 + moment.month * 100 + moment.day,
+            count=int(calc_number_of_trips or 5), arrive_by=dep == 'arr'
+        )
+        self.data = SimpleNamespace(journeys=[
+            SimpleNamespace(
+                legs=[self._leg(leg, midnight) for leg in journey],
+                fare=SimpleNamespace(tickets=[])  # fares are not part of gtfs static feeds
+            ) for journey in journeys
+        ])
+        self.error = 200 if journeys else 404
+        return self.data
+
+    def _stop_sequence(self, stop: int, midnight: datetime, arrives=None, departs=None):
+        """
+        stop of a leg with its planned times
+        """
+        timetable = self.timetable
+        return SimpleNamespace(
+            id=timetable.string(timetable.column('stops.id')[stop]),
+            name=timetable.string(timetable.column('stops.name')[stop]),
+            coord=[timetable.column('stops.lat')[stop], timetable.column('stops.lon')[stop]],
+            arrival_time_planned=_timestamp(midnight, arrives),
+            departure_time_planned=_timestamp(midnight, departs),
+            arrival_time_estimated=None, departure_time_estimated=None
+        )
+
+    def _leg(self, leg: Leg, midnight: datetime) -> SimpleNamespace:
+        """
+        trip response leg of a planned leg, walking legs have no transportation name
+        """
+        stop_times_stop = self.timetable.column('stop_times.stop')
+        arrivals = self.timetable.column('stop_times.arrival')
+        departures = self.timetable.column('stop_times.departure')
+        origin = self._stop_sequence(leg.from_stop, midnight, departs=leg.departs)
+        origin.departure_time_estimated = origin.departure_time_planned
+        destination = self._stop_sequence(leg.to_stop, midnight, arrives=leg.arrives)
+        destination.arrival_time_estimated = destination.arrival_time_planned
+        if leg.trip is None:
+            transportation = SimpleNamespace(name=None, number=None, destination=None)
+            stop_sequence = [origin, destination]
+        else:
+            transportation = self._transportation(leg.trip)
+            stop_sequence = [
+                self._stop_sequence(
+                    stop_times_stop[position], midnight, arrivals[position], departures[position]
+                ) for position in leg.positions
+            ]
+        return SimpleNamespace(
+            duration=leg.arrives - leg.departs, origin=origin, destination=destination,
+            transportation=transportation, stop_sequence=stop_sequence
+        )
+
+
+def _moment(date_time=None) -> datetime:
+    """
+    Sydney time of a (`%Y-%m-%d`, `%I:%M%p`) tuple, or now
+    """
+    if date_time is None:
+        return datetime.now(tz.tzlocal()).astimezone(SYDNEY)
+    return datetime.strptime(
+        f'{date_time[0]} {date_time[1]}', '%Y-%m-%d %I:%M%p'
+    ).replace(tzinfo=SYDNEY)
+
+
+def _timestamp(midnight: datetime, seconds: int = None):
+    """
+    api timestamp (utc) of `seconds` after midnight of a service day, None without seconds
+    """
+    if seconds is None:
+        return None
+    return (midnight + timedelta(seconds=seconds)).astimezone(UTC).strftime(UTC_FORMAT)
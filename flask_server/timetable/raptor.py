@@ -0,0 +1,255 @@
+"""
+round based public transit routing (RAPTOR) over an imported timetable.
+
+every round extends the journeys of the previous round by one more trip:
+the patterns through stops improved in the last round are scanned once,
+boarding the earliest trip that can be caught, followed by the transfers
+from the stops those trips improved. round k therefore holds the earliest
+arrivals using k trips, giving journeys trading transfers against arrival.
+
+trips are assumed not to overtake each other within a pattern, and only
+trips of the service day of the query are used
+"""
+from typing import Iterable, List, Optional
+
+from flask_server.timetable.store import Timetable
+
+UNREACHED = 1 << 30
+
+
+class Leg:
+    """
+    leg of a planned journey, either riding a trip or walking between stops
+        :var trip: int -> trip row, None when walking
+        :var from_stop / to_stop: int -> stop rows
+        :var departs / arrives: int -> seconds since midnight of the service day
+        :var positions: range -> positions in the `stop_times` columns ridden, empty when walking
+    """
+    __slots__ = ('trip', 'from_stop', 'to_stop', 'departs', 'arrives', 'positions')
+
+    def __init__(self, trip, from_stop, to_stop, departs, arrives, positions=range(0)):
+        self.trip = trip
+        self.from_stop = from_stop
+        self.to_stop = to_stop
+        self.departs = departs
+        self.arrives = arrives
+        self.positions = positions
+
+
+class Raptor:
+    """
+    journey planner over a timetable imported with `gtfs_import`
+        :var timetable: Timetable -> memory mapped timetable
+        :var max_rounds: int -> maximum number of trips in a journey
+        :methods
+            route
+            plan
+    """
+    def __init__(self, timetable: Timetable, max_rounds=5):
+        self.timetable = timetable
+        self.max_rounds = max_rounds
+        self._runs = {}  # (service, date): bool
+        # columns read by every scan, looked up once
+        self._services = timetable.column('trips.service')
+        self._trips_start = timetable.column('patterns.trips_start')
+        self._pattern_trips = timetable.column('pattern_trips.trip')
+        self._trip_starts = timetable.column('trips.stop_times_start')
+        self._departures = timetable.column('stop_times.departure')
+
+    def _running(self, trip: int, date: int) -> bool:
+        service = self._services[trip]
+        runs = self._runs.get((service, date))
+        if runs is None:
+            runs = self._runs[service, date] = self.timetable.service_runs(service, date)
+        return runs
+
+    def _earliest_trip(self, pattern: int, index: int, after: int, date: int) -> Optional[int]:
+        """
+        earliest trip of a pattern running on `date` which departs the stop at `index`
+        of the pattern at or after `after`
+        """
+        trips_start, pattern_trips = self._trips_start, self._pattern_trips
+        trip_starts, departures = self._trip_starts, self._departures
+        low, high = trips_start[pattern], trips_start[pattern + 1]
+        while low < high:
+            middle = (low + high) // 2
+            if departures[trip_starts[pattern_trips[middle]] + index] < after:
+                low = middle + 1
+            else:
+                high = middle
+        for position in range(low, trips_start[pattern + 1]):
+            if self._running(pattern_trips[position], date):
+                return pattern_trips[position]
+        return None
+
+    def route(
+            self, sources: Iterable[int], targets: Iterable[int], departs: int, date: int
+    ) -> List[List[Leg]]:
+        """
+        journeys from any of `sources` to any of `targets`, leaving from `departs`
+        seconds after midnight on `date` (yyyymmdd int)
+        :return: list -> one journey (list of legs) for every number of trips that arrives
+        earlier than with fewer trips, in increasing number of trips
+        """
+        timetable = self.timetable
+        pattern_stops = timetable.column('pattern_stops.stop')
+        stops_start = timetable.column('patterns.stops_start')
+        stop_patterns_start = timetable.column('stops.patterns_start')
+        stop_patterns = timetable.column('stop_patterns.pattern')
+        stop_pattern_index = timetable.column('stop_patterns.index')
+        transfers_start = timetable.column('stops.transfers_start')
+        transfers_to = timetable.column('transfers.to')
+        transfer_seconds = timetable.column('transfers.seconds')
+        trip_starts = timetable.column('trips.stop_times_start')
+        arrivals = timetable.column('stop_times.arrival')
+        departures = timetable.column('stop_times.departure')
+
+        targets = set(targets)
+        best = {stop: departs for stop in sources}  # earliest arrival at each stop so far
+        reached = dict(best)  # earliest arrival using the trips of earlier rounds
+        # stops improved by each round, labelled
+        # (arrival, trip, boarded stop, boarded index, alighted index) when riding a trip
+        # or (arrival, None, stop walked from, None, None) when walking, and the labels of
+        # the stops reached by a trip in each round, which walks are followed back to
+        labels = [{stop: (departs, None, None, None, None) for stop in best}]
+        rides = [{}]
+        marked = set(best)
+        bound = departs if targets & marked else UNREACHED
+        for _ in range(self.max_rounds):
+            # patterns through the marked stops, scanned from the first marked stop
+            queue = {}
+            for stop in marked:
+                for position in range(stop_patterns_start[stop], stop_patterns_start[stop + 1]):
+                    pattern, index = stop_patterns[position], stop_pattern_index[position]
+                    if queue.get(pattern, UNREACHED) > index:
+                        queue[pattern] = index
+            improved = {}
+            marked = set()
+            for pattern, first in queue.items():
+                trip = boarded = boarded_index = trip_start = None
+                start, end = stops_start[pattern], stops_start[pattern + 1]
+                for index in range(first, end - start):
+                    stop = pattern_stops[start + index]
+                    if trip is not None:
+                        arrives = arrivals[trip_start + index]
+                        if arrives < best.get(stop, UNREACHED) and arrives < bound:
+                            best[stop] = arrives
+                            improved[stop] = (arrives, trip, boarded, boarded_index, index)
+                            marked.add(stop)
+                            if stop in targets:
+                                bound = arrives
+                    previous = reached.get(stop)
+                    if previous is not None and (
+                            trip is None or previous <= departures[trip_start + index]
+                    ):
+                        earlier = self._earliest_trip(pattern, index, previous, date)
+                        if earlier is not None and earlier != trip:
+                            trip, trip_start = earlier, trip_starts[earlier]
+                            boarded, boarded_index = stop, index
+            # transfers from the stops reached by a trip this round, kept apart from the
+            # walks so that a walk to a stop does not replace the ride another walk leaves from
+            ridden = dict(improved)
+            for stop, ride in ridden.items():
+                for position in range(transfers_start[stop], transfers_start[stop + 1]):
+                    to_stop = transfers_to[position]
+                    arrives = ride[0] + transfer_seconds[position]
+                    if arrives < best.get(to_stop, UNREACHED) and arrives < bound:
+                        best[to_stop] = arrives
+                        improved[to_stop] = (arrives, None, stop, None, None)
+                        marked.add(to_stop)
+                        if to_stop in targets:
+                            bound = arrives
+            if not marked:
+                break
+            labels.append(improved)
+            rides.append(ridden)
+            for stop, label in improved.items():
+                reached[stop] = label[0]
+
+        # targets are only improved on arriving earlier than before (`bound`),
+        # so every round reaching one has a faster journey using one more trip
+        journeys = []
+        for rounds in range(1, len(labels)):
+            arrived = [stop for stop in targets if stop in labels[rounds]]
+            if arrived:
+                target = min(arrived, key=lambda stop: labels[rounds][stop][0])
+                journeys.append(self._journey(labels, rides, rounds, target))
+        return journeys
+
+    def _journey(self, labels: list, rides: list, rounds: int, stop: int) -> List[Leg]:
+        """
+        follow the labels back from `stop` at round `rounds` to a source
+        """
+        trip_starts = self.timetable.column('trips.stop_times_start')
+        departures = self.timetable.column('stop_times.departure')
+        legs = []
+        while rounds > 0:
+            arrives, trip, from_stop, from_index, index = labels[rounds][stop]
+            if trip is None:  # walked from a stop reached by a trip this round
+                walk_arrives = arrives
+                arrives, trip, walk_from, from_index, index = rides[rounds][from_stop]
+                legs.append(Leg(None, from_stop, stop, arrives, walk_arrives))
+                stop, from_stop = from_stop, walk_from
+            start = trip_starts[trip]
+            legs.append(Leg(
+                trip, from_stop, stop, departures[start + from_index], arrives,
+                range(start + from_index, start + index + 1)
+            ))
+            stop = from_stop
+            # the stop was boarded from the last earlier round that improved it
+            rounds -= 1
+            while rounds > 0 and stop not in labels[rounds]:
+                rounds -= 1
+        legs.reverse()
+        return legs
+
+    def plan(
+            self, sources: Iterable[int], targets: Iterable[int], departs: int, date: int,
+            count=5, arrive_by=False, window=3 * 60 * 60
+    ) -> List[List[Leg]]:
+        """
+        up to `count` journeys ordered by departure. successive departures are
+        found by routing again just after the first trip of the last journey found
+        :param arrive_by: bool -> the `count` latest departing journeys arriving by `departs`,
+        searched for backward from it in growing spans, up to `window` seconds before it
+        """
+        sources, targets = list(sources), list(targets)
+        if not arrive_by:
+            found = {}
+            for _ in range(count):
+                departs = self._step(sources, targets, departs, date, found)
+                if departs is None:
+                    break
+            return sorted(found.values(), key=_departure_order)[:count]
+
+        deadline, earliest = departs, departs - window
+        found = {}
+        upper, span = deadline + 1, 30 * 60
+        while upper > earliest and len(found) < count:
+            # every journey departing within [lower, upper), routing forward from lower
+            lower = max(earliest, upper - span)
+            departs = lower
+            while departs is not None and departs < upper:
+                departs = self._step(sources, targets, departs, date, found, deadline)
+            upper, span = lower, span * 2
+        return sorted(found.values(), key=_departure_order)[-count:]
+
+    def _step(
+            self, sources: list, targets: list, departs: int, date: int, found: dict,
+            deadline: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        add the journeys leaving from `departs` (arriving by `deadline` if given) to `found`
+        :return: the departure time of the next search, None when there are no journeys
+        """
+        journeys = self.route(sources, targets, departs, date)
+        if not journeys:
+            return None
+        for journey in journeys:
+            if deadline is None or journey[-1].arrives <= deadline:
+                found.setdefault(tuple((leg.trip, leg.departs) for leg in journey), journey)
+        return min(journey[0].departs for journey in journeys) + 1
+
+
+def _departure_order(journey: List[Leg]) -> tuple:
+    return journey[0].departs, journey[-1].arrives
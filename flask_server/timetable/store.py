@@ -0,0 +1,182 @@
+"""
+read only access to an imported timetable. every column is a flat binary
+array memory mapped from disk, so workers share the same pages through the
+os page cache and opening a timetable does not read the data up front.
+
+layout of a timetable directory (see `gtfs_import`):
+    - meta.json: format version, byte order, row counts and the type code of each column
+    - <table>.<column>.bin: array of the column's type code
+    - strings.blob / strings.offsets: utf-8 text of every string column,
+    string columns hold indices into it
+"""
+import json
+import mmap
+import sys
+import threading
+from array import array
+from datetime import date as calendar_date
+from pathlib import Path
+from typing import List, Optional
+
+FORMAT_VERSION = 2
+META_FILE = 'meta.json'
+
+
+def column_file(path: Path, name: str) -> Path:
+    """
+    file of column `name` ("<table>.<column>") inside a timetable directory
+    """
+    return path / f'{name}.bin'
+
+
+class Timetable:
+    """
+    memory mapped timetable imported from a GTFS feed
+        :var path: timetable directory
+        :var meta: dict -> contents of meta.json
+        :methods
+            column
+            string
+            stop_index
+            children
+            departures_at
+            trip_stop_times
+            service_runs
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / META_FILE, 'r') as meta:
+            self.meta = json.load(meta)
+        if self.meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f'unsupported timetable format in {self.path}')
+        if self.meta.get('byteorder') != sys.byteorder:
+            raise ValueError(f'timetable {self.path} was imported on a {self.meta["byteorder"]}'
+                             f' endian machine')
+        self.counts = self.meta['counts']
+        self._maps = []
+        self._columns = {}
+        self._lock = threading.Lock()
+        self._stop_ids = None
+        self._children = None
+        self._exceptions = None
+        self._blob = self._map(self.path / 'strings.blob')
+        self._offsets = self._column_view('strings.offsets', 'I')
+
+    def _map(self, path: Path):
+        """
+        memory map a file read only, empty files are returned as empty bytes
+        """
+        with open(path, 'rb') as column:
+            if not path.stat().st_size:
+                return b''
+            mapped = mmap.mmap(column.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return mapped
+
+    def _column_view(self, name: str, typecode: str):
+        data = self._map(column_file(self.path, name))
+        return memoryview(data).cast(typecode) if data else array(typecode)
+
+    def column(self, name: str):
+        """
+        returns column `name` eg. "stops.lat" as a read only sequence
+        """
+        view = self._columns.get(name)
+        if view is None:
+            view = self._columns[name] = self._column_view(name, self.meta['columns'][name])
+        return view
+
+    def string(self, index: int) -> str:
+        """
+        returns the string at `index` of the string table
+        """
+        return bytes(self._blob[self._offsets[index]:self._offsets[index + 1]]).decode('utf-8')
+
+    def stop_index(self, stop_id: str) -> Optional[int]:
+        """
+        row of the stop with GTFS id `stop_id`, or None
+        """
+        if self._stop_ids is None:
+            with self._lock:
+                if self._stop_ids is None:
+                    ids = self.column('stops.id')
+                    self._stop_ids = {
+                        self.string(ids[stop]): stop for stop in range(self.counts['stops'])
+                    }
+        return self._stop_ids.get(stop_id)
+
+    def children(self, stop: int) -> List[int]:
+        """
+        rows of the stops whose parent station is `stop` (eg. platforms)
+        """
+        if self._children is None:
+            with self._lock:
+                if self._children is None:
+                    children = {}
+                    for child, parent in enumerate(self.column('stops.parent')):
+                        if parent >= 0:
+                            children.setdefault(parent, []).append(child)
+                    self._children = children
+        return self._children.get(stop, [])
+
+    def departures_at(self, stop: int, after=0) -> range:
+        """
+        positions in `stop_times_by_stop.position` of the stop times at `stop`,
+        ordered by departure and starting from the first departing at or after `after`
+        (seconds since midnight of the service day)
+        """
+        starts = self.column('stops.departures_start')
+        start, end = starts[stop], starts[stop + 1]
+        positions = self.column('stop_times_by_stop.position')
+        departures = self.column('stop_times.departure')
+        # binary search the departures of the stop
+        low, high = start, end
+        while low < high:
+            middle = (low + high) // 2
+            if departures[positions[middle]] < after:
+                low = middle + 1
+            else:
+                high = middle
+        return range(low, end)
+
+    def trip_stop_times(self, trip: int) -> range:
+        """
+        positions in the `stop_times` columns of a trip's stops, in stop sequence order
+        """
+        starts = self.column('trips.stop_times_start')
+        return range(starts[trip], starts[trip + 1])
+
+    def service_runs(self, service: int, date: int) -> bool:
+        """
+        whether a service runs on `date` (yyyymmdd int), applying calendar_dates exceptions
+        """
+        if self._exceptions is None:
+            with self._lock:
+                if self._exceptions is None:
+                    self._exceptions = dict(zip(
+                        zip(self.column('calendar_dates.service'),
+                            self.column('calendar_dates.date')),
+                        self.column('calendar_dates.exception')
+                    ))
+        exception = self._exceptions.get((service, date))
+        if exception is not None:
+            return exception == 1
+        start, end = self.column('calendar.start')[service], self.column('calendar.end')[service]
+        if not start <= date <= end:
+            return False
+        # weekday bit, monday is bit 0
+        weekday = calendar_date(date // 10000, date // 100 % 100, date % 100).weekday()
+        return bool(self.column('calendar.days')[service] >> weekday & 1)
+
+    def close(self):
+        """
+        release the memory maps
+        """
+        self._columns.clear()
+        self._offsets = self._blob = None
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:  # still referenced by a view, released on collection
+                pass
+        self._maps = []
@@ -0,0 +1,35 @@
+"""# gunicorn settings
+`gunicorn -c gunicorn.conf.py flask_server.start:APP`
+with `GUNICORN_PRELOAD=1` (default) the app is created once in the master,
+warmed up (swagger_client imported, templates compiled) and its objects frozen
+out of the garbage collector, so the forked workers share those pages and
+answer their first request warm. the app's connections, pools and threads are
+created per worker process, after the fork
+"""
+import gc
+from os import environ
+
+bind = environ.get('GUNICORN_BIND', '0.0.0.0:' + environ.get('PORT', '8000'))
+workers = int(environ.get('WEB_CONCURRENCY', 2))
+preload_app = environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def on_starting(_):
+    """
+    drop the metrics snapshots of the previous run, summed into the counters otherwise
+    """
+    # pylint: disable=import-outside-toplevel
+    from flask_server.services.metrics import clear_directory
+    clear_directory(environ.get('METRICS_DIR', 'metrics'))
+
+
+def when_ready(server):
+    """
+    warm up the preloaded app before the workers are forked
+    """
+    if server.cfg.preload_app:
+        from flask_server import warm_up  # pylint: disable=import-outside-toplevel
+        warm_up(server.app.wsgi())
+        # objects of the master are never freed, don't let the workers' collections
+        # touch (and so copy) their pages
+        gc.freeze()
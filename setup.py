@@ -45,8 +45,12 @@ setup(
     author_email=EMAIL,
     url=URL,
     keywords=KEYWORDS,
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     include_package_data=True,
     long_description=LONG_DESC,
-    install_requires=INSTALL_REQUIRES
+    install_requires=INSTALL_REQUIRES,
+    extras_require={
+        'fast-json': ['orjson'],
+        'async': ['quart', 'aiohttp', 'hypercorn'],
+    }
 )